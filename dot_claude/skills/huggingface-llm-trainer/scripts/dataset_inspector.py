@@ -19,47 +19,828 @@ Usage with HF Jobs:
 """
 
 import argparse
+import atexit
+import bisect
+import gzip
+import hashlib
+import http.client
+import importlib.util
+import io
+import math
+import os
+import random
 import sys
+import tempfile
 import json
+import threading
+import time
 import urllib.request
 import urllib.parse
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Tuple
+
+try:  # optional: lets the server send brotli-compressed responses
+    import brotli
+except ImportError:
+    brotli = None
+
+try:  # optional: only needed for --profile
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pc = pq = None
+
+DATASETS_SERVER = os.getenv("HF_DATASETS_SERVER", "https://datasets-server.huggingface.co").rstrip("/")
+DEFAULT_CACHE_TTL = 86400
+DEFAULT_CACHE_MAX_MB = 256
+CACHE_DIR = os.getenv("HF_INSPECTOR_CACHE") or os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "hf_dataset_inspector"
+)
+DEFAULT_TIMEOUT = 10
+MAX_ROWS_PER_REQUEST = 100  # Datasets Server /rows limit
+MAX_RETRIES = 3
+MAX_REDIRECTS = 5
+RETRY_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+ACCEPT_ENCODING = "gzip, br" if brotli is not None else "gzip"
+PROFILE_BATCH_ROWS = 65_536
+TOKENIZE_BATCH = 256
+DEFAULT_MAX_LENGTHS = [512, 1024, 2048, 4096, 8192]
+MESSAGE_TEXT_FIELDS = ("content", "value", "text")
+
+_thread_local = threading.local()
 
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Inspect dataset format for TRL training")
-    parser.add_argument("--dataset", type=str, required=True, help="Dataset name")
+    parser.add_argument("--dataset", type=str, action="append",
+                        help="Dataset name (repeat to inspect several datasets concurrently as JSON lines)")
+    parser.add_argument("--datasets-file", type=str, default=None,
+                        help="File with one dataset id per line ('-' for stdin); implies batch JSON-lines output")
     parser.add_argument("--split", type=str, default="train", help="Dataset split (default: train)")
     parser.add_argument("--config", type=str, default="default", help="Dataset config name (default: default)")
     parser.add_argument("--preview", type=int, default=150, help="Max chars per field preview")
     parser.add_argument("--samples", type=int, default=5, help="Number of samples to fetch (default: 5)")
+    parser.add_argument("--sampling", choices=["head", "stratified"], default="head",
+                        help="head: first N rows; stratified: random windows spread across the split (default: head)")
+    parser.add_argument("--windows", type=int, default=4, help="Number of windows for --sampling stratified (default: 4)")
+    parser.add_argument("--max-bytes", type=int, default=8_000_000,
+                        help="Total response-size budget for --sampling stratified (default: 8000000)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for --sampling stratified (default: derived from dataset/config/split/revision, "
+                             "so repeat runs replay the same cached windows)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile every row of the split from its Parquet export (requires pyarrow)")
+    parser.add_argument("--parquet", action="append", default=None, metavar="PATH_OR_URL",
+                        help="Parquet file(s) to profile instead of the Datasets Server export (repeatable)")
+    parser.add_argument("--tokenizer", type=str, default=None,
+                        help="Estimate token lengths of the fetched samples with this tokenizer (requires transformers)")
+    parser.add_argument("--max-lengths", type=int, nargs="+", default=DEFAULT_MAX_LENGTHS,
+                        help="Sequence limits to report truncation and packing for (default: 512 1024 2048 4096 8192)")
+    parser.add_argument("--batch-size", type=int, default=8,
+                        help="Per-device batch size for the padding-efficiency estimate (default: 8)")
+    parser.add_argument("--jobs", type=int, default=8,
+                        help="Worker threads for batch mode, --profile and --tokenizer (default: 8)")
     parser.add_argument("--json-output", action="store_true", help="Output as JSON")
+    parser.add_argument("--revision", type=str, default="main",
+                        help="Dataset revision cached responses are keyed by (Datasets Server serves the latest; default: main)")
+    parser.add_argument("--cache-ttl", type=float, default=DEFAULT_CACHE_TTL,
+                        help=f"Seconds before cached API responses are refetched (default: {DEFAULT_CACHE_TTL})")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_CACHE_MAX_MB,
+                        help=f"Size bound of the response cache in MB (default: {DEFAULT_CACHE_MAX_MB})")
+    cache_mode = parser.add_mutually_exclusive_group()
+    cache_mode.add_argument("--refresh", action="store_true", help="Ignore cached responses and refetch")
+    cache_mode.add_argument("--offline", action="store_true", help="Replay cached responses only; never touch the network")
+    cache_mode.add_argument("--no-cache", action="store_true", help="Neither read nor write the response cache")
     return parser.parse_args()
 
 
-def api_request(url: str) -> Dict:
-    """Make API request to Datasets Server"""
+def auth_headers() -> Dict[str, str]:
+    """Bearer auth from HF_TOKEN (needed for gated/private datasets)"""
+    token = os.getenv("HF_TOKEN")
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
+
+def _get_connection(scheme: str, netloc: str) -> http.client.HTTPConnection:
+    """Return this thread's keep-alive connection to netloc, opening it on first use"""
+    connections = getattr(_thread_local, "connections", None)
+    if connections is None:
+        connections = _thread_local.connections = {}
+    conn = connections.get((scheme, netloc))
+    if conn is None:
+        conn_cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        proxy = urllib.request.getproxies().get(scheme)
+        if proxy and not urllib.request.proxy_bypass(netloc):
+            conn = conn_cls(urllib.parse.urlsplit(proxy).netloc or proxy, timeout=DEFAULT_TIMEOUT)
+            conn.set_tunnel(netloc)
+        else:
+            conn = conn_cls(netloc, timeout=DEFAULT_TIMEOUT)
+        connections[(scheme, netloc)] = conn
+    return conn
+
+
+def _drop_connection(scheme: str, netloc: str) -> None:
+    conn = getattr(_thread_local, "connections", {}).pop((scheme, netloc), None)
+    if conn is not None:
+        conn.close()
+
+
+def _decode_body(body: bytes, content_encoding: str | None) -> bytes:
+    encoding = (content_encoding or "").strip().lower()
+    if encoding == "gzip":
+        return gzip.decompress(body)
+    if encoding == "br" and brotli is not None:
+        return brotli.decompress(body)
+    return body
+
+
+def _retry_delay(attempt: int, retry_after: str | None = None) -> float:
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), MAX_BACKOFF)
+    return min(RETRY_BACKOFF * (2 ** attempt), MAX_BACKOFF) * (0.5 + random.random() / 2)
+
+
+def http_get(url: str, headers: Dict[str, str] = None, stats: Dict[str, int] = None) -> Tuple[int, http.client.HTTPResponse, bytes, str]:
+    """GET over a pooled keep-alive connection, following redirects and retrying 429/5xx.
+
+    Returns (status, response, decoded body, final url).
+    """
+    headers = {"Accept-Encoding": ACCEPT_ENCODING, **auth_headers(), **(headers or {})}
+    attempt = redirects = 0
+    while True:
+        parts = urllib.parse.urlsplit(url)
+        target = parts.path + (f"?{parts.query}" if parts.query else "")
+        try:
+            conn = _get_connection(parts.scheme, parts.netloc)
+            conn.request("GET", target, headers=headers)
+            response = conn.getresponse()
+            body = _decode_body(response.read(), response.getheader("Content-Encoding"))
+        except (http.client.HTTPException, OSError, EOFError) as e:
+            _drop_connection(parts.scheme, parts.netloc)
+            if attempt < MAX_RETRIES:
+                time.sleep(_retry_delay(attempt))
+                attempt += 1
+                continue
+            raise Exception(f"API request failed: {str(e)}")
+        if response.will_close:
+            _drop_connection(parts.scheme, parts.netloc)
+        if stats is not None:
+            stats["bytes"] = stats.get("bytes", 0) + len(body)
+
+        location = response.getheader("Location")
+        if response.status in REDIRECT_STATUSES and location and redirects < MAX_REDIRECTS:
+            url = urllib.parse.urljoin(url, location)
+            if urllib.parse.urlsplit(url).netloc != parts.netloc:
+                headers.pop("Authorization", None)  # don't leak the token to CDNs
+            redirects += 1
+            continue
+        if response.status in RETRY_STATUSES and attempt < MAX_RETRIES:
+            time.sleep(_retry_delay(attempt, response.getheader("Retry-After")))
+            attempt += 1
+            continue
+        return response.status, response, body, url
+
+
+def api_request(url: str, stats: Dict[str, int] = None) -> Dict:
+    """Make API request to Datasets Server (pooled keep-alive connection, retries on 429/5xx)"""
+    status, response, body, _ = http_get(url, stats=stats)
+    if status == 404:
+        return None
+    if status >= 400:
+        raise Exception(f"API request failed: {status} {response.reason}")
     try:
-        with urllib.request.urlopen(url, timeout=10) as response:
-            return json.loads(response.read().decode())
-    except urllib.error.HTTPError as e:
-        if e.code == 404:
+        return json.loads(body.decode())
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise Exception(f"API request failed: invalid JSON ({e})")
+
+
+class ResponseCache:
+    """Content-addressed on-disk cache of Datasets Server responses.
+
+    Entries are keyed by a hash of (endpoint, dataset, config, split, offset, length,
+    revision), expire after `ttl` seconds unless `offline`, and are evicted least
+    recently used first once the directory grows past `max_bytes`.
+    """
+
+    def __init__(self, directory: str, ttl: float = DEFAULT_CACHE_TTL, max_bytes: int = DEFAULT_CACHE_MAX_MB << 20,
+                 offline: bool = False, refresh: bool = False):
+        self.directory, self.ttl, self.max_bytes = directory, ttl, max_bytes
+        self.offline, self.refresh = offline, refresh
+
+    @staticmethod
+    def digest(key: Dict[str, Any]) -> str:
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], f"{digest}.json")
+
+    def get(self, digest: str) -> Dict[str, Any] | None:
+        if self.refresh:
             return None
-        raise Exception(f"API request failed: {e.code} {e.reason}")
-    except Exception as e:
-        raise Exception(f"API request failed: {str(e)}")
+        path = self._path(digest)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not self.offline and time.time() - entry.get("fetched_at", 0) > self.ttl:
+            return None
+        try:
+            os.utime(path)  # mtime doubles as the LRU clock
+        except OSError:
+            pass
+        return entry
+
+    def put(self, digest: str, entry: Dict[str, Any]) -> None:
+        path = self._path(digest)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump({**entry, "fetched_at": time.time()}, f)
+            os.replace(tmp, path)
+        except OSError:
+            pass  # caching is best-effort
+
+    def evict(self) -> None:
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, os.path.join(root, name)))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
 
+response_cache: ResponseCache | None = None
 
-def get_splits(dataset: str) -> Dict:
+
+def configure_cache(args) -> None:
+    """Install the process-wide response cache from CLI flags; evicts on exit"""
+    global response_cache
+    if args.no_cache:
+        return
+    response_cache = ResponseCache(CACHE_DIR, ttl=args.cache_ttl, max_bytes=args.cache_max_mb << 20,
+                                   offline=args.offline, refresh=args.refresh)
+    atexit.register(response_cache.evict)
+
+
+def cached_request(url: str, key: Dict[str, Any], stats: Dict[str, int] = None) -> Dict:
+    """api_request through the response cache (if configured); never caches 404s"""
+    if response_cache is None:
+        return api_request(url, stats)
+    digest = ResponseCache.digest({"server": DATASETS_SERVER, **key})
+    entry = response_cache.get(digest)
+    if entry is not None:
+        if stats is not None:
+            stats["bytes"] = stats.get("bytes", 0) + entry.get("bytes", 0)
+        return entry["data"]
+    if response_cache.offline:
+        raise Exception(f"API request failed: {url} is not cached (offline mode)")
+    fetched: Dict[str, int] = {}
+    data = api_request(url, fetched)
+    if stats is not None:
+        stats["bytes"] = stats.get("bytes", 0) + fetched.get("bytes", 0)
+    if data is not None:
+        response_cache.put(digest, {"key": key, "bytes": fetched.get("bytes", 0), "data": data})
+    return data
+
+
+def get_splits(dataset: str, revision: str = "main") -> Dict:
     """Get available splits for dataset"""
-    url = f"https://datasets-server.huggingface.co/splits?dataset={urllib.parse.quote(dataset)}"
-    return api_request(url)
+    url = f"{DATASETS_SERVER}/splits?dataset={urllib.parse.quote(dataset)}"
+    return cached_request(url, {"endpoint": "splits", "dataset": dataset, "revision": revision})
 
 
-def get_rows(dataset: str, config: str, split: str, offset: int = 0, length: int = 5) -> Dict:
+def get_rows(dataset: str, config: str, split: str, offset: int = 0, length: int = 5, stats: Dict[str, int] = None,
+             revision: str = "main") -> Dict:
     """Get rows from dataset"""
-    url = f"https://datasets-server.huggingface.co/rows?dataset={urllib.parse.quote(dataset)}&config={config}&split={split}&offset={offset}&length={length}"
-    return api_request(url)
+    url = f"{DATASETS_SERVER}/rows?dataset={urllib.parse.quote(dataset)}&config={config}&split={split}&offset={offset}&length={length}"
+    key = {"endpoint": "rows", "dataset": dataset, "config": config, "split": split,
+           "offset": offset, "length": length, "revision": revision}
+    return cached_request(url, key, stats)
+
+
+def plan_windows(num_examples: int, samples: int, windows: int, rng: random.Random) -> List[Tuple[int, int]]:
+    """Split [0, num_examples) into equal strata and pick one random window per stratum.
+
+    Window lengths add up to exactly `samples` (the first `samples % windows` windows get one extra row).
+    """
+    windows = max(min(windows, samples), -(-samples // MAX_ROWS_PER_REQUEST), 1)
+    base, extra = divmod(samples, windows)
+    stratum = num_examples / windows
+    plan = []
+    for i in range(windows):
+        length = base + (i < extra)
+        start = int(i * stratum)
+        end = max(start, min(num_examples, int((i + 1) * stratum)) - length)
+        plan.append((rng.randint(start, end), min(length, num_examples - start)))
+    return plan
+
+
+def get_rows_stratified(dataset: str, config: str, split: str, num_examples: int, samples: int,
+                        windows: int = 4, max_bytes: int = 8_000_000, seed: int = None, revision: str = "main") -> Dict:
+    """Fetch several random windows spread across the split concurrently and merge them.
+
+    The first window is fetched alone to measure bytes per row; only as many further
+    windows as fit in `max_bytes` are then requested in parallel. Without a `seed` the windows
+    are derived from the dataset coordinates, so repeat inspections hit the response cache.
+    """
+    if seed is None:
+        seed = int(hashlib.sha256(f"{dataset}/{config}/{split}/{revision}".encode()).hexdigest()[:16], 16)
+    plan = plan_windows(num_examples, samples, windows, random.Random(seed))
+    stats: Dict[str, int] = {}
+    first = get_rows(dataset, config, split, offset=plan[0][0], length=plan[0][1], stats=stats, revision=revision)
+    if not first or "rows" not in first:
+        return first
+
+    rows_per_byte = len(first["rows"]) / max(stats["bytes"], 1)
+    budget_rows = int((max_bytes - stats["bytes"]) * rows_per_byte)
+    rest = []
+    for offset, length in plan[1:]:
+        if budget_rows < length:
+            break
+        budget_rows -= length
+        rest.append((offset, length))
+
+    fetched = [(plan[0], first)]
+    if rest:
+        # One stats dict per window: the byte counters are read-modify-write, not thread-safe
+        window_stats = [{} for _ in rest]
+        with ThreadPoolExecutor(max_workers=len(rest)) as pool:
+            futures = [
+                pool.submit(get_rows, dataset, config, split, offset, length, ws, revision)
+                for (offset, length), ws in zip(rest, window_stats)
+            ]
+            fetched.extend((window, future.result()) for window, future in zip(rest, futures))
+        stats["bytes"] += sum(ws.get("bytes", 0) for ws in window_stats)
+
+    merged: Dict[int, Dict] = {}
+    for _, data in fetched:
+        for row in (data or {}).get("rows", []):
+            merged.setdefault(row.get("row_idx", len(merged)), row)
+    return {
+        "features": first.get("features", []),
+        "rows": [merged[idx] for idx in sorted(merged)],
+        "windows": [list(window) for window, data in fetched if data and data.get("rows")],
+        "bytes": stats["bytes"],
+    }
+
+
+def _deep_sizeof(obj: Any, seen: set = None) -> int:
+    """Approximate retained size of a JSON-like value (container plus contents)"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(_deep_sizeof(v, seen) for v in obj)
+    return size
+
+
+class RowBatch:
+    """Fetched rows converted once into per-column lists.
+
+    Checkers read whole columns instead of re-walking the `[{"row": {...}}]` dicts.
+    `truncated[name]` holds the row positions whose cell Datasets Server truncated,
+    and `nbytes` the per-column memory footprint measured when the batch was built.
+    """
+
+    def __init__(self, rows: List[Dict], features: List[Dict] = None):
+        self.num_rows = len(rows)
+        self.names = list(dict.fromkeys(name for entry in rows for name in entry["row"]))
+        self.columns = {name: [entry["row"].get(name) for entry in rows] for name in self.names}
+        self.truncated: Dict[str, set] = {name: set() for name in self.names}
+        for i, entry in enumerate(rows):
+            for name in entry.get("truncated_cells") or ():
+                if name in self.truncated:
+                    self.truncated[name].add(i)
+        self.features = features or []
+        self.nbytes = {name: _deep_sizeof(values) for name, values in self.columns.items()}
+
+    def memory_report(self) -> Dict[str, Any]:
+        return {"rows": self.num_rows, "total_bytes": sum(self.nbytes.values()), "columns": dict(self.nbytes)}
+
+
+def format_bytes(n: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+def get_parquet_files(dataset: str, config: str, split: str, revision: str = "main") -> List[Dict]:
+    """Get the Parquet export files for one config/split"""
+    url = f"{DATASETS_SERVER}/parquet?dataset={urllib.parse.quote(dataset)}&config={config}&split={split}"
+    data = cached_request(url, {"endpoint": "parquet", "dataset": dataset, "config": config, "split": split, "revision": revision})
+    if not data:
+        return []
+    return [f for f in data.get("parquet_files", []) if f.get("config") == config and f.get("split") == split]
+
+
+class RemoteFile(io.RawIOBase):
+    """Seekable read-only view of a URL backed by HTTP Range requests.
+
+    Lets pyarrow read only the footer and the projected column chunks of a remote
+    Parquet file. Pass `size` to reuse an already resolved URL without a probe.
+    """
+
+    def __init__(self, url: str, size: int = None):
+        super().__init__()
+        self.url, self.size, self.pos = url, size, 0
+        if size is None:
+            status, response, body, self.url = http_get(url, {"Range": "bytes=0-0", "Accept-Encoding": "identity"})
+            content_range = response.getheader("Content-Range") or ""
+            if status == 206 and "/" in content_range:
+                self.size = int(content_range.rsplit("/", 1)[1])
+            elif status == 200:
+                self.size = len(body)
+            else:
+                raise Exception(f"Could not open {url}: {status} {response.reason}")
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.pos, io.SEEK_END: self.size}[whence]
+        self.pos = max(0, base + offset)
+        return self.pos
+
+    def readinto(self, buffer) -> int:
+        if self.pos >= self.size or not len(buffer):
+            return 0
+        end = min(self.pos + len(buffer), self.size) - 1
+        status, response, body, _ = http_get(self.url, {"Range": f"bytes={self.pos}-{end}", "Accept-Encoding": "identity"})
+        if status == 200:  # server ignored the range
+            body = body[self.pos:end + 1]
+        elif status != 206:
+            raise Exception(f"Range request failed: {status} {response.reason}")
+        buffer[:len(body)] = body
+        self.pos += len(body)
+        return len(body)
+
+
+def open_parquet_source(source: str, size: int = None):
+    """Local path as-is (pyarrow reads it natively), URLs through RemoteFile"""
+    if source.startswith(("http://", "https://")):
+        return RemoteFile(source, size)
+    return source
+
+
+def _contains_binary(dtype) -> bool:
+    if pa.types.is_binary(dtype) or pa.types.is_large_binary(dtype) or pa.types.is_fixed_size_binary(dtype):
+        return True
+    return any(_contains_binary(dtype.field(i).type) for i in range(dtype.num_fields))
+
+
+def _message_text_field(dtype) -> str | None:
+    """Text field of a messages-style list<struct> column, e.g. `content` or ShareGPT `value`"""
+    if not (pa.types.is_list(dtype) or pa.types.is_large_list(dtype)) or not pa.types.is_struct(dtype.value_type):
+        return None
+    names = [dtype.value_type.field(i).name for i in range(dtype.value_type.num_fields)]
+    return next((name for name in MESSAGE_TEXT_FIELDS if name in names), None)
+
+
+def column_kind(dtype) -> str:
+    if pa.types.is_string(dtype) or pa.types.is_large_string(dtype):
+        return "string"
+    if _message_text_field(dtype):
+        return "messages"
+    if pa.types.is_list(dtype) or pa.types.is_large_list(dtype):
+        return "list"
+    return "other"
+
+
+def text_lengths(arr):
+    """Per-row character length of a string column, or summed message text of a messages column"""
+    kind = column_kind(arr.type)
+    if kind == "string":
+        return pc.cast(pc.utf8_length(arr), pa.int64())
+    if kind != "messages":
+        return None
+    # prefix-sum the message lengths and difference them at the list offsets
+    lengths = pc.fill_null(pc.utf8_length(pc.struct_field(arr.values, _message_text_field(arr.type))), 0)
+    cumulative = pa.concat_arrays([pa.array([0], pa.int64()), pc.cumulative_sum(pc.cast(lengths, pa.int64()))])
+    offsets = arr.offsets
+    per_row = pc.subtract(pc.take(cumulative, offsets.slice(1)), pc.take(cumulative, offsets.slice(0, len(arr))))
+    return pc.if_else(arr.is_null(), pa.scalar(None, pa.int64()), per_row)
+
+
+def length_stats(lengths) -> Dict[str, Any]:
+    """Mergeable count/sum/min/max plus a power-of-two histogram (bucket b holds 2**(b-1)..2**b-1)"""
+    lengths = lengths.drop_null()
+    if not len(lengths):
+        return {"count": 0, "sum": 0, "min": None, "max": None, "hist": {}}
+    buckets = pc.add(pc.floor(pc.log2(pc.max_element_wise(pc.cast(lengths, pa.float64()), 0.5))), 1)
+    counts = pc.value_counts(pc.cast(buckets, pa.int64()))
+    min_max = pc.min_max(lengths)
+    return {
+        "count": len(lengths),
+        "sum": pc.sum(lengths).as_py(),
+        "min": min_max["min"].as_py(),
+        "max": min_max["max"].as_py(),
+        "hist": dict(zip(counts.field("values").to_pylist(), counts.field("counts").to_pylist())),
+    }
+
+
+def ratio_stats(chosen, rejected) -> Dict[str, Any]:
+    """chosen/rejected length ratios bucketed as <1/4, 1/4-1/2, 1/2-1, 1-2, 2-4, >=4"""
+    valid = pc.and_(pc.is_valid(chosen), pc.greater(pc.fill_null(rejected, 0), 0))
+    chosen, rejected = pc.filter(chosen, valid), pc.filter(rejected, valid)
+    if not len(chosen):
+        return {"pairs": 0, "chosen_longer": 0, "ratio_sum": 0.0, "hist": {}}
+    ratios = pc.divide(pc.cast(chosen, pa.float64()), pc.cast(rejected, pa.float64()))
+    buckets = pc.min_element_wise(pc.max_element_wise(pc.floor(pc.log2(ratios)), -3), 2)
+    counts = pc.value_counts(pc.cast(buckets, pa.int64()))
+    return {
+        "pairs": len(ratios),
+        "chosen_longer": pc.sum(pc.greater(chosen, rejected)).as_py() or 0,
+        "ratio_sum": pc.sum(ratios).as_py(),
+        "hist": dict(zip(counts.field("values").to_pylist(), counts.field("counts").to_pylist())),
+    }
+
+
+def profile_batch(batch, dpo_pair: Tuple[str, str] = None) -> Dict[str, Any]:
+    profile = {"rows": batch.num_rows, "columns": {}}
+    for name, arr in zip(batch.schema.names, batch.columns):
+        kind = column_kind(arr.type)
+        col = {"kind": kind, "rows": len(arr), "nulls": arr.null_count}
+        lengths = text_lengths(arr)
+        if lengths is not None:
+            col["chars"] = length_stats(lengths)
+        if kind in ("messages", "list"):
+            col["turns" if kind == "messages" else "items"] = length_stats(pc.list_value_length(arr))
+        profile["columns"][name] = col
+    if dpo_pair:
+        chosen, rejected = (text_lengths(batch.column(name)) for name in dpo_pair)
+        if chosen is not None and rejected is not None:
+            profile["dpo"] = ratio_stats(chosen, rejected)
+    return profile
+
+
+def merge_profiles(into: Dict[str, Any], other: Dict[str, Any]) -> Dict[str, Any]:
+    """Fold one partial profile into another (counts add, min/max combine)"""
+    for key, value in other.items():
+        current = into.get(key)
+        if key not in into:
+            into[key] = value
+        elif isinstance(value, dict):
+            merge_profiles(current, value)
+        elif key in ("min", "max"):
+            if current is None or value is not None and (value < current if key == "min" else value > current):
+                into[key] = value
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            into[key] = current + value
+    return into
+
+
+def profile_row_group(source: str, size: int, metadata, row_group: int, columns: List[str],
+                      dpo_pair: Tuple[str, str] = None) -> Dict[str, Any]:
+    """Stream one row group in bounded batches, reading only the projected columns"""
+    parquet_file = pq.ParquetFile(open_parquet_source(source, size), metadata=metadata, pre_buffer=True)
+    profile: Dict[str, Any] = {}
+    for batch in parquet_file.iter_batches(batch_size=PROFILE_BATCH_ROWS, row_groups=[row_group],
+                                           columns=columns, use_threads=False):
+        merge_profiles(profile, profile_batch(batch, dpo_pair))
+    return profile
+
+
+def profile_parquet(sources: List[str], dpo_pair: Tuple[str, str] = None, jobs: int = 8) -> Dict[str, Any]:
+    """Profile whole Parquet files, one row group per task across a thread pool.
+
+    Binary columns (images, audio) are projected away, so only text and list
+    columns are ever read; memory stays at roughly `jobs` batches.
+    """
+    started = time.time()
+    tasks = []
+    columns: List[str] = []
+    for source in sources:
+        handle = open_parquet_source(source)
+        parquet_file = pq.ParquetFile(handle)
+        schema = parquet_file.schema_arrow
+        columns = [field.name for field in schema if not _contains_binary(field.type)]
+        size = handle.size if isinstance(handle, RemoteFile) else None
+        location = handle.url if isinstance(handle, RemoteFile) else source
+        pair = dpo_pair if dpo_pair and all(name in columns for name in dpo_pair) else None
+        tasks.extend(
+            (location, size, parquet_file.metadata, i, columns, pair)
+            for i in range(parquet_file.num_row_groups)
+        )
+
+    profile: Dict[str, Any] = {"rows": 0, "columns": {}}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        for partial in pool.map(lambda task: profile_row_group(*task), tasks):
+            merge_profiles(profile, partial)
+    profile.update(files=len(sources), row_groups=len(tasks), seconds=round(time.time() - started, 2))
+    return profile
+
+
+def _bucket_label(bucket: int) -> str:
+    if bucket <= 1:
+        return str(bucket)
+    return f"{2 ** (bucket - 1)}-{2 ** bucket - 1}"
+
+
+RATIO_LABELS = {-3: "<0.25", -2: "0.25-0.5", -1: "0.5-1", 0: "1-2", 1: "2-4", 2: ">=4"}
+
+
+def summarize_lengths(stats: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "min": stats["min"],
+        "mean": round(stats["sum"] / stats["count"], 1) if stats["count"] else None,
+        "max": stats["max"],
+        "histogram": {_bucket_label(b): stats["hist"][b] for b in sorted(stats["hist"])},
+    }
+
+
+def summarize_profile(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn merged profile counters into null rates, means and labelled histograms"""
+    columns = {}
+    for name, col in profile["columns"].items():
+        entry = {"type": col["kind"], "null_rate": round(col["nulls"] / col["rows"], 4) if col["rows"] else 0.0}
+        for key in ("chars", "turns", "items"):
+            if key in col:
+                entry[key] = summarize_lengths(col[key])
+        columns[name] = entry
+    summary = {key: profile[key] for key in ("rows", "files", "row_groups", "seconds")}
+    summary["columns"] = columns
+    dpo = profile.get("dpo")
+    if dpo and dpo["pairs"]:
+        summary["dpo_length_ratio"] = {
+            "pairs": dpo["pairs"],
+            "mean": round(dpo["ratio_sum"] / dpo["pairs"], 3),
+            "chosen_longer": round(dpo["chosen_longer"] / dpo["pairs"], 4),
+            "histogram": {RATIO_LABELS[b]: dpo["hist"][b] for b in sorted(dpo["hist"])},
+        }
+    return summary
+
+
+def print_profile(summary: Dict[str, Any]) -> None:
+    print(f"Rows profiled: {summary['rows']:,} ({summary['files']} files, {summary['row_groups']} row groups, {summary['seconds']}s)")
+    for name, col in summary["columns"].items():
+        print(f"\n  {name}: {col['type']}  nulls {col['null_rate']:.2%}")
+        for key in ("chars", "turns", "items"):
+            if key in col:
+                stats = col[key]
+                hist = ", ".join(f"{label}: {count:,}" for label, count in stats["histogram"].items())
+                print(f"    {key}: min {stats['min']} / mean {stats['mean']} / max {stats['max']}")
+                print(f"      [{hist}]")
+    ratio = summary.get("dpo_length_ratio")
+    if ratio:
+        hist = ", ".join(f"{label}: {count:,}" for label, count in ratio["histogram"].items())
+        print(f"\n  chosen/rejected length ratio: mean {ratio['mean']}  chosen longer {ratio['chosen_longer']:.1%}")
+        print(f"    [{hist}]")
+
+
+def load_tokenizer(name: str):
+    """Load a (fast) tokenizer; transformers is imported lazily as it is slow to import"""
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(name, token=os.getenv("HF_TOKEN"))
+
+
+def is_messages(value: Any) -> bool:
+    return isinstance(value, list) and bool(value) and all(
+        isinstance(m, dict) and "role" in m and "content" in m for m in value
+    )
+
+
+def token_lengths(tokenizer, texts: List[str], jobs: int = 8, add_special_tokens: bool = True) -> List[int]:
+    """Token counts from batched tokenizer calls spread over a thread pool.
+
+    Fast tokenizers encode a batch in Rust without holding the GIL, so the
+    batches overlap across threads.
+    """
+    def encode(batch: List[str]) -> List[int]:
+        encoded = tokenizer(batch, add_special_tokens=add_special_tokens, return_attention_mask=False)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    batches = [texts[i:i + TOKENIZE_BATCH] for i in range(0, len(texts), TOKENIZE_BATCH)]
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        return [n for lengths in pool.map(encode, batches) for n in lengths]
+
+
+def percentile(sorted_values: List[int], q: float) -> int:
+    """Nearest-rank percentile of an already sorted list"""
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))]
+
+
+def packing_efficiency(lengths: List[int], max_length: int) -> float:
+    """Fraction of token slots filled when packing with best-fit decreasing"""
+    free: List[int] = []  # sorted remaining capacity of open bins
+    for n in sorted((min(n, max_length) for n in lengths), reverse=True):
+        i = bisect.bisect_left(free, n)
+        if i < len(free):
+            space = free.pop(i) - n
+        else:
+            space = max_length - n
+        bisect.insort(free, space)
+    return sum(min(n, max_length) for n in lengths) / (len(free) * max_length) if free else 0.0
+
+
+def padding_efficiency(lengths: List[int], max_length: int, batch_size: int) -> float:
+    """Fraction of token slots that are real tokens with per-batch dynamic padding"""
+    clipped = [min(n, max_length) for n in lengths]
+    slots = sum(
+        len(clipped[i:i + batch_size]) * max(clipped[i:i + batch_size])
+        for i in range(0, len(clipped), batch_size)
+    )
+    return sum(clipped) / slots if slots else 0.0
+
+
+def estimate_token_lengths(tokenizer, batch: RowBatch, max_lengths: List[int], batch_size: int = 8,
+                           jobs: int = 8) -> Dict[str, Any]:
+    """Token-length percentiles per text column and per chat-templated messages column.
+
+    Cells the Datasets Server truncated are skipped, since their length is unknown.
+    Truncation, packing and padding efficiency are reported for the sequence SFT
+    would train on: the chat-templated messages, else `text`, else the longest column.
+    """
+    texts: Dict[str, List[str]] = {}
+    skipped = 0
+    has_template = bool(getattr(tokenizer, "chat_template", None))
+    for col, values in batch.columns.items():
+        truncated = batch.truncated[col]
+        skipped += len(truncated)
+        kept = [value for i, value in enumerate(values) if i not in truncated]
+        strings = [value for value in kept if isinstance(value, str)]
+        if strings:
+            texts[col] = strings
+        conversations = [value for value in kept if is_messages(value)] if has_template else []
+        if conversations:
+            texts[f"{col} (chat template)"] = [tokenizer.apply_chat_template(value, tokenize=False) for value in conversations]
+
+    columns = {}
+    all_lengths = {}
+    for name, values in texts.items():
+        lengths = token_lengths(tokenizer, values, jobs, add_special_tokens=not name.endswith("(chat template)"))
+        ordered = sorted(lengths)
+        all_lengths[name] = lengths
+        columns[name] = {
+            "count": len(lengths),
+            "mean": round(sum(lengths) / len(lengths), 1),
+            "p50": percentile(ordered, 0.5),
+            "p90": percentile(ordered, 0.9),
+            "p99": percentile(ordered, 0.99),
+            "max": ordered[-1],
+            "truncated": {str(limit): round(sum(n > limit for n in lengths) / len(lengths), 4) for limit in max_lengths},
+        }
+
+    result: Dict[str, Any] = {
+        "tokenizer": getattr(tokenizer, "name_or_path", None),
+        "rows": batch.num_rows,
+        "truncated_cells_skipped": skipped,
+        "columns": columns,
+    }
+    sequence = next((name for name in all_lengths if name.endswith("(chat template)")), None)
+    if sequence is None and "text" in all_lengths:
+        sequence = "text"
+    if sequence is None and columns:
+        sequence = max(columns, key=lambda name: columns[name]["mean"])
+    if sequence:
+        result["sequence"] = sequence
+        result["efficiency"] = {
+            str(limit): {
+                "packing": round(packing_efficiency(all_lengths[sequence], limit), 4),
+                "padding": round(padding_efficiency(all_lengths[sequence], limit, batch_size), 4),
+            }
+            for limit in max_lengths
+        }
+    return result
+
+
+def print_token_lengths(summary: Dict[str, Any], batch_size: int) -> None:
+    print(f"Tokenizer: {summary['tokenizer']}  rows: {summary['rows']}  truncated cells skipped: {summary['truncated_cells_skipped']}")
+    for name, col in summary["columns"].items():
+        truncated = ", ".join(f">{limit}: {frac:.1%}" for limit, frac in col["truncated"].items())
+        print(f"\n  {name}: p50 {col['p50']} / p90 {col['p90']} / p99 {col['p99']} / max {col['max']} (mean {col['mean']})")
+        print(f"    truncated at {truncated}")
+    if "efficiency" in summary:
+        print(f"\n  Training sequence: {summary['sequence']}")
+        for limit, eff in summary["efficiency"].items():
+            print(f"    max_length {limit}: packing {eff['packing']:.1%} / padding (batch {batch_size}) {eff['padding']:.1%}")
 
 
 def find_columns(columns: List[str], patterns: List[str]) -> List[str]:
@@ -199,64 +980,72 @@ def format_value_preview(value: Any, max_chars: int) -> str:
         return preview[:max_chars] + ("..." if len(preview) > max_chars else "")
 
 
-def main():
-    args = parse_args()
-    
-    print(f"Fetching dataset info via Datasets Server API...")
-    
-    try:
-        # Get splits info
-        splits_data = get_splits(args.dataset)
-        if not splits_data or "splits" not in splits_data:
-            print(f"ERROR: Could not fetch splits for dataset '{args.dataset}'")
-            print(f"       Dataset may not exist or is not accessible via Datasets Server API")
-            sys.exit(1)
-        
-        # Find the right config
-        available_configs = set()
-        split_found = False
-        config_to_use = args.config
-        
-        for split_info in splits_data["splits"]:
-            available_configs.add(split_info["config"])
-            if split_info["config"] == args.config and split_info["split"] == args.split:
-                split_found = True
-        
-        # If default config not found, try first available
-        if not split_found and available_configs:
-            config_to_use = list(available_configs)[0]
-            print(f"Config '{args.config}' not found, trying '{config_to_use}'...")
-        
-        # Get rows
-        rows_data = get_rows(args.dataset, config_to_use, args.split, offset=0, length=args.samples)
-        
-        if not rows_data or "rows" not in rows_data:
-            print(f"ERROR: Could not fetch rows for dataset '{args.dataset}'")
-            print(f"       Split '{args.split}' may not exist")
-            print(f"       Available configs: {', '.join(sorted(available_configs))}")
-            sys.exit(1)
-        
-        rows = rows_data["rows"]
-        if not rows:
-            print(f"ERROR: No rows found in split '{args.split}'")
-            sys.exit(1)
-        
+def fetch_sample(dataset: str, args, log=print) -> Dict[str, Any]:
+    """Resolve config/split and fetch sample rows; raises Exception with a printable message"""
+    # Get splits info
+    splits_data = get_splits(dataset, args.revision)
+    if not splits_data or "splits" not in splits_data:
+        raise Exception(f"Could not fetch splits for dataset '{dataset}'\n"
+                        f"       Dataset may not exist or is not accessible via Datasets Server API")
+
+    # Find the right config
+    available_configs = set()
+    split_found = False
+    config_to_use = args.config
+
+    for split_info in splits_data["splits"]:
+        available_configs.add(split_info["config"])
+        if split_info["config"] == args.config and split_info["split"] == args.split:
+            split_found = True
+
+    # If default config not found, try first available
+    if not split_found and available_configs:
+        config_to_use = list(available_configs)[0]
+        log(f"Config '{args.config}' not found, trying '{config_to_use}'...")
+
+    num_examples = None
+    for split_info in splits_data["splits"]:
+        if split_info["config"] == config_to_use and split_info["split"] == args.split:
+            num_examples = split_info.get("num_examples")
+            break
+
+    # Get rows
+    if args.sampling == "stratified" and isinstance(num_examples, int) and num_examples > args.samples:
+        rows_data = get_rows_stratified(
+            dataset, config_to_use, args.split, num_examples, args.samples,
+            windows=args.windows, max_bytes=args.max_bytes, seed=args.seed, revision=args.revision,
+        )
+    else:
+        rows_data = get_rows(dataset, config_to_use, args.split, offset=0, length=args.samples, revision=args.revision)
+
+    if not rows_data or "rows" not in rows_data:
+        raise Exception(f"Could not fetch rows for dataset '{dataset}'\n"
+                        f"       Split '{args.split}' may not exist\n"
+                        f"       Available configs: {', '.join(sorted(available_configs))}")
+
+    rows = rows_data["rows"]
+    if not rows:
+        raise Exception(f"No rows found in split '{args.split}'")
+
+    return {
+        "config": config_to_use,
+        "rows": rows,
+        "batch": RowBatch(rows, rows_data.get("features", [])),
         # Extract column info from first row
-        first_row = rows[0]["row"]
-        columns = list(first_row.keys())
-        features = rows_data.get("features", [])
-        
+        "first_row": rows[0]["row"],
+        "columns": list(rows[0]["row"].keys()),
+        "features": rows_data.get("features", []),
         # Get total count if available
-        total_examples = "Unknown"
-        for split_info in splits_data["splits"]:
-            if split_info["config"] == config_to_use and split_info["split"] == args.split:
-                total_examples = f"{split_info.get('num_examples', 'Unknown'):,}" if isinstance(split_info.get('num_examples'), int) else "Unknown"
-                break
-        
-    except Exception as e:
-        print(f"ERROR: {str(e)}")
-        sys.exit(1)
-    
+        "total_examples": f"{num_examples:,}" if isinstance(num_examples, int) else "Unknown",
+        "sample_windows": rows_data.get("windows", [[0, len(rows)]]),
+    }
+
+
+def inspect_dataset(dataset: str, args, log=print) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Fetch a sample and run every check; returns (JSON result, fetched sample)"""
+    sample = fetch_sample(dataset, args, log)
+    columns, rows, batch = sample["columns"], sample["rows"], sample["batch"]
+
     # Run compatibility checks
     sft_info = check_sft_compatibility(columns)
     dpo_info = check_dpo_compatibility(columns)
@@ -283,36 +1072,129 @@ def main():
     if kto_info["ready"]:
         recommended.append("KTO")
     
+    result = {
+        "dataset": dataset,
+        "config": sample["config"],
+        "split": args.split,
+        "total_examples": sample["total_examples"],
+        "samples_fetched": len(rows),
+        "sample_windows": sample["sample_windows"],
+        "columns": columns,
+        "features": [{"name": f["name"], "type": f["type"]} for f in sample["features"]] if sample["features"] else [],
+        "sample_memory": batch.memory_report(),
+        "compatibility": {
+            "SFT": sft_info,
+            "DPO": dpo_info,
+            "GRPO": grpo_info,
+            "KTO": kto_info,
+        },
+        "recommended_methods": recommended,
+    }
+
+    # Full-split profile from the Parquet export
+    if args.profile:
+        try:
+            sources = args.parquet or [f["url"] for f in get_parquet_files(dataset, sample["config"], args.split, args.revision)]
+            if not sources:
+                raise Exception(f"No Parquet export for {sample['config']}/{args.split}")
+            dpo_pair = (dpo_info["chosen_col"], dpo_info["rejected_col"]) if dpo_info["can_map"] else None
+            result["profile"] = summarize_profile(profile_parquet(sources, dpo_pair, jobs=args.jobs))
+        except Exception as e:
+            result["profile"] = {"error": str(e)}
+    
+    # Token-length distribution of the fetched samples
+    if args.tokenizer:
+        try:
+            result["token_lengths"] = estimate_token_lengths(load_tokenizer(args.tokenizer), batch, args.max_lengths,
+                                                             batch_size=args.batch_size, jobs=args.jobs)
+        except Exception as e:
+            result["token_lengths"] = {"error": str(e)}
+
+    return result, sample
+
+
+def read_dataset_ids(path: str) -> List[str]:
+    """One dataset id per line ('-' for stdin); blank lines and # comments are ignored"""
+    handle = sys.stdin if path == "-" else open(path)
+    try:
+        return [line.split("#", 1)[0].strip() for line in handle if line.split("#", 1)[0].strip()]
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+
+def inspect_many(datasets: List[str], args) -> int:
+    """Inspect datasets concurrently, printing one JSON line per dataset as each finishes.
+
+    Worker threads keep their keep-alive connections across datasets, so the
+    Datasets Server is reached over a small pool of reused sockets. Returns the
+    number of datasets that failed.
+    """
+    def run(dataset: str) -> Dict[str, Any]:
+        try:
+            return inspect_dataset(dataset, args, log=lambda message: print(message, file=sys.stderr))[0]
+        except Exception as e:
+            return {"dataset": dataset, "error": " ".join(str(e).split())}
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(args.jobs, len(datasets)))) as pool:
+        for future in as_completed([pool.submit(run, dataset) for dataset in datasets]):
+            result = future.result()
+            failed += "error" in result
+            print(json.dumps(result), flush=True)
+    return failed
+
+
+def main():
+    args = parse_args()
+    configure_cache(args)
+    if args.profile and pq is None:
+        print("ERROR: --profile requires pyarrow (e.g. uv run --with pyarrow dataset_inspector.py ...)")
+        sys.exit(1)
+    if args.tokenizer and importlib.util.find_spec("transformers") is None:
+        print("ERROR: --tokenizer requires transformers (e.g. uv run --with transformers dataset_inspector.py ...)")
+        sys.exit(1)
+
+    datasets = list(dict.fromkeys((args.dataset or []) + (read_dataset_ids(args.datasets_file) if args.datasets_file else [])))
+    if not datasets:
+        print("ERROR: Pass --dataset (repeatable) or --datasets-file")
+        sys.exit(1)
+    if len(datasets) > 1:
+        sys.exit(1 if inspect_many(datasets, args) else 0)
+    
+    print(f"Fetching dataset info via Datasets Server API...")
+    
+    try:
+        result, sample = inspect_dataset(datasets[0], args)
+    except Exception as e:
+        print(f"ERROR: {str(e)}")
+        sys.exit(1)
+    
     # JSON output mode
     if args.json_output:
-        result = {
-            "dataset": args.dataset,
-            "config": config_to_use,
-            "split": args.split,
-            "total_examples": total_examples,
-            "columns": columns,
-            "features": [{"name": f["name"], "type": f["type"]} for f in features] if features else [],
-            "compatibility": {
-                "SFT": sft_info,
-                "DPO": dpo_info,
-                "GRPO": grpo_info,
-                "KTO": kto_info,
-            },
-            "recommended_methods": recommended,
-        }
         print(json.dumps(result, indent=2))
         sys.exit(0)
     
+    rows, columns, features, first_row = sample["rows"], sample["columns"], sample["features"], sample["first_row"]
+    batch = sample["batch"]
+    sample_windows = sample["sample_windows"]
+    sft_info, dpo_info, grpo_info, kto_info = (result["compatibility"][m] for m in ("SFT", "DPO", "GRPO", "KTO"))
+    recommended = result["recommended_methods"]
+    profile, tokens = result.get("profile"), result.get("token_lengths")
+    
     # Human-readable output optimized for LLM parsing
     print("=" * 80)
     print(f"DATASET INSPECTION RESULTS")
     print("=" * 80)
     
-    print(f"\nDataset: {args.dataset}")
-    print(f"Config: {config_to_use}")
+    print(f"\nDataset: {result['dataset']}")
+    print(f"Config: {result['config']}")
     print(f"Split: {args.split}")
-    print(f"Total examples: {total_examples}")
+    print(f"Total examples: {result['total_examples']}")
     print(f"Samples fetched: {len(rows)}")
+    print(f"Sample memory: {format_bytes(result['sample_memory']['total_bytes'])} in {len(batch.names)} columns")
+    if len(sample_windows) > 1:
+        print(f"Sample windows (offset, length): {', '.join(f'({o}, {n})' for o, n in sample_windows)}")
     
     print(f"\n{'COLUMNS':-<80}")
     if features:
@@ -330,6 +1212,20 @@ def main():
         print(f"\n{col}:")
         print(f"  {display}")
     
+    if profile is not None:
+        print(f"\n{'COLUMN PROFILE (full split)':-<80}")
+        if "error" in profile:
+            print(f"  ERROR: {profile['error']}")
+        else:
+            print_profile(profile)
+    
+    if tokens is not None:
+        print(f"\n{'TOKEN LENGTHS (fetched samples)':-<80}")
+        if "error" in tokens:
+            print(f"  ERROR: {tokens['error']}")
+        else:
+            print_token_lengths(tokens, args.batch_size)
+    
     print(f"\n{'TRAINING METHOD COMPATIBILITY':-<80}")
     
     # SFT
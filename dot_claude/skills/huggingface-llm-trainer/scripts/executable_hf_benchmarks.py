@@ -11,25 +11,89 @@ This script is designed to be pipeline-friendly:
   - fetch dataset leaderboards in normalized JSON / NDJSON / table form
   - optionally read dataset ids from stdin for chaining
 
-It uses HF_TOKEN automatically when present.
+It uses HF_TOKEN automatically when present. The benchmark catalog used by
+`search` is cached on disk (see --cache-ttl / --refresh / --offline).
 """
 
 from __future__ import annotations
 
 import argparse
+import csv
+import gzip
+import hashlib
+import heapq
+import http.client
+import itertools
 import json
+import math
 import os
+import queue
+import random
 import re
 import sys
+import tempfile
 import textwrap
-import urllib.error
+import threading
+import time
 import urllib.parse
 import urllib.request
-from typing import Any, Iterable
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.message import Message
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+try:  # optional: lets the Hub send brotli-compressed responses
+    import brotli
+except ImportError:
+    brotli = None
 
 
 BASE_URL = "https://huggingface.co"
 DEFAULT_TIMEOUT = 30
+DEFAULT_JOBS = 8
+MAX_RETRIES = 3
+MAX_REDIRECTS = 5
+RETRY_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+ACCEPT_ENCODING = "gzip, br" if brotli is not None else "gzip"
+
+LEADERBOARD_FIELDS = [
+    "dataset_id",
+    "task_id",
+    "rank",
+    "model_id",
+    "value",
+    "verified",
+    "lower_is_better",
+    "filename",
+    "notes",
+    "pull_request",
+    "source_name",
+    "source_url",
+    "source_is_external",
+]
+
+CACHE_VERSION = 2
+INDEX_VERSION = 1
+DEFAULT_CACHE_TTL = 3600
+CATALOG_PAGE_SIZE = 500
+DELTA_PAGE_SIZE = 50
+FULL_SYNC_INTERVAL = 24 * 3600
+CACHE_OUTCOMES = ("hit", "revalidated", "delta", "miss")
+LINK_NEXT_RE = re.compile(r'<([^>]+)>\s*;\s*rel="?next"?')
+CACHE_DIR = Path(
+    os.getenv("HF_BENCHMARKS_CACHE")
+    or Path(os.getenv("XDG_CACHE_HOME") or Path.home() / ".cache") / "hf_benchmarks"
+)
+CATALOG_CACHE_FILE = "catalog.json"
+CACHE_STATS_FILE = "stats.json"
+SEARCH_INDEX_FILE = "index.json"
+
+# Only the fields the search/scoring code reads are kept in the cached catalog.
+CATALOG_FIELDS = ("id", "description", "tags", "downloads", "lastModified")
+CATALOG_CARD_FIELDS = ("pretty_name", "tags", "task_categories", "task_ids", "modality")
 
 ALIASES: dict[str, list[str]] = {
     "ocr": [
@@ -91,6 +155,9 @@ class HfApiError(RuntimeError):
     pass
 
 
+_thread_local = threading.local()
+
+
 class FullHelpArgumentParser(argparse.ArgumentParser):
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         super().__init__(*args, **kwargs)
@@ -123,8 +190,8 @@ def auth_headers() -> dict[str, str]:
     return {"Authorization": f"Bearer {token}"} if token else {}
 
 
-def http_get_json(path: str, params: dict[str, Any] | None = None) -> Any:
-    url = f"{BASE_URL}{path}"
+def build_url(path: str, params: dict[str, Any] | None = None) -> str:
+    url = path if path.startswith(("http://", "https://")) else f"{BASE_URL}{path}"
     if params:
         pairs: list[tuple[str, str]] = []
         for key, value in params.items():
@@ -137,16 +204,106 @@ def http_get_json(path: str, params: dict[str, Any] | None = None) -> Any:
                 pairs.append((key, str(value)))
         if pairs:
             url = f"{url}?{urllib.parse.urlencode(pairs)}"
+    return url
+
+
+def _connection_for(scheme: str, netloc: str) -> http.client.HTTPConnection:
+    """Return this thread's keep-alive connection for (scheme, netloc)."""
+    connections = getattr(_thread_local, "connections", None)
+    if connections is None:
+        connections = _thread_local.connections = {}
+    conn = connections.get((scheme, netloc))
+    if conn is None:
+        conn_cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        proxy = urllib.request.getproxies().get(scheme)
+        if proxy and not urllib.request.proxy_bypass(netloc):
+            proxy_netloc = urllib.parse.urlsplit(proxy).netloc or proxy
+            conn = conn_cls(proxy_netloc, timeout=DEFAULT_TIMEOUT)
+            conn.set_tunnel(netloc)
+        else:
+            conn = conn_cls(netloc, timeout=DEFAULT_TIMEOUT)
+        connections[(scheme, netloc)] = conn
+    return conn
+
+
+def _drop_connection(scheme: str, netloc: str) -> None:
+    conn = getattr(_thread_local, "connections", {}).pop((scheme, netloc), None)
+    if conn is not None:
+        conn.close()
+
+
+def decode_body(body: bytes, content_encoding: str | None) -> bytes:
+    encoding = (content_encoding or "").strip().lower()
+    if encoding == "gzip":
+        return gzip.decompress(body)
+    if encoding == "br" and brotli is not None:
+        return brotli.decompress(body)
+    return body
+
+
+def retry_delay(attempt: int, retry_after: str | None = None) -> float:
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), MAX_BACKOFF)
+    return min(RETRY_BACKOFF * (2**attempt), MAX_BACKOFF) * (0.5 + random.random() / 2)
+
+
+def http_get(
+    path: str,
+    params: dict[str, Any] | None = None,
+    headers: dict[str, str] | None = None,
+) -> tuple[int, Any, Message]:
+    """GET a JSON endpoint. Returns (status, data, headers); data is None on 304.
+
+    Connections are kept alive per thread and reused across calls. Connection errors,
+    429 and 5xx responses are retried with exponential backoff (honouring Retry-After).
+    """
+    url = build_url(path, params)
+    req_headers = {"Accept-Encoding": ACCEPT_ENCODING, **auth_headers(), **(headers or {})}
+    redirects = 0
+    attempt = 0
+    while True:
+        parts = urllib.parse.urlsplit(url)
+        target = parts.path + (f"?{parts.query}" if parts.query else "")
+        try:
+            conn = _connection_for(parts.scheme, parts.netloc)
+            conn.request("GET", target, headers=req_headers)
+            resp = conn.getresponse()
+            body = decode_body(resp.read(), resp.getheader("Content-Encoding"))
+        except (http.client.HTTPException, OSError, EOFError) as exc:
+            _drop_connection(parts.scheme, parts.netloc)
+            if attempt < MAX_RETRIES:
+                time.sleep(retry_delay(attempt))
+                attempt += 1
+                continue
+            raise HfApiError(f"Request failed for {url}: {exc}") from exc
+        if resp.will_close:
+            _drop_connection(parts.scheme, parts.netloc)
+
+        location = resp.getheader("Location")
+        if resp.status in (301, 302, 303, 307, 308) and location and redirects < MAX_REDIRECTS:
+            redirects += 1
+            next_url = urllib.parse.urljoin(url, location)
+            if urllib.parse.urlsplit(next_url).netloc != parts.netloc:
+                req_headers.pop("Authorization", None)
+            url = next_url
+            continue
+        if resp.status in RETRY_STATUSES and attempt < MAX_RETRIES:
+            time.sleep(retry_delay(attempt, resp.getheader("Retry-After")))
+            attempt += 1
+            continue
+        if resp.status == 304:
+            return 304, None, resp.msg
+        if resp.status >= 400:
+            text = body.decode("utf-8", errors="replace")
+            raise HfApiError(f"{resp.status} {resp.reason} for {url}: {text[:500]}")
+        try:
+            return resp.status, json.loads(body.decode("utf-8")), resp.msg
+        except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+            raise HfApiError(f"Invalid JSON from {url}: {exc}") from exc
 
-    req = urllib.request.Request(url, headers=auth_headers())
-    try:
-        with urllib.request.urlopen(req, timeout=DEFAULT_TIMEOUT) as resp:
-            return json.loads(resp.read().decode("utf-8"))
-    except urllib.error.HTTPError as exc:
-        body = exc.read().decode("utf-8", errors="replace")
-        raise HfApiError(f"{exc.code} {exc.reason} for {url}: {body[:500]}") from exc
-    except urllib.error.URLError as exc:
-        raise HfApiError(f"Request failed for {url}: {exc}") from exc
+
+def http_get_json(path: str, params: dict[str, Any] | None = None) -> Any:
+    return http_get(path, params)[1]
 
 
 def shorten(text: str, width: int) -> str:
@@ -168,14 +325,214 @@ def first_text(value: Any) -> str:
     return str(value)
 
 
-def benchmark_catalog(limit: int = 500) -> list[dict[str, Any]]:
-    data = http_get_json(
+def slim_dataset(dataset: dict[str, Any]) -> dict[str, Any]:
+    card = dataset.get("cardData") or {}
+    slim = {key: dataset.get(key) for key in CATALOG_FIELDS if key in dataset}
+    slim["cardData"] = {key: card[key] for key in CATALOG_CARD_FIELDS if key in card}
+    return slim
+
+
+def read_json_file(path: Path) -> Any:
+    try:
+        with path.open(encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def write_json_file(path: Path, data: Any) -> None:
+    """Write JSON atomically so concurrent runs never see a partial file."""
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(data, fh, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_name, path)
+    except OSError as exc:
+        print(f"Warning: could not write cache file {path}: {exc}", file=sys.stderr)
+
+
+def load_catalog_cache(path: Path) -> dict[str, Any] | None:
+    cache = read_json_file(path)
+    if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION:
+        return None
+    if not isinstance(cache.get("datasets"), list):
+        return None
+    return cache
+
+
+def record_cache_stats(outcome: str) -> dict[str, int]:
+    """Bump the persistent per-outcome counters kept next to the catalog."""
+    path = CACHE_DIR / CACHE_STATS_FILE
+    counters = read_json_file(path)
+    if not isinstance(counters, dict):
+        counters = {}
+    counters = {key: int(counters.get(key, 0)) for key in CACHE_OUTCOMES}
+    counters[outcome] += 1
+    write_json_file(path, counters)
+    return counters
+
+
+def catalog_snapshot_id(datasets: list[dict[str, Any]]) -> str:
+    payload = json.dumps(datasets, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()[:16]
+
+
+def next_page_url(headers: Message) -> str | None:
+    match = LINK_NEXT_RE.search(headers.get("Link") or "")
+    return match.group(1) if match else None
+
+
+def iter_catalog_pages(
+    page_size: int = CATALOG_PAGE_SIZE, etag: str | None = None, **params: Any
+) -> Iterator[tuple[int, list[dict[str, Any]], Message]]:
+    """Yield (status, datasets, headers) per catalog page, following Link rel="next".
+
+    With `etag`, the first page is requested conditionally; a 304 ends the crawl.
+    Extra `params` (e.g. sort/direction) are added to the first request.
+    """
+    url: str | None = build_url(
         "/api/datasets",
-        params={"filter": "benchmark:official", "limit": limit, "full": "true"},
+        {"filter": "benchmark:official", "limit": page_size, "full": "true", **params},
     )
-    if not isinstance(data, list):
-        raise HfApiError("Unexpected response while listing benchmark datasets")
-    return data
+    headers = {"If-None-Match": etag} if etag else None
+    while url:
+        status, data, resp_headers = http_get(url, headers=headers)
+        if status == 304:
+            yield status, [], resp_headers
+            return
+        if not isinstance(data, list):
+            raise HfApiError("Unexpected response while listing benchmark datasets")
+        yield status, data, resp_headers
+        url = next_page_url(resp_headers)
+        headers = None
+
+
+def iter_benchmark_catalog(page_size: int = CATALOG_PAGE_SIZE) -> Iterator[dict[str, Any]]:
+    """Stream the live catalog one page at a time, bypassing the cache."""
+    for _, page, _ in iter_catalog_pages(page_size):
+        yield from page
+
+
+def catalog_watermark(datasets: list[dict[str, Any]]) -> str | None:
+    """Newest lastModified in the snapshot; None if any entry lacks one."""
+    stamps = [ds.get("lastModified") for ds in datasets]
+    if not stamps or not all(isinstance(stamp, str) for stamp in stamps):
+        return None
+    return max(stamps)
+
+
+def fetch_catalog_delta(cache: dict[str, Any]) -> list[dict[str, Any]]:
+    """Fetch entries modified since the cache watermark, newest first.
+
+    Paging stops at the first entry older than the watermark. Entries stamped exactly
+    at the watermark are compared per id, since several can share a timestamp.
+    """
+    watermark = cache["watermark"]
+    known = {ds.get("id"): ds.get("lastModified") for ds in cache["datasets"]}
+    changed: list[dict[str, Any]] = []
+    pages = iter_catalog_pages(DELTA_PAGE_SIZE, sort="lastModified", direction=-1)
+    for _, page, _ in pages:
+        for dataset in page:
+            modified = dataset.get("lastModified") or ""
+            if modified < watermark:
+                return changed
+            if known.get(dataset.get("id")) != modified:
+                changed.append(slim_dataset(dataset))
+    return changed
+
+
+def merge_catalog_delta(cache: dict[str, Any], changed: list[dict[str, Any]]) -> None:
+    positions = {ds.get("id"): pos for pos, ds in enumerate(cache["datasets"])}
+    for dataset in changed:
+        pos = positions.get(dataset.get("id"))
+        if pos is None:
+            positions[dataset.get("id")] = len(cache["datasets"])
+            cache["datasets"].append(dataset)
+        else:
+            cache["datasets"][pos] = dataset
+    cache["watermark"] = catalog_watermark(cache["datasets"])
+    cache["snapshot"] = catalog_snapshot_id(cache["datasets"])
+
+
+def catalog_snapshot(
+    page_size: int = CATALOG_PAGE_SIZE,
+    ttl: float = DEFAULT_CACHE_TTL,
+    refresh: bool = False,
+    offline: bool = False,
+    stats: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    """Return the cached official benchmark catalog, refreshing it when stale.
+
+    The result carries `datasets` plus a `snapshot` id that changes only when the
+    catalog content does. A stale cache is normally delta-synced: only entries whose
+    lastModified is newer than the cached watermark are downloaded and merged into
+    the catalog and its search index. Every FULL_SYNC_INTERVAL (or with `refresh`) the
+    whole catalog is crawled instead, which is what notices removed datasets; a
+    single-page catalog is then revalidated with If-None-Match. `offline` never
+    touches the network.
+    """
+    path = CACHE_DIR / CATALOG_CACHE_FILE
+    cache = None if refresh else load_catalog_cache(path)
+    now = time.time()
+
+    if cache is not None and (offline or now - cache.get("fetched_at", 0) < ttl):
+        outcome = "hit"
+    elif offline:
+        raise HfApiError(f"--offline given but no usable catalog cache at {path}")
+    elif (
+        cache is not None
+        and cache.get("watermark")
+        and now - cache.get("full_sync_at", 0) < FULL_SYNC_INTERVAL
+    ):
+        outcome = "delta"
+        changed = fetch_catalog_delta(cache)
+        if changed:
+            previous_snapshot = cache["snapshot"]
+            merge_catalog_delta(cache, changed)
+            update_search_index(previous_snapshot, cache, changed)
+        cache["fetched_at"] = now
+        write_json_file(path, cache)
+        if stats is not None:
+            stats["changed"] = len(changed)
+    else:
+        # A first-page ETag only vouches for the whole catalog when it had one page.
+        etag = cache.get("etag") if cache and cache.get("pages") == 1 else None
+        datasets: list[dict[str, Any]] = []
+        first_headers: Message | None = None
+        pages = 0
+        status = 200
+        for status, page, resp_headers in iter_catalog_pages(page_size, etag=etag):
+            if first_headers is None:
+                first_headers = resp_headers
+            pages += 1
+            datasets.extend(slim_dataset(ds) for ds in page)
+
+        if status == 304 and cache is not None:
+            outcome = "revalidated"
+            cache["fetched_at"] = cache["full_sync_at"] = now
+        else:
+            outcome = "miss"
+            cache = {
+                "version": CACHE_VERSION,
+                "fetched_at": now,
+                "full_sync_at": now,
+                "etag": first_headers.get("ETag") if first_headers is not None else None,
+                "pages": pages,
+                "watermark": catalog_watermark(datasets),
+                "snapshot": catalog_snapshot_id(datasets),
+                "datasets": datasets,
+            }
+        write_json_file(path, cache)
+
+    counters = record_cache_stats(outcome)
+    if stats is not None:
+        stats.update(counters)
+        stats["outcome"] = outcome
+        stats["age_seconds"] = round(now - cache["fetched_at"], 1)
+        stats["datasets"] = len(cache["datasets"])
+        stats["path"] = str(path)
+    return cache
 
 
 def dataset_search_blob(dataset: dict[str, Any]) -> str:
@@ -258,15 +615,221 @@ def matches_term(blob: str, term: str) -> bool:
     return candidate in blob
 
 
+WORD_TOKEN_RE = re.compile(r"[a-z0-9_]+")
+
+
+class SearchIndex:
+    """Token-level inverted index over the searchable fields of a catalog snapshot.
+
+    `matches_term` treats a bare [a-z0-9_]+ term as a whole-word match, which is the
+    same as the term being one of the field's maximal [a-z0-9_]+ runs, so a posting
+    lookup answers it exactly. Other terms keep substring semantics against the stored
+    lowercase field text. Postings hold positions into `ids`/`docs`.
+    """
+
+    FIELDS = ("id", "pretty_name", "tags", "description", "blob")
+
+    def __init__(
+        self,
+        ids: list[str],
+        docs: list[dict[str, str]],
+        postings: dict[str, dict[str, list[int]]],
+        tag_postings: dict[str, list[int]],
+    ) -> None:
+        self.ids = ids
+        self.docs = docs
+        self.postings = postings
+        self.tag_postings = tag_postings
+        self.positions = {doc_id: pos for pos, doc_id in enumerate(ids)}
+
+    @classmethod
+    def build(cls, datasets: list[dict[str, Any]]) -> SearchIndex:
+        ids: list[str] = []
+        docs: list[dict[str, str]] = []
+        seen: set[str] = set()
+        postings: dict[str, dict[str, list[int]]] = {field: {} for field in cls.FIELDS}
+        tag_postings: dict[str, list[int]] = {}
+        for dataset in datasets:
+            doc_id = dataset.get("id")
+            if not isinstance(doc_id, str) or doc_id in seen:
+                continue
+            seen.add(doc_id)
+            pos = len(ids)
+            doc = dataset_search_fields(dataset)
+            doc["blob"] = dataset_search_blob(dataset)
+            ids.append(doc_id)
+            docs.append(doc)
+            for field in cls.FIELDS:
+                for token in set(WORD_TOKEN_RE.findall(doc[field])):
+                    postings[field].setdefault(token, []).append(pos)
+            tags = collect_prefixed_tags(dataset, ["task_categories:", "task_ids:", "modality:"])
+            for tag in {t.lower() for t in tags}:
+                tag_postings.setdefault(tag, []).append(pos)
+        return cls(ids, docs, postings, tag_postings)
+
+    @classmethod
+    def load(cls, path: Path, snapshot: str) -> SearchIndex | None:
+        data = read_json_file(path)
+        if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+            return None
+        if data.get("snapshot") != snapshot:
+            return None
+        return cls(data["ids"], data["docs"], data["postings"], data["tag_postings"])
+
+    def save(self, path: Path, snapshot: str) -> None:
+        write_json_file(
+            path,
+            {
+                "version": INDEX_VERSION,
+                "snapshot": snapshot,
+                "ids": self.ids,
+                "docs": self.docs,
+                "postings": {
+                    field: {token: sorted(found) for token, found in by_token.items()}
+                    for field, by_token in self.postings.items()
+                },
+                "tag_postings": {tag: sorted(found) for tag, found in self.tag_postings.items()},
+            },
+        )
+
+    def update(self, datasets: list[dict[str, Any]]) -> None:
+        """Re-index changed datasets in place, appending ones not seen before."""
+        for dataset in datasets:
+            doc_id = dataset.get("id")
+            if not isinstance(doc_id, str):
+                continue
+            pos = self.positions.get(doc_id)
+            if pos is None:
+                pos = self.positions[doc_id] = len(self.ids)
+                self.ids.append(doc_id)
+                self.docs.append({})
+            else:
+                old = self.docs[pos]
+                for field in self.FIELDS:
+                    for token in set(WORD_TOKEN_RE.findall(old.get(field, ""))):
+                        _discard_posting(self.postings[field], token, pos)
+                for tag in list(self.tag_postings):
+                    _discard_posting(self.tag_postings, tag, pos)
+
+            doc = dataset_search_fields(dataset)
+            doc["blob"] = dataset_search_blob(dataset)
+            self.docs[pos] = doc
+            for field in self.FIELDS:
+                for token in set(WORD_TOKEN_RE.findall(doc[field])):
+                    _add_posting(self.postings[field], token, pos)
+            tags = collect_prefixed_tags(dataset, ["task_categories:", "task_ids:", "modality:"])
+            for tag in {t.lower() for t in tags}:
+                _add_posting(self.tag_postings, tag, pos)
+
+    def __contains__(self, doc_id: object) -> bool:
+        return doc_id in self.positions
+
+    def matches(self, doc_id: str, field: str, term: str) -> bool:
+        candidate = term.lower().strip()
+        if not candidate:
+            return False
+        pos = self.positions[doc_id]
+        if WORD_TOKEN_RE.fullmatch(candidate):
+            return pos in self.term_docs(field, candidate)
+        return candidate in self.docs[pos][field]
+
+    def term_docs(self, field: str, term: str) -> set[int]:
+        candidate = term.lower().strip()
+        if not candidate:
+            return set()
+        if WORD_TOKEN_RE.fullmatch(candidate):
+            found = self.postings[field].get(candidate, ())
+            # Postings are lists on disk; convert each one at most once per run.
+            if not isinstance(found, set):
+                found = self.postings[field][candidate] = set(found)
+            return found
+        return {pos for pos, doc in enumerate(self.docs) if candidate in doc[field]}
+
+    def candidates(
+        self,
+        queries: list[str],
+        aliases: dict[str, list[str]],
+        tasks: list[str],
+        modalities: list[str],
+    ) -> set[str]:
+        """Ids of datasets that can score above zero; everything else scores exactly 0."""
+        out: set[int] = set()
+        for term in [*queries, *(t for terms in aliases.values() for t in terms)]:
+            for field in ("id", "pretty_name", "tags", "description"):
+                out |= self.term_docs(field, term)
+        for task in tasks:
+            task = task.lower().strip()
+            if not task:
+                continue
+            out |= self.term_docs("blob", task)
+            out.update(self.tag_postings.get(f"task_categories:{task}", ()))
+            out.update(self.tag_postings.get(f"task_ids:{task}", ()))
+        for modality in modalities:
+            modality = modality.lower().strip()
+            if modality:
+                out.update(self.tag_postings.get(f"modality:{modality}", ()))
+        return {self.ids[pos] for pos in out}
+
+
+def _add_posting(postings: dict[str, Any], key: str, pos: int) -> None:
+    found = postings.setdefault(key, [])
+    if isinstance(found, set):
+        found.add(pos)
+    elif pos not in found:
+        found.append(pos)
+
+
+def _discard_posting(postings: dict[str, Any], key: str, pos: int) -> None:
+    found = postings.get(key)
+    if found is None or pos not in found:
+        return
+    found.remove(pos)
+    if not found:
+        del postings[key]
+
+
+def update_search_index(
+    previous_snapshot: str, catalog: dict[str, Any], changed: list[dict[str, Any]]
+) -> None:
+    """Apply a catalog delta to the persisted index, if it matches the old snapshot."""
+    path = CACHE_DIR / SEARCH_INDEX_FILE
+    index = SearchIndex.load(path, previous_snapshot)
+    if index is not None:
+        index.update(changed)
+        index.save(path, catalog["snapshot"])
+
+
+def load_search_index(catalog: dict[str, Any]) -> SearchIndex:
+    path = CACHE_DIR / SEARCH_INDEX_FILE
+    snapshot = catalog.get("snapshot") or catalog_snapshot_id(catalog["datasets"])
+    index = SearchIndex.load(path, snapshot)
+    if index is None:
+        index = SearchIndex.build(catalog["datasets"])
+        index.save(path, snapshot)
+    return index
+
+
 def score_dataset(
     dataset: dict[str, Any],
     queries: list[str],
     aliases: dict[str, list[str]],
     tasks: list[str],
     modalities: list[str],
+    index: SearchIndex | None = None,
 ) -> dict[str, Any]:
-    blob = dataset_search_blob(dataset)
-    fields = dataset_search_fields(dataset)
+    doc_id = dataset.get("id")
+    if index is not None and doc_id in index:
+
+        def match(field: str, term: str) -> bool:
+            return index.matches(doc_id, field, term)
+
+    else:
+        fields = dataset_search_fields(dataset)
+        fields["blob"] = dataset_search_blob(dataset)
+
+        def match(field: str, term: str) -> bool:
+            return matches_term(fields[field], term)
+
     task_tags = collect_prefixed_tags(dataset, ["task_categories:", "task_ids:"])
     modality_tags = collect_prefixed_tags(dataset, ["modality:"])
 
@@ -275,7 +838,9 @@ def score_dataset(
 
     for query in queries:
         q = query.lower().strip()
-        if q and any(matches_term(value, q) for value in fields.values()):
+        if q and any(
+            match(field, q) for field in ("id", "pretty_name", "tags", "description")
+        ):
             score += 3
             reasons.append(f"query:{query}")
 
@@ -284,10 +849,9 @@ def score_dataset(
         alias_score = 0
         for term in terms:
             strong_match = any(
-                matches_term(fields[field_name], term)
-                for field_name in ("id", "pretty_name", "tags")
+                match(field_name, term) for field_name in ("id", "pretty_name", "tags")
             )
-            desc_match = matches_term(fields["description"], term)
+            desc_match = match("description", term)
             if strong_match:
                 alias_score += 2
                 matched_terms.append(term)
@@ -308,7 +872,7 @@ def score_dataset(
             for tag in lower_task_tags
             if tag == f"task_categories:{task}" or tag == f"task_ids:{task}"
         ]
-        fuzzy = matches_term(blob, task)
+        fuzzy = match("blob", task)
         if exact:
             score += 5
             reasons.append(f"task:{task}")
@@ -344,24 +908,39 @@ def search_benchmarks(
     tasks: list[str],
     modalities: list[str],
     limit: int,
+    use_cache: bool = True,
+    **catalog_options: Any,
 ) -> list[dict[str, Any]]:
-    datasets = benchmark_catalog(limit=500)
     alias_map = expand_aliases(aliases)
-
-    results = [score_dataset(ds, queries, alias_map, tasks, modalities) for ds in datasets]
-
     active_filters = bool(queries or aliases or tasks or modalities)
-    if active_filters:
-        results = [row for row in results if row["score"] >= 2]
 
-    results.sort(
-        key=lambda row: (
-            -row["score"],
-            -(row["downloads"] or 0),
-            row["dataset_id"] or "",
+    if use_cache:
+        catalog = catalog_snapshot(**catalog_options)
+        datasets: Iterable[dict[str, Any]] = catalog["datasets"]
+        index = load_search_index(catalog) if active_filters else None
+    else:
+        datasets = iter_benchmark_catalog()
+        index = None
+
+    if index is not None:
+        # Only datasets with at least one posting hit can reach the score threshold.
+        candidates = index.candidates(queries, alias_map, tasks, modalities)
+        datasets = (
+            ds for ds in datasets if ds.get("id") in candidates or ds.get("id") not in index
         )
+
+    results: Iterable[dict[str, Any]] = (
+        score_dataset(ds, queries, alias_map, tasks, modalities, index=index) for ds in datasets
     )
-    return results[:limit]
+    if active_filters:
+        results = (row for row in results if row["score"] >= 2)
+
+    # nsmallest keeps only `limit` rows in memory and is stable, matching sort()[:limit].
+    return heapq.nsmallest(limit, results, key=search_rank_key)
+
+
+def search_rank_key(row: dict[str, Any]) -> tuple[int, int, str]:
+    return (-row["score"], -(row["downloads"] or 0), row["dataset_id"] or "")
 
 
 def parse_repo_id(repo_id: str) -> tuple[str, str]:
@@ -401,11 +980,111 @@ def get_leaderboard(repo_id: str, task_id: str | None = None) -> list[dict[str,
     return normalized
 
 
-def read_repo_ids_from_stdin() -> list[str]:
+def to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class LeaderboardPivot:
+    """Model x benchmark matrix built incrementally from normalized leaderboard rows.
+
+    Storage is columnar: model ids are interned to row positions and each benchmark
+    owns an array('d') of values indexed by those positions (NaN where a model has
+    no result), so hundreds of models across dozens of benchmarks stay small.
+    """
+
+    def __init__(self) -> None:
+        self.models: list[str] = []
+        self.model_index: dict[str, int] = {}
+        self.benchmarks: list[str] = []
+        self.columns: dict[str, array] = {}
+        self.lower_is_better: dict[str, bool] = {}
+
+    def add(self, row: dict[str, Any]) -> None:
+        model_id = row.get("model_id")
+        benchmark = row.get("dataset_id")
+        value = to_float(row.get("value"))
+        if not isinstance(model_id, str) or not isinstance(benchmark, str) or math.isnan(value):
+            return
+
+        pos = self.model_index.get(model_id)
+        if pos is None:
+            pos = self.model_index[model_id] = len(self.models)
+            self.models.append(model_id)
+
+        column = self.columns.get(benchmark)
+        if column is None:
+            column = self.columns[benchmark] = array("d")
+            self.benchmarks.append(benchmark)
+        if row.get("lower_is_better") is not None:
+            self.lower_is_better.setdefault(benchmark, bool(row["lower_is_better"]))
+
+        if len(column) <= pos:
+            column.extend([math.nan] * (pos + 1 - len(column)))
+        current = column[pos]
+        # A model can be listed more than once (e.g. several sources); keep its best.
+        if math.isnan(current) or self._better(benchmark, value, current):
+            column[pos] = value
+
+    def _better(self, benchmark: str, a: float, b: float) -> bool:
+        return a < b if self.lower_is_better.get(benchmark) else a > b
+
+    def mean_ranks(self) -> tuple[array, array]:
+        """Per model: mean of per-benchmark ranks (ties averaged) and benchmarks covered."""
+        rank_sum = array("d", [0.0]) * len(self.models)
+        rank_count = array("i", [0]) * len(self.models)
+        for benchmark in self.benchmarks:
+            column = self.columns[benchmark]
+            present = [pos for pos in range(len(column)) if not math.isnan(column[pos])]
+            lower = self.lower_is_better.get(benchmark, False)
+            present.sort(key=lambda pos: column[pos] if lower else -column[pos])
+            start = 0
+            while start < len(present):
+                end = start
+                while end + 1 < len(present) and column[present[end + 1]] == column[present[start]]:
+                    end += 1
+                rank = (start + end) / 2 + 1
+                for pos in present[start : end + 1]:
+                    rank_sum[pos] += rank
+                    rank_count[pos] += 1
+                start = end + 1
+        means = array(
+            "d", (total / count if count else math.inf for total, count in zip(rank_sum, rank_count))
+        )
+        return means, rank_count
+
+    def top(self, n: int | None) -> list[dict[str, Any]]:
+        means, counts = self.mean_ranks()
+        order = heapq.nsmallest(
+            len(self.models) if n is None else n,
+            range(len(self.models)),
+            key=lambda pos: (means[pos], -counts[pos], self.models[pos]),
+        )
+        out: list[dict[str, Any]] = []
+        for pos in order:
+            values = {}
+            for benchmark in self.benchmarks:
+                column = self.columns[benchmark]
+                value = column[pos] if pos < len(column) else math.nan
+                values[benchmark] = None if math.isnan(value) else value
+            out.append(
+                {
+                    "model_id": self.models[pos],
+                    "mean_rank": round(means[pos], 3),
+                    "benchmarks": counts[pos],
+                    "values": values,
+                }
+            )
+        return out
+
+
+def iter_repo_ids_from_stdin() -> Iterator[str]:
+    """Yield repo ids from stdin as each line arrives."""
     if sys.stdin.isatty():
-        return []
+        return
 
-    repo_ids: list[str] = []
     for raw_line in sys.stdin:
         line = raw_line.strip()
         if not line:
@@ -417,11 +1096,59 @@ def read_repo_ids_from_stdin() -> list[str]:
                 continue
             candidate = obj.get("dataset_id") or obj.get("id")
             if isinstance(candidate, str) and "/" in candidate:
-                repo_ids.append(candidate)
+                yield candidate
             continue
         if "/" in line:
-            repo_ids.append(line)
-    return repo_ids
+            yield line
+
+
+def unique(items: Iterable[str]) -> Iterator[str]:
+    seen: set[str] = set()
+    for item in items:
+        if item not in seen:
+            seen.add(item)
+            yield item
+
+
+def map_ordered(
+    fn: Callable[[str], list[dict[str, Any]]], items: Iterable[str], jobs: int
+) -> Iterator[list[dict[str, Any]]]:
+    """Yield fn(item) in input order while `items` may still be arriving.
+
+    A feeder thread submits work as soon as each item is read, so results are yielded
+    while the input (e.g. a pipe) is still open. At most 2 * jobs results are in
+    flight, which keeps memory flat for arbitrarily long inputs.
+    """
+    pool = ThreadPoolExecutor(max_workers=jobs)
+    slots = threading.Semaphore(jobs * 2)
+    pending: queue.Queue[Future[list[dict[str, Any]]] | BaseException | None] = queue.Queue()
+    stop = threading.Event()
+
+    def feed() -> None:
+        try:
+            for item in items:
+                slots.acquire()
+                if stop.is_set():
+                    return
+                pending.put(pool.submit(fn, item))
+        except BaseException as exc:  # surfaced to the consumer below
+            pending.put(exc)
+        finally:
+            pending.put(None)
+
+    threading.Thread(target=feed, daemon=True).start()
+    try:
+        while (entry := pending.get()) is not None:
+            if isinstance(entry, BaseException):
+                raise entry
+            try:
+                yield entry.result()
+            finally:
+                slots.release()
+    finally:
+        stop.set()
+        slots.release()
+        pool.shutdown(wait=False, cancel_futures=True)
 
 
 def print_json(data: Any) -> None:
@@ -429,9 +1156,11 @@ def print_json(data: Any) -> None:
     sys.stdout.write("\n")
 
 
-def print_ndjson(rows: list[dict[str, Any]]) -> None:
+def print_ndjson(rows: Iterable[dict[str, Any]], flush: bool = False) -> None:
     for row in rows:
         sys.stdout.write(json.dumps(row, ensure_ascii=False) + "\n")
+        if flush:
+            sys.stdout.flush()
 
 
 def print_search_table(rows: list[dict[str, Any]]) -> None:
@@ -476,6 +1205,69 @@ def print_leaderboard_table(rows: list[dict[str, Any]]) -> None:
         print("  ".join(v.ljust(w) for v, w in zip(values, widths)))
 
 
+def print_csv(header: list[str], records: Iterable[list[Any]]) -> None:
+    writer = csv.writer(sys.stdout, lineterminator="\n")
+    writer.writerow(header)
+    writer.writerows(records)
+
+
+def write_parquet(columns: dict[str, list[Any]], output: str | None) -> None:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise ValueError(
+            "--format parquet needs pyarrow (e.g. uv run --with pyarrow hf_benchmarks.py ...)"
+        ) from exc
+    table = pa.table(columns)
+    if output:
+        pq.write_table(table, output)
+    else:
+        pq.write_table(table, sys.stdout.buffer)
+
+
+def print_pivot(
+    pivot_rows: list[dict[str, Any]], benchmarks: list[str], fmt: str, output: str | None
+) -> None:
+    if fmt == "json":
+        print_json(pivot_rows)
+        return
+    if fmt == "ndjson":
+        print_ndjson(pivot_rows)
+        return
+
+    header = ["model_id", "mean_rank", "benchmarks", *benchmarks]
+    records = [
+        [row["model_id"], row["mean_rank"], row["benchmarks"], *(row["values"][b] for b in benchmarks)]
+        for row in pivot_rows
+    ]
+    if fmt == "csv":
+        print_csv(header, records)
+    elif fmt == "parquet":
+        write_parquet({name: [record[i] for record in records] for i, name in enumerate(header)}, output)
+    else:
+        print_pivot_table(header, records)
+
+
+def print_pivot_table(header: list[str], records: list[list[Any]]) -> None:
+    if not records:
+        print("No leaderboard rows returned.")
+        return
+
+    widths = [38, 9, 10] + [14] * (len(header) - 3)
+    labels = header[:3] + [name.split("/", 1)[-1] for name in header[3:]]
+    print("  ".join(shorten(h, w).ljust(w) for h, w in zip(labels, widths)))
+    print("  ".join("-" * w for w in widths))
+    for record in records:
+        values = [
+            shorten(record[0], widths[0]),
+            str(record[1]),
+            str(record[2]),
+            *("" if v is None else f"{v:.4g}" for v in record[3:]),
+        ]
+        print("  ".join(v.ljust(w) for v, w in zip(values, widths)))
+
+
 def build_parser() -> argparse.ArgumentParser:
     parser = FullHelpArgumentParser(
         prog="hf_benchmarks.py",
@@ -496,6 +1288,10 @@ def build_parser() -> argparse.ArgumentParser:
               3) Chain search -> leaderboard:
                    hf_benchmarks.py search --alias coding --format ndjson \\
                      | hf_benchmarks.py leaderboard --stdin --top 5 --format table
+
+              4) Compare models across benchmarks (mean rank):
+                   hf_benchmarks.py search --alias coding --format ndjson \\
+                     | hf_benchmarks.py leaderboard --stdin --pivot --pivot-top 10
             """
         ),
     )
@@ -546,6 +1342,40 @@ def build_parser() -> argparse.ArgumentParser:
         default="table",
         help="Output format (default: table).",
     )
+    search_parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=DEFAULT_CACHE_TTL,
+        help=(
+            f"Seconds a cached benchmark catalog is used without contacting the Hub "
+            f"(default: {DEFAULT_CACHE_TTL}). After that only datasets modified since the "
+            f"last sync are fetched. Cache dir: $HF_BENCHMARKS_CACHE or {CACHE_DIR}."
+        ),
+    )
+    cache_mode = search_parser.add_mutually_exclusive_group()
+    cache_mode.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore the cached catalog and download all of it again.",
+    )
+    cache_mode.add_argument(
+        "--offline",
+        action="store_true",
+        help="Only use the cached catalog, regardless of age. Fails if there is none.",
+    )
+    cache_mode.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=(
+            "Stream the live catalog page by page without reading or writing the cache. "
+            "Only the top --limit rows are held in memory."
+        ),
+    )
+    search_parser.add_argument(
+        "--cache-stats",
+        action="store_true",
+        help="Print catalog cache outcome and cumulative hit/revalidated/miss counts to stderr.",
+    )
 
     leaderboard_parser = subparsers.add_parser(
         "leaderboard",
@@ -572,11 +1402,36 @@ def build_parser() -> argparse.ArgumentParser:
         default=None,
         help="Only keep the top N results per leaderboard.",
     )
+    leaderboard_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help=f"Number of leaderboards fetched concurrently (default: {DEFAULT_JOBS}).",
+    )
+    leaderboard_parser.add_argument(
+        "--pivot",
+        action="store_true",
+        help=(
+            "Aggregate into a model x benchmark matrix and rank models by mean rank across "
+            "benchmarks (respecting lower_is_better)."
+        ),
+    )
+    leaderboard_parser.add_argument(
+        "--pivot-top",
+        type=int,
+        default=20,
+        help="With --pivot, number of models to emit (default: 20).",
+    )
     leaderboard_parser.add_argument(
         "--format",
-        choices=["table", "json", "ndjson"],
+        choices=["table", "json", "ndjson", "csv", "parquet"],
         default="table",
-        help="Output format (default: table).",
+        help="Output format (default: table). parquet requires pyarrow.",
+    )
+    leaderboard_parser.add_argument(
+        "--output",
+        default=None,
+        help="File to write --format parquet to (default: stdout).",
     )
 
     parser._search_parser = search_parser
@@ -586,13 +1441,28 @@ def build_parser() -> argparse.ArgumentParser:
 
 
 def run_search(args: argparse.Namespace) -> int:
+    cache_stats: dict[str, Any] = {}
     rows = search_benchmarks(
         queries=args.query,
         aliases=args.alias,
         tasks=args.task,
         modalities=args.modality,
         limit=args.limit,
+        use_cache=not args.no_cache,
+        ttl=args.cache_ttl,
+        refresh=args.refresh,
+        offline=args.offline,
+        stats=cache_stats,
     )
+    if args.cache_stats and cache_stats:
+        if "changed" in cache_stats:
+            cache_stats["outcome"] += f" +{cache_stats['changed']} changed"
+        print(
+            "catalog cache: {outcome} ({datasets} datasets, age {age_seconds}s) "
+            "hit={hit} revalidated={revalidated} delta={delta} miss={miss} "
+            "path={path}".format(**cache_stats),
+            file=sys.stderr,
+        )
 
     if args.format == "json":
         print_json(rows)
@@ -604,35 +1474,40 @@ def run_search(args: argparse.Namespace) -> int:
 
 
 def run_leaderboard(args: argparse.Namespace) -> int:
-    repo_ids = list(args.datasets)
+    repo_ids: Iterable[str] = args.datasets
     if args.stdin:
-        repo_ids.extend(read_repo_ids_from_stdin())
+        repo_ids = itertools.chain(repo_ids, iter_repo_ids_from_stdin())
+    repo_ids = unique(repo_ids)
 
-    deduped: list[str] = []
-    seen: set[str] = set()
-    for repo_id in repo_ids:
-        if repo_id not in seen:
-            deduped.append(repo_id)
-            seen.add(repo_id)
-    repo_ids = deduped
-
-    if not repo_ids:
+    first = next(repo_ids, None)
+    if first is None:
         print("Error: provide dataset ids or use --stdin.", file=sys.stderr)
         return 2
 
-    rows: list[dict[str, Any]] = []
-    for repo_id in repo_ids:
+    def fetch(repo_id: str) -> list[dict[str, Any]]:
         dataset_rows = get_leaderboard(repo_id, task_id=args.task_id)
-        if args.top is not None:
-            dataset_rows = dataset_rows[: args.top]
-        rows.extend(dataset_rows)
-
-    if args.format == "json":
-        print_json(rows)
+        return dataset_rows[: args.top] if args.top is not None else dataset_rows
+
+    results = map_ordered(fetch, itertools.chain([first], repo_ids), max(1, args.jobs))
+    rows = (row for dataset_rows in results for row in dataset_rows)
+
+    if args.pivot:
+        pivot = LeaderboardPivot()
+        for row in rows:
+            pivot.add(row)
+        print_pivot(pivot.top(args.pivot_top), pivot.benchmarks, args.format, args.output)
+    elif args.format == "csv":
+        print_csv(LEADERBOARD_FIELDS, ([row[key] for key in LEADERBOARD_FIELDS] for row in rows))
+    elif args.format == "parquet":
+        collected = list(rows)
+        write_parquet({key: [row[key] for row in collected] for key in LEADERBOARD_FIELDS}, args.output)
     elif args.format == "ndjson":
-        print_ndjson(rows)
+        # Stream: each leaderboard is written as soon as it and its predecessors are in.
+        print_ndjson(rows, flush=True)
+    elif args.format == "json":
+        print_json(list(rows))
     else:
-        print_leaderboard_table(rows)
+        print_leaderboard_table(list(rows))
     return 0
 
 
@@ -653,6 +1528,10 @@ def main() -> int:
     except ValueError as exc:
         print(f"Error: {exc}", file=sys.stderr)
         return 1
+    except BrokenPipeError:
+        # Downstream consumer (e.g. `head`) went away; stop quietly.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
 
 
 if __name__ == "__main__":
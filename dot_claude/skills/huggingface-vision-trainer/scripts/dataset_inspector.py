@@ -20,48 +20,271 @@ Usage with HF Jobs:
 """
 
 import argparse
+import atexit
+import gzip
+import hashlib
+import http.client
 import math
+import os
+import random
 import sys
+import tempfile
 import json
+import threading
+import time
 import urllib.request
 import urllib.parse
+from array import array
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict, Any, Tuple
 
+try:  # optional: lets the server send brotli-compressed responses
+    import brotli
+except ImportError:
+    brotli = None
+
+DATASETS_SERVER = os.getenv("HF_DATASETS_SERVER", "https://datasets-server.huggingface.co").rstrip("/")
+DEFAULT_CACHE_TTL = 86400
+DEFAULT_CACHE_MAX_MB = 256
+CACHE_DIR = os.getenv("HF_INSPECTOR_CACHE") or os.path.join(
+    os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "hf_dataset_inspector"
+)
+DEFAULT_TIMEOUT = 10
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+ACCEPT_ENCODING = "gzip, br" if brotli is not None else "gzip"
+IMAGE_COLUMNS = ("image", "img", "picture", "photo")
+BBOX_SLACK = 1.05  # boxes may overshoot the image by 5% before counting as out of bounds
+BBOX_FORMAT_LABELS = {
+    ("xyxy", False): "xyxy (Pascal VOC style)",
+    ("xywh", False): "xywh (COCO style)",
+    ("cxcywh", False): "cxcywh (YOLO style)",
+    ("xyxy", True): "xyxy_normalized",
+    ("xywh", True): "xywh_normalized",
+    ("cxcywh", True): "cxcywh_normalized",
+}
+
+_thread_local = threading.local()
+
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Inspect dataset format for vision model training")
-    parser.add_argument("--dataset", type=str, required=True, help="Dataset name")
+    parser.add_argument("--dataset", type=str, action="append",
+                        help="Dataset name (repeat to inspect several datasets concurrently as JSON lines)")
+    parser.add_argument("--datasets-file", type=str, default=None,
+                        help="File with one dataset id per line ('-' for stdin); implies batch JSON-lines output")
     parser.add_argument("--split", type=str, default="train", help="Dataset split (default: train)")
     parser.add_argument("--config", type=str, default="default", help="Dataset config name (default: default)")
     parser.add_argument("--preview", type=int, default=150, help="Max chars per field preview")
     parser.add_argument("--samples", type=int, default=5, help="Number of samples to fetch (default: 5)")
     parser.add_argument("--json-output", action="store_true", help="Output as JSON")
+    parser.add_argument("--revision", type=str, default="main",
+                        help="Dataset revision cached responses are keyed by (Datasets Server serves the latest; default: main)")
+    parser.add_argument("--cache-ttl", type=float, default=DEFAULT_CACHE_TTL,
+                        help=f"Seconds before cached API responses are refetched (default: {DEFAULT_CACHE_TTL})")
+    parser.add_argument("--cache-max-mb", type=int, default=DEFAULT_CACHE_MAX_MB,
+                        help=f"Size bound of the response cache in MB (default: {DEFAULT_CACHE_MAX_MB})")
+    cache_mode = parser.add_mutually_exclusive_group()
+    cache_mode.add_argument("--refresh", action="store_true", help="Ignore cached responses and refetch")
+    cache_mode.add_argument("--offline", action="store_true", help="Replay cached responses only; never touch the network")
+    cache_mode.add_argument("--no-cache", action="store_true", help="Neither read nor write the response cache")
+    parser.add_argument("--jobs", type=int, default=8, help="Datasets inspected concurrently in batch mode (default: 8)")
     return parser.parse_args()
 
 
+def auth_headers() -> Dict[str, str]:
+    """Bearer auth from HF_TOKEN (needed for gated/private datasets)"""
+    token = os.getenv("HF_TOKEN")
+    return {"Authorization": f"Bearer {token}"} if token else {}
+
+
+def _get_connection(scheme: str, netloc: str) -> http.client.HTTPConnection:
+    """Return this thread's keep-alive connection to netloc, opening it on first use"""
+    connections = getattr(_thread_local, "connections", None)
+    if connections is None:
+        connections = _thread_local.connections = {}
+    conn = connections.get((scheme, netloc))
+    if conn is None:
+        conn_cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        proxy = urllib.request.getproxies().get(scheme)
+        if proxy and not urllib.request.proxy_bypass(netloc):
+            conn = conn_cls(urllib.parse.urlsplit(proxy).netloc or proxy, timeout=DEFAULT_TIMEOUT)
+            conn.set_tunnel(netloc)
+        else:
+            conn = conn_cls(netloc, timeout=DEFAULT_TIMEOUT)
+        connections[(scheme, netloc)] = conn
+    return conn
+
+
+def _drop_connection(scheme: str, netloc: str) -> None:
+    conn = getattr(_thread_local, "connections", {}).pop((scheme, netloc), None)
+    if conn is not None:
+        conn.close()
+
+
+def _decode_body(body: bytes, content_encoding: str | None) -> bytes:
+    encoding = (content_encoding or "").strip().lower()
+    if encoding == "gzip":
+        return gzip.decompress(body)
+    if encoding == "br" and brotli is not None:
+        return brotli.decompress(body)
+    return body
+
+
+def _retry_delay(attempt: int, retry_after: str | None = None) -> float:
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), MAX_BACKOFF)
+    return min(RETRY_BACKOFF * (2 ** attempt), MAX_BACKOFF) * (0.5 + random.random() / 2)
+
+
 def api_request(url: str) -> Dict:
-    """Make API request to Datasets Server"""
-    try:
-        with urllib.request.urlopen(url, timeout=10) as response:
-            return json.loads(response.read().decode())
-    except urllib.error.HTTPError as e:
-        if e.code == 404:
+    """Make API request to Datasets Server (pooled keep-alive connection, retries on 429/5xx)"""
+    parts = urllib.parse.urlsplit(url)
+    target = parts.path + (f"?{parts.query}" if parts.query else "")
+    headers = {"Accept-Encoding": ACCEPT_ENCODING, **auth_headers()}
+    attempt = 0
+    while True:
+        try:
+            conn = _get_connection(parts.scheme, parts.netloc)
+            conn.request("GET", target, headers=headers)
+            response = conn.getresponse()
+            body = _decode_body(response.read(), response.getheader("Content-Encoding"))
+        except (http.client.HTTPException, OSError, EOFError) as e:
+            _drop_connection(parts.scheme, parts.netloc)
+            if attempt < MAX_RETRIES:
+                time.sleep(_retry_delay(attempt))
+                attempt += 1
+                continue
+            raise Exception(f"API request failed: {str(e)}")
+        if response.will_close:
+            _drop_connection(parts.scheme, parts.netloc)
+
+        if response.status in RETRY_STATUSES and attempt < MAX_RETRIES:
+            time.sleep(_retry_delay(attempt, response.getheader("Retry-After")))
+            attempt += 1
+            continue
+        if response.status == 404:
             return None
-        raise Exception(f"API request failed: {e.code} {e.reason}")
-    except Exception as e:
-        raise Exception(f"API request failed: {str(e)}")
+        if response.status >= 400:
+            raise Exception(f"API request failed: {response.status} {response.reason}")
+        try:
+            return json.loads(body.decode())
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise Exception(f"API request failed: invalid JSON ({e})")
+
+
+class ResponseCache:
+    """Content-addressed on-disk cache of Datasets Server responses.
+
+    Entries are keyed by a hash of (endpoint, dataset, config, split, offset, length,
+    revision), expire after `ttl` seconds unless `offline`, and are evicted least
+    recently used first once the directory grows past `max_bytes`.
+    """
+
+    def __init__(self, directory: str, ttl: float = DEFAULT_CACHE_TTL, max_bytes: int = DEFAULT_CACHE_MAX_MB << 20,
+                 offline: bool = False, refresh: bool = False):
+        self.directory, self.ttl, self.max_bytes = directory, ttl, max_bytes
+        self.offline, self.refresh = offline, refresh
+
+    @staticmethod
+    def digest(key: Dict[str, Any]) -> str:
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], f"{digest}.json")
 
+    def get(self, digest: str) -> Dict[str, Any] | None:
+        if self.refresh:
+            return None
+        path = self._path(digest)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not self.offline and time.time() - entry.get("fetched_at", 0) > self.ttl:
+            return None
+        try:
+            os.utime(path)  # mtime doubles as the LRU clock
+        except OSError:
+            pass
+        return entry
+
+    def put(self, digest: str, entry: Dict[str, Any]) -> None:
+        path = self._path(digest)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump({**entry, "fetched_at": time.time()}, f)
+            os.replace(tmp, path)
+        except OSError:
+            pass  # caching is best-effort
+
+    def evict(self) -> None:
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, os.path.join(root, name)))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+
+response_cache: ResponseCache | None = None
+
+
+def configure_cache(args) -> None:
+    """Install the process-wide response cache from CLI flags; evicts on exit"""
+    global response_cache
+    if args.no_cache:
+        return
+    response_cache = ResponseCache(CACHE_DIR, ttl=args.cache_ttl, max_bytes=args.cache_max_mb << 20,
+                                   offline=args.offline, refresh=args.refresh)
+    atexit.register(response_cache.evict)
+
+
+def cached_request(url: str, key: Dict[str, Any]) -> Dict:
+    """api_request through the response cache (if configured); never caches 404s"""
+    if response_cache is None:
+        return api_request(url)
+    digest = ResponseCache.digest({"server": DATASETS_SERVER, **key})
+    entry = response_cache.get(digest)
+    if entry is not None:
+        return entry["data"]
+    if response_cache.offline:
+        raise Exception(f"API request failed: {url} is not cached (offline mode)")
+    data = api_request(url)
+    if data is not None:
+        response_cache.put(digest, {"key": key, "data": data})
+    return data
 
-def get_splits(dataset: str) -> Dict:
+
+def get_splits(dataset: str, revision: str = "main") -> Dict:
     """Get available splits for dataset"""
-    url = f"https://datasets-server.huggingface.co/splits?dataset={urllib.parse.quote(dataset)}"
-    return api_request(url)
+    url = f"{DATASETS_SERVER}/splits?dataset={urllib.parse.quote(dataset)}"
+    return cached_request(url, {"endpoint": "splits", "dataset": dataset, "revision": revision})
 
 
-def get_rows(dataset: str, config: str, split: str, offset: int = 0, length: int = 5) -> Dict:
+def get_rows(dataset: str, config: str, split: str, offset: int = 0, length: int = 5, revision: str = "main") -> Dict:
     """Get rows from dataset"""
-    url = f"https://datasets-server.huggingface.co/rows?dataset={urllib.parse.quote(dataset)}&config={config}&split={split}&offset={offset}&length={length}"
-    return api_request(url)
+    url = f"{DATASETS_SERVER}/rows?dataset={urllib.parse.quote(dataset)}&config={config}&split={split}&offset={offset}&length={length}"
+    key = {"endpoint": "rows", "dataset": dataset, "config": config, "split": split,
+           "offset": offset, "length": length, "revision": revision}
+    return cached_request(url, key)
 
 
 def find_columns(columns: List[str], patterns: List[str]) -> List[str]:
@@ -69,58 +292,123 @@ def find_columns(columns: List[str], patterns: List[str]) -> List[str]:
     return [c for c in columns if any(p in c.lower() for p in patterns)]
 
 
-def detect_bbox_format(bbox: List[float], image_size: Tuple[int, int] = None) -> str:
+def _bbox_evidence(boxes: List[List[float]], image_sizes: List[Tuple[int, int] | None]) -> Dict[str, int]:
+    pairs = [(box, size) for box, size in zip(boxes, image_sizes) if all(math.isfinite(v) for v in box)]
+    normalized = bool(pairs) and all(0 <= v <= 1 for box, _ in pairs for v in box)
+    counts = {"boxes": len(pairs), "normalized": normalized, "not_xyxy": 0, "xyxy_votes": 0, "xywh_votes": 0,
+              "xywh_exceeds": 0, "not_cxcywh": 0}
+    for (a, b, c, d), size in pairs:
+        img_w, img_h = (1, 1) if normalized else size or (math.nan, math.nan)
+        not_xyxy = c < a or d < b
+        xywh_exceeds = a + c > img_w * BBOX_SLACK or b + d > img_h * BBOX_SLACK
+        xyxy_exceeds = c > img_w * BBOX_SLACK or d > img_h * BBOX_SLACK
+        tolerance = 1.0 if math.isnan(img_w) else 0.01 * img_w
+        counts["not_xyxy"] += not_xyxy
+        counts["xyxy_votes"] += not not_xyxy and xywh_exceeds and not xyxy_exceeds
+        counts["xywh_votes"] += not_xyxy or (xyxy_exceeds and not xywh_exceeds)
+        counts["xywh_exceeds"] += xywh_exceeds
+        counts["not_cxcywh"] += a - c / 2 < -tolerance or b - d / 2 < -tolerance
+    return counts
+
+
+def detect_bbox_formats(boxes: List[List[float]], image_sizes: List[Tuple[int, int] | None]) -> Dict[str, Any]:
     """
-    Detect bounding box format based on values and optionally image dimensions.
+    Detect the bounding box format of a whole sample of boxes in one pass.
     Common formats:
     - [x_min, y_min, x_max, y_max] - XYXY (Pascal VOC)
     - [x_min, y_min, width, height] - XYWH (COCO)
-    - [x_center, y_center, width, height] - CXCYWH (YOLO normalized)
+    - [x_center, y_center, width, height] - CXCYWH (YOLO)
+
+    `boxes` is N x 4 and `image_sizes` the (width, height) of each box's image, or
+    None when unknown. A box votes xywh when its 3rd/4th value is below its 1st/2nd
+    (impossible for xyxy) or when only the xyxy reading overshoots the image, and
+    votes xyxy when only the xywh reading does. Among xywh-style samples, center
+    format is chosen when the corner reading overshoots but the center reading
+    never puts an edge below zero. Confidence is the share of deciding boxes that
+    agree with the result (0.0 when no box decides and xyxy is assumed).
     """
+    evidence = _bbox_evidence(boxes, image_sizes)
+    xyxy, xywh = evidence["xyxy_votes"], evidence["xywh_votes"]
+    fmt = "xywh" if xywh > xyxy else "xyxy"
+    if fmt == "xywh" and evidence["xywh_exceeds"] and not evidence["not_cxcywh"]:
+        fmt = "cxcywh"
+    decisive = xyxy + xywh
+    return {
+        "format": BBOX_FORMAT_LABELS[(fmt, evidence["normalized"])],
+        "confidence": round((xywh if fmt != "xyxy" else xyxy) / decisive, 3) if decisive else 0.0,
+        "evidence": evidence,
+    }
+
+
+def detect_bbox_format(bbox: List[float], image_size: Tuple[int, int] = None) -> str:
+    """Detect the bounding box format of a single box (see detect_bbox_formats)"""
     if len(bbox) != 4:
         return "unknown (not 4 values)"
+    return detect_bbox_formats([bbox], [image_size])["format"]
 
-    a, b, c, d = bbox
 
-    is_normalized = all(0 <= v <= 1 for v in bbox)
+def _deep_sizeof(obj: Any, seen: set = None) -> int:
+    """Approximate retained size of a JSON-like value (container plus contents)"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(_deep_sizeof(v, seen) for v in obj)
+    return size
 
-    if c < a or d < b:
-        if is_normalized:
-            return "xywh_normalized"
-        return "xywh (COCO style)"
 
-    # c > a and d > b — ambiguous between xyxy and xywh.
-    # Use image dimensions to disambiguate when available.
-    if image_size is not None:
-        img_w, img_h = image_size
-        # If interpreting as xywh, right edge = a + c; if that overshoots the
-        # image while c alone fits, the format is more likely xyxy.
-        xywh_exceeds = (a + c > img_w * 1.05) or (b + d > img_h * 1.05)
-        xyxy_exceeds = (c > img_w * 1.05) or (d > img_h * 1.05)
-        if xywh_exceeds and not xyxy_exceeds:
-            return "xyxy (Pascal VOC style)"
-        if xyxy_exceeds and not xywh_exceeds:
-            return "xywh (COCO style)"
-
-    if is_normalized:
-        return "xyxy_normalized"
-    return "xyxy (Pascal VOC style)"
-
-
-def _extract_image_size(row: Dict) -> Tuple[int, int] | None:
-    """Try to extract (width, height) from the image column returned by Datasets Server."""
-    for col in ("image", "img", "picture", "photo"):
-        img = row.get(col)
-        if isinstance(img, dict):
-            w = img.get("width")
-            h = img.get("height")
-            if isinstance(w, (int, float)) and isinstance(h, (int, float)):
-                return (int(w), int(h))
-    return None
+class RowBatch:
+    """Fetched rows converted once into per-column lists.
 
+    Checkers read whole columns instead of re-walking the `[{"row": {...}}]` dicts.
+    `truncated[name]` holds the row positions whose cell Datasets Server truncated,
+    and `nbytes` the per-column memory footprint measured when the batch was built.
+    """
 
-def analyze_annotations(sample_rows: List[Dict], annotation_cols: List[str]) -> Dict[str, Any]:
-    """Analyze annotation structure from sample rows"""
+    def __init__(self, rows: List[Dict], features: List[Dict] = None):
+        self.num_rows = len(rows)
+        self.names = list(dict.fromkeys(name for entry in rows for name in entry["row"]))
+        self.columns = {name: [entry["row"].get(name) for entry in rows] for name in self.names}
+        self.truncated: Dict[str, set] = {name: set() for name in self.names}
+        for i, entry in enumerate(rows):
+            for name in entry.get("truncated_cells") or ():
+                if name in self.truncated:
+                    self.truncated[name].add(i)
+        self.features = features or []
+        self.nbytes = {name: _deep_sizeof(values) for name, values in self.columns.items()}
+        self._image_sizes = None
+
+    def memory_report(self) -> Dict[str, Any]:
+        return {"rows": self.num_rows, "total_bytes": sum(self.nbytes.values()), "columns": dict(self.nbytes)}
+
+    def image_sizes(self) -> List[Tuple[int, int] | None]:
+        """(width, height) per row from the first image column that reports dimensions"""
+        if self._image_sizes is None:
+            sizes: List[Tuple[int, int] | None] = [None] * self.num_rows
+            for col in IMAGE_COLUMNS:
+                for i, img in enumerate(self.columns.get(col, ())):
+                    if sizes[i] is None and isinstance(img, dict):
+                        w, h = img.get("width"), img.get("height")
+                        if isinstance(w, (int, float)) and isinstance(h, (int, float)):
+                            sizes[i] = (int(w), int(h))
+            self._image_sizes = sizes
+        return self._image_sizes
+
+
+def format_bytes(n: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+def analyze_annotations(batch: RowBatch, annotation_cols: List[str]) -> Dict[str, Any]:
+    """Analyze annotation structure in one pass over the annotation column"""
     if not annotation_cols:
         return {"found": False}
 
@@ -129,23 +417,32 @@ def analyze_annotations(sample_rows: List[Dict], annotation_cols: List[str]) ->
         "found": True,
         "column": annotation_col,
         "sample_structures": [],
-        "bbox_formats": [],
         "categories_found": [],
+        "bbox_formats": [],  # format of each annotated row's first box, judged on its own
         "avg_objects_per_image": 0,
         "max_objects": 0,
-        "min_objects": float('inf'),
+        "min_objects": 0,
     }
 
-    total_objects = 0
+    object_counts = array("l")  # objects per annotated row that has boxes
+    boxes: List[List[float]] = []
+    box_image_sizes: List[Tuple[int, int] | None] = []
     valid_samples = 0
 
-    for row in sample_rows:
-        ann = row["row"].get(annotation_col)
+    def add_boxes(candidates: List, image_size: Tuple[int, int] | None) -> None:
+        first = candidates[0] if candidates else None
+        if isinstance(first, (list, tuple)) and all(isinstance(v, (int, float)) for v in first):
+            annotations_info["bbox_formats"].append(detect_bbox_format(first, image_size))
+        for box in candidates:
+            if isinstance(box, (list, tuple)) and len(box) == 4 and all(isinstance(v, (int, float)) for v in box):
+                boxes.append(box)
+                box_image_sizes.append(image_size)
+
+    for ann, image_size in zip(batch.columns.get(annotation_col, ()), batch.image_sizes()):
         if not ann:
             continue
 
         valid_samples += 1
-        image_size = _extract_image_size(row["row"])
 
         # Check if it's a list of annotations or a dict
         if isinstance(ann, dict):
@@ -157,26 +454,16 @@ def analyze_annotations(sample_rows: List[Dict], annotation_cols: List[str]) ->
 
             # Check for bounding boxes
             if "bbox" in ann or "bboxes" in ann:
-                bbox_key = "bbox" if "bbox" in ann else "bboxes"
-                bboxes = ann[bbox_key]
+                bboxes = ann["bbox" if "bbox" in ann else "bboxes"]
                 if isinstance(bboxes, list) and len(bboxes) > 0:
                     if isinstance(bboxes[0], list):
                         # Multiple bboxes
-                        num_objects = len(bboxes)
-                        total_objects += num_objects
-                        annotations_info["max_objects"] = max(annotations_info["max_objects"], num_objects)
-                        annotations_info["min_objects"] = min(annotations_info["min_objects"], num_objects)
-
-                        # Analyze first bbox format
-                        bbox_format = detect_bbox_format(bboxes[0], image_size)
-                        annotations_info["bbox_formats"].append(bbox_format)
+                        object_counts.append(len(bboxes))
+                        add_boxes(bboxes, image_size)
                     else:
                         # Single bbox
-                        total_objects += 1
-                        annotations_info["max_objects"] = max(annotations_info["max_objects"], 1)
-                        annotations_info["min_objects"] = min(annotations_info["min_objects"], 1)
-                        bbox_format = detect_bbox_format(bboxes, image_size)
-                        annotations_info["bbox_formats"].append(bbox_format)
+                        object_counts.append(1)
+                        add_boxes([bboxes], image_size)
 
             # Check for categories/classes
             for key in ["category", "categories", "label", "labels", "class", "classes", "category_id"]:
@@ -199,48 +486,39 @@ def analyze_annotations(sample_rows: List[Dict], annotation_cols: List[str]) ->
 
             if ann and isinstance(ann[0], dict):
                 sample_structure["item_keys"] = list(ann[0].keys())
+                object_counts.append(len(ann))
 
-                # Count objects
-                num_objects = len(ann)
-                total_objects += num_objects
-                annotations_info["max_objects"] = max(annotations_info["max_objects"], num_objects)
-                annotations_info["min_objects"] = min(annotations_info["min_objects"], num_objects)
-
-                # Check first annotation
+                add_boxes([item["bbox"] for item in ann if isinstance(item, dict) and "bbox" in item], image_size)
                 first_ann = ann[0]
-                if "bbox" in first_ann:
-                    bbox_format = detect_bbox_format(first_ann["bbox"], image_size)
-                    annotations_info["bbox_formats"].append(bbox_format)
 
                 # Check for categories
                 for key in ["category", "label", "class", "category_id"]:
                     if key in first_ann:
-                        for item in ann:
-                            if key in item:
-                                annotations_info["categories_found"].append(str(item[key]))
+                        annotations_info["categories_found"].extend(str(item[key]) for item in ann if key in item)
 
             annotations_info["sample_structures"].append(sample_structure)
 
     if valid_samples > 0:
-        annotations_info["avg_objects_per_image"] = round(total_objects / valid_samples, 2)
-
-    if annotations_info["min_objects"] == float('inf'):
-        annotations_info["min_objects"] = 0
+        annotations_info["avg_objects_per_image"] = round(sum(object_counts) / valid_samples, 2)
+    if object_counts:
+        annotations_info["max_objects"] = max(object_counts)
+        annotations_info["min_objects"] = min(object_counts)
 
     # Get unique categories
     annotations_info["categories_found"] = list(set(annotations_info["categories_found"]))
     annotations_info["num_classes"] = len(annotations_info["categories_found"])
 
-    # Get most common bbox format
-    if annotations_info["bbox_formats"]:
-        from collections import Counter
-        format_counts = Counter(annotations_info["bbox_formats"])
-        annotations_info["primary_bbox_format"] = format_counts.most_common(1)[0][0]
+    # Classify every sampled box at once
+    if boxes:
+        detected = detect_bbox_formats(boxes, box_image_sizes)
+        annotations_info["primary_bbox_format"] = detected["format"]
+        annotations_info["bbox_format_confidence"] = detected["confidence"]
+        annotations_info["bbox_evidence"] = detected["evidence"]
 
     return annotations_info
 
 
-def check_image_classification_compatibility(columns: List[str], sample_rows: List[Dict], features: List[Dict]) -> Dict[str, Any]:
+def check_image_classification_compatibility(columns: List[str], batch: RowBatch, features: List[Dict]) -> Dict[str, Any]:
     """Check image classification dataset compatibility"""
 
     image_cols = find_columns(columns, ["image", "img", "picture", "photo"])
@@ -274,11 +552,7 @@ def check_image_classification_compatibility(columns: List[str], sample_rows: Li
 
         # Discover unique labels from samples if ClassLabel info wasn't in features
         if "num_classes" not in label_info:
-            unique = set()
-            for row in sample_rows:
-                val = row["row"].get(label_col)
-                if val is not None:
-                    unique.add(val)
+            unique = {val for val in batch.columns.get(label_col, ()) if val is not None}
             label_info["sample_unique_labels"] = sorted(unique, key=str)[:20]
             label_info["sample_unique_count"] = len(unique)
 
@@ -293,7 +567,7 @@ def check_image_classification_compatibility(columns: List[str], sample_rows: Li
     }
 
 
-def check_object_detection_compatibility(columns: List[str], sample_rows: List[Dict]) -> Dict[str, Any]:
+def check_object_detection_compatibility(columns: List[str], batch: RowBatch) -> Dict[str, Any]:
     """Check object detection dataset compatibility"""
 
     # Find image column
@@ -305,7 +579,7 @@ def check_object_detection_compatibility(columns: List[str], sample_rows: List[D
     has_annotations = len(annotation_cols) > 0
 
     # Analyze annotations
-    annotations_info = analyze_annotations(sample_rows, annotation_cols) if has_annotations else {"found": False}
+    annotations_info = analyze_annotations(batch, annotation_cols) if has_annotations else {"found": False}
 
     # Check for separate bbox and category columns
     bbox_cols = find_columns(columns, ["bbox", "bboxes", "boxes"])
@@ -326,7 +600,7 @@ def check_object_detection_compatibility(columns: List[str], sample_rows: List[D
     }
 
 
-def check_sam_segmentation_compatibility(columns: List[str], sample_rows: List[Dict], features: List[Dict]) -> Dict[str, Any]:
+def check_sam_segmentation_compatibility(columns: List[str], batch: RowBatch, features: List[Dict]) -> Dict[str, Any]:
     """Check SAM/SAM2 segmentation dataset compatibility.
 
     A valid SAM segmentation dataset needs:
@@ -354,8 +628,7 @@ def check_sam_segmentation_compatibility(columns: List[str], sample_rows: List[D
 
     # Try JSON prompt column first
     if prompt_cols:
-        for row in sample_rows:
-            raw = row["row"].get(prompt_cols[0])
+        for raw, image_size in zip(batch.columns[prompt_cols[0]], batch.image_sizes()):
             if raw is None:
                 continue
             parsed = raw if isinstance(raw, dict) else _try_json(raw)
@@ -368,7 +641,7 @@ def check_sam_segmentation_compatibility(columns: List[str], sample_rows: List[D
                     prompt_info["prompt_type"] = "bbox"
                     prompt_info["source"] = f"JSON column '{prompt_cols[0]}'"
                     bbox = parsed.get("bbox") or parsed.get("box")
-                    prompt_info["bbox_valid"] = _validate_bbox(bbox, _extract_image_size(row["row"]))
+                    prompt_info["bbox_valid"] = _validate_bbox(bbox, image_size)
                     break
                 elif "point" in parsed or "points" in parsed:
                     prompt_info["has_prompt"] = True
@@ -380,10 +653,9 @@ def check_sam_segmentation_compatibility(columns: List[str], sample_rows: List[D
         prompt_info["has_prompt"] = True
         prompt_info["prompt_type"] = "bbox"
         prompt_info["source"] = f"column '{bbox_cols[0]}'"
-        for row in sample_rows:
-            bbox = row["row"].get(bbox_cols[0])
+        for bbox, image_size in zip(batch.columns[bbox_cols[0]], batch.image_sizes()):
             if bbox is not None:
-                prompt_info["bbox_valid"] = _validate_bbox(bbox, _extract_image_size(row["row"]))
+                prompt_info["bbox_valid"] = _validate_bbox(bbox, image_size)
                 break
 
     if not prompt_info["has_prompt"] and point_cols:
@@ -465,7 +737,30 @@ def generate_mapping_code(info: Dict[str, Any]) -> str:
         ann_col = ann_info.get("column")
         bbox_format = ann_info.get("primary_bbox_format", "unknown")
 
-        if "coco" in bbox_format.lower() or "xywh" in bbox_format.lower():
+        if "cxcywh" in bbox_format.lower():
+            # Need to convert from center format to XYWH; normalized boxes also need the image size
+            image_col = info['image_columns'][0] if info['image_columns'] else 'image'
+            scale = f"example['{image_col}'].size" if "normalized" in bbox_format else "(1, 1)"
+            return f"""# Convert from CXCYWH (YOLO, box centers) to XYWH (COCO) format
+def to_coco(box, width, height):
+    cx, cy, w, h = box
+    return [(cx - w / 2) * width, (cy - h / 2) * height, w * width, h * height]
+
+def convert_to_coco_format(example):
+    width, height = {scale}
+    annotations = example['{ann_col}']
+    if isinstance(annotations, list):
+        for ann in annotations:
+            if 'bbox' in ann:
+                ann['bbox'] = to_coco(ann['bbox'], width, height)
+    elif isinstance(annotations, dict) and 'bbox' in annotations:
+        bbox = annotations['bbox']
+        if isinstance(bbox, list) and len(bbox) > 0 and isinstance(bbox[0], list):
+            annotations['bbox'] = [to_coco(box, width, height) for box in bbox]
+    return example
+
+dataset = dataset.map(convert_to_coco_format)"""
+        elif "coco" in bbox_format.lower() or "xywh" in bbox_format.lower():
             # Already COCO format
             return f"""# Dataset appears to be in COCO format (xywh)
 # Image column: {info['image_columns'][0] if info['image_columns'] else 'image'}
@@ -543,95 +838,157 @@ def format_value_preview(value: Any, max_chars: int) -> str:
         return preview[:max_chars] + ("..." if len(preview) > max_chars else "")
 
 
+def fetch_sample(dataset: str, args, log=print) -> Dict[str, Any]:
+    """Resolve config/split and fetch sample rows; raises Exception with a printable message"""
+    # Get splits info
+    splits_data = get_splits(dataset, args.revision)
+    if not splits_data or "splits" not in splits_data:
+        raise Exception(f"Could not fetch splits for dataset '{dataset}'\n"
+                        f"       Dataset may not exist or is not accessible via Datasets Server API")
+
+    # Find the right config
+    available_configs = set()
+    split_found = False
+    config_to_use = args.config
+
+    for split_info in splits_data["splits"]:
+        available_configs.add(split_info["config"])
+        if split_info["config"] == args.config and split_info["split"] == args.split:
+            split_found = True
+
+    # If default config not found, try first available
+    if not split_found and available_configs:
+        config_to_use = list(available_configs)[0]
+        log(f"Config '{args.config}' not found, trying '{config_to_use}'...")
+
+    # Get rows
+    rows_data = get_rows(dataset, config_to_use, args.split, offset=0, length=args.samples, revision=args.revision)
+
+    if not rows_data or "rows" not in rows_data:
+        raise Exception(f"Could not fetch rows for dataset '{dataset}'\n"
+                        f"       Split '{args.split}' may not exist\n"
+                        f"       Available configs: {', '.join(sorted(available_configs))}")
+
+    rows = rows_data["rows"]
+    if not rows:
+        raise Exception(f"No rows found in split '{args.split}'")
+
+    # Get total count if available
+    total_examples = "Unknown"
+    for split_info in splits_data["splits"]:
+        if split_info["config"] == config_to_use and split_info["split"] == args.split:
+            total_examples = f"{split_info.get('num_examples', 'Unknown'):,}" if isinstance(split_info.get('num_examples'), int) else "Unknown"
+            break
+
+    return {
+        "config": config_to_use,
+        "rows": rows,
+        "batch": RowBatch(rows, rows_data.get("features", [])),
+        # Extract column info from first row
+        "first_row": rows[0]["row"],
+        "columns": list(rows[0]["row"].keys()),
+        "features": rows_data.get("features", []),
+        "total_examples": total_examples,
+    }
+
+
+def inspect_dataset(dataset: str, args, log=print) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Fetch a sample and run every check; returns (JSON result, fetched sample)"""
+    sample = fetch_sample(dataset, args, log)
+    columns, batch, features = sample["columns"], sample["batch"], sample["features"]
+
+    # Run compatibility checks
+    od_info = check_object_detection_compatibility(columns, batch)
+    ic_info = check_image_classification_compatibility(columns, batch, features)
+    sam_info = check_sam_segmentation_compatibility(columns, batch, features)
+
+    result = {
+        "dataset": dataset,
+        "config": sample["config"],
+        "split": args.split,
+        "total_examples": sample["total_examples"],
+        "columns": columns,
+        "features": [{"name": f["name"], "type": f["type"]} for f in features] if features else [],
+        "sample_memory": batch.memory_report(),
+        "object_detection_compatibility": od_info,
+        "image_classification_compatibility": ic_info,
+        "sam_segmentation_compatibility": sam_info,
+    }
+    return result, sample
+
+
+def read_dataset_ids(path: str) -> List[str]:
+    """One dataset id per line ('-' for stdin); blank lines and # comments are ignored"""
+    handle = sys.stdin if path == "-" else open(path)
+    try:
+        return [line.split("#", 1)[0].strip() for line in handle if line.split("#", 1)[0].strip()]
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+
+def inspect_many(datasets: List[str], args) -> int:
+    """Inspect datasets concurrently, printing one JSON line per dataset as each finishes.
+
+    Worker threads keep their keep-alive connections across datasets, so the
+    Datasets Server is reached over a small pool of reused sockets. Returns the
+    number of datasets that failed.
+    """
+    def run(dataset: str) -> Dict[str, Any]:
+        try:
+            return inspect_dataset(dataset, args, log=lambda message: print(message, file=sys.stderr))[0]
+        except Exception as e:
+            return {"dataset": dataset, "error": " ".join(str(e).split())}
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(args.jobs, len(datasets)))) as pool:
+        for future in as_completed([pool.submit(run, dataset) for dataset in datasets]):
+            result = future.result()
+            failed += "error" in result
+            print(json.dumps(result), flush=True)
+    return failed
+
+
 def main():
     args = parse_args()
+    configure_cache(args)
+
+    datasets = list(dict.fromkeys((args.dataset or []) + (read_dataset_ids(args.datasets_file) if args.datasets_file else [])))
+    if not datasets:
+        print("ERROR: Pass --dataset (repeatable) or --datasets-file")
+        sys.exit(1)
+    if len(datasets) > 1:
+        sys.exit(1 if inspect_many(datasets, args) else 0)
 
     print(f"Fetching dataset info via Datasets Server API...")
 
     try:
-        # Get splits info
-        splits_data = get_splits(args.dataset)
-        if not splits_data or "splits" not in splits_data:
-            print(f"ERROR: Could not fetch splits for dataset '{args.dataset}'")
-            print(f"       Dataset may not exist or is not accessible via Datasets Server API")
-            sys.exit(1)
-
-        # Find the right config
-        available_configs = set()
-        split_found = False
-        config_to_use = args.config
-
-        for split_info in splits_data["splits"]:
-            available_configs.add(split_info["config"])
-            if split_info["config"] == args.config and split_info["split"] == args.split:
-                split_found = True
-
-        # If default config not found, try first available
-        if not split_found and available_configs:
-            config_to_use = list(available_configs)[0]
-            print(f"Config '{args.config}' not found, trying '{config_to_use}'...")
-
-        # Get rows
-        rows_data = get_rows(args.dataset, config_to_use, args.split, offset=0, length=args.samples)
-
-        if not rows_data or "rows" not in rows_data:
-            print(f"ERROR: Could not fetch rows for dataset '{args.dataset}'")
-            print(f"       Split '{args.split}' may not exist")
-            print(f"       Available configs: {', '.join(sorted(available_configs))}")
-            sys.exit(1)
-
-        rows = rows_data["rows"]
-        if not rows:
-            print(f"ERROR: No rows found in split '{args.split}'")
-            sys.exit(1)
-
-        # Extract column info from first row
-        first_row = rows[0]["row"]
-        columns = list(first_row.keys())
-        features = rows_data.get("features", [])
-
-        # Get total count if available
-        total_examples = "Unknown"
-        for split_info in splits_data["splits"]:
-            if split_info["config"] == config_to_use and split_info["split"] == args.split:
-                total_examples = f"{split_info.get('num_examples', 'Unknown'):,}" if isinstance(split_info.get('num_examples'), int) else "Unknown"
-                break
-
+        result, sample = inspect_dataset(datasets[0], args)
     except Exception as e:
         print(f"ERROR: {str(e)}")
         sys.exit(1)
 
-    # Run compatibility checks
-    od_info = check_object_detection_compatibility(columns, rows)
-    ic_info = check_image_classification_compatibility(columns, rows, features)
-    sam_info = check_sam_segmentation_compatibility(columns, rows, features)
-
     # JSON output mode
     if args.json_output:
-        result = {
-            "dataset": args.dataset,
-            "config": config_to_use,
-            "split": args.split,
-            "total_examples": total_examples,
-            "columns": columns,
-            "features": [{"name": f["name"], "type": f["type"]} for f in features] if features else [],
-            "object_detection_compatibility": od_info,
-            "image_classification_compatibility": ic_info,
-            "sam_segmentation_compatibility": sam_info,
-        }
         print(json.dumps(result, indent=2))
         sys.exit(0)
 
+    rows, columns, features, first_row = sample["rows"], sample["columns"], sample["features"], sample["first_row"]
+    od_info = result["object_detection_compatibility"]
+    ic_info = result["image_classification_compatibility"]
+    sam_info = result["sam_segmentation_compatibility"]
+
     # Human-readable output optimized for LLM parsing
     print("=" * 80)
     print(f"VISION DATASET INSPECTION")
     print("=" * 80)
 
-    print(f"\nDataset: {args.dataset}")
-    print(f"Config: {config_to_use}")
+    print(f"\nDataset: {result['dataset']}")
+    print(f"Config: {result['config']}")
     print(f"Split: {args.split}")
-    print(f"Total examples: {total_examples}")
+    print(f"Total examples: {result['total_examples']}")
     print(f"Samples fetched: {len(rows)}")
+    print(f"Sample memory: {format_bytes(result['sample_memory']['total_bytes'])} in {len(sample['batch'].names)} columns")
 
     print(f"\n{'COLUMNS':-<80}")
     if features:
@@ -707,7 +1064,8 @@ def main():
             print(f"\n  Annotation Details:")
             print(f"    • Column: {ann_info['column']}")
             if ann_info.get("primary_bbox_format"):
-                print(f"    • BBox Format: {ann_info['primary_bbox_format']}")
+                print(f"    • BBox Format: {ann_info['primary_bbox_format']} "
+                      f"(confidence {ann_info['bbox_format_confidence']:.0%} over {ann_info['bbox_evidence']['boxes']} boxes)")
             if ann_info.get("num_classes", 0) > 0:
                 print(f"    • Number of Classes: {ann_info['num_classes']}")
                 print(f"    • Classes: {', '.join(ann_info['categories_found'][:10])}")
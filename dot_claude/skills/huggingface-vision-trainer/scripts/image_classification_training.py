@@ -14,26 +14,23 @@
 
 """Fine-tuning any Transformers or timm model supported by AutoModelForImageClassification using the Trainer API."""
 
+import json
 import logging
+import math
 import os
 import sys
+import time
 from dataclasses import dataclass, field
 from functools import partial
 from typing import Any
 
 import evaluate
 import numpy as np
+import PIL.Image
 import torch
 from datasets import load_dataset
-from torchvision.transforms import (
-    CenterCrop,
-    Compose,
-    Normalize,
-    RandomHorizontalFlip,
-    RandomResizedCrop,
-    Resize,
-    ToTensor,
-)
+import torchvision.transforms
+from torchvision.transforms import v2
 
 import trackio
 
@@ -45,6 +42,7 @@ from transformers import (
     DefaultDataCollator,
     HfArgumentParser,
     Trainer,
+    TrainerCallback,
     TrainingArguments,
 )
 from transformers.trainer import EvalPrediction
@@ -88,6 +86,20 @@ class DataTrainingArguments:
         default="label",
         metadata={"help": "The column name for labels in the dataset."},
     )
+    image_cache_dir: str | None = field(
+        default=None,
+        metadata={
+            "help": "Decode and downscale images once into memory-mapped shards under this directory, "
+            "reused across epochs and runs. Disabled by default."
+        },
+    )
+    auto_dataloader: bool = field(
+        default=True,
+        metadata={
+            "help": "Size dataloader workers, prefetch and pinning from the measured per-sample transform cost. "
+            "Skipped when --dataloader_num_workers is passed, including 0."
+        },
+    )
 
 
 @dataclass
@@ -126,8 +138,90 @@ class ModelArguments:
     )
 
 
-def build_transforms(image_processor, is_training: bool):
-    """Build torchvision transforms from the image processor's config."""
+SHARD_INDEX_COLUMN = "shard_index"
+
+
+class ImageShardCache:
+    """
+    Decoded RGB images stored once as uint8 in a memory-mapped file, with their offsets and shapes
+    in a side index. Reads are zero-copy, copy-on-write HWC views, so epochs skip the decode and resize.
+    `scales` holds each image's (x, y) factor from its original size to the cached one.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        index = np.load(os.path.join(path, "index.npz"))
+        self.offsets, self.shapes, self.scales = index["offsets"], index["shapes"], index["scales"]
+        self._pixels = None
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        if self._pixels is None:
+            self._pixels = np.memmap(os.path.join(self.path, "pixels.u8"), dtype=np.uint8, mode="c")
+        height, width = self.shapes[i]
+        return self._pixels[self.offsets[i] : self.offsets[i] + height * width * 3].reshape(height, width, 3)
+
+    def __getstate__(self):
+        # Dataloader workers map the file themselves
+        return {**self.__dict__, "_pixels": None}
+
+    @classmethod
+    def build(cls, dataset, path: str, image_col="image", max_size=None, shortest_edge=None, batch_size=256):
+        """
+        Decode every image of `dataset` once, downscale it so its longest side fits `max_size` (or its
+        shortest side fits `shortest_edge`), and write the pixels under `path`. Reuses a finished cache.
+        """
+        if not os.path.exists(os.path.join(path, "index.npz")):
+            os.makedirs(path, exist_ok=True)
+            offsets, shapes, scales = [], [], []
+            offset = 0
+            with open(os.path.join(path, "pixels.u8"), "wb") as f:
+                for batch in dataset.select_columns([image_col]).iter(batch_size=batch_size):
+                    for image in batch[image_col]:
+                        image = image.convert("RGB")
+                        width, height = image.size
+                        if max_size is not None:
+                            scale = min(1.0, max_size / max(width, height))
+                        else:
+                            scale = min(1.0, shortest_edge / min(width, height))
+                        if scale < 1.0:
+                            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+                            image = image.resize(size, PIL.Image.BILINEAR)
+                        pixels = np.asarray(image)
+                        f.write(pixels.tobytes())
+                        offsets.append(offset)
+                        shapes.append(pixels.shape[:2])
+                        scales.append((pixels.shape[1] / width, pixels.shape[0] / height))
+                        offset += pixels.nbytes
+            # Written last, so an interrupted build is redone instead of reused
+            with open(os.path.join(path, "index.tmp.npz"), "wb") as f:
+                np.savez(
+                    f,
+                    offsets=np.array(offsets, dtype=np.int64),
+                    shapes=np.array(shapes, dtype=np.int64).reshape(-1, 2),
+                    scales=np.array(scales, dtype=np.float64).reshape(-1, 2),
+                )
+            os.replace(os.path.join(path, "index.tmp.npz"), os.path.join(path, "index.npz"))
+            logger.info(f"Cached {len(offsets)} images ({offset / 2**30:.2f} GiB) in {path}")
+        return cls(path)
+
+
+def cache_images(dataset, cache_dir: str, image_col="image", max_size=None, shortest_edge=None):
+    """
+    Build (or reuse) the shard cache of a split and swap its image column for a `shard_index` column,
+    so transforms read pixels from the cache and datasets never decodes the images again.
+    """
+    budget = f"max{max_size}" if max_size is not None else f"short{shortest_edge}"
+    path = os.path.join(cache_dir, f"{dataset._fingerprint}-{budget}")
+    cache = ImageShardCache.build(dataset, path, image_col, max_size=max_size, shortest_edge=shortest_edge)
+    dataset = dataset.remove_columns([image_col]).add_column(SHARD_INDEX_COLUMN, np.arange(len(dataset)))
+    return dataset, cache
+
+
+def processor_image_size(image_processor) -> int | tuple[int, int]:
+    """Model input size from the image processor's config."""
     if hasattr(image_processor, "size"):
         size = image_processor.size
         if "shortest_edge" in size:
@@ -138,17 +232,28 @@ def build_transforms(image_processor, is_training: bool):
             img_size = 224
     else:
         img_size = 224
+    return img_size
+
+
+def build_transforms(image_processor, is_training: bool, tensor_input: bool = False):
+    """
+    Build torchvision transforms from the image processor's config. With `tensor_input` the pipeline
+    takes uint8 CHW tensors (zero-copy views of the image cache) and runs the v2 tensor kernels.
+    """
+    img_size = processor_image_size(image_processor)
+    T = v2 if tensor_input else torchvision.transforms
+    to_float = v2.ToDtype(torch.float32, scale=True) if tensor_input else T.ToTensor()
 
     if hasattr(image_processor, "image_mean") and image_processor.image_mean:
-        normalize = Normalize(mean=image_processor.image_mean, std=image_processor.image_std)
+        normalize = T.Normalize(mean=image_processor.image_mean, std=image_processor.image_std)
     else:
-        normalize = Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+        normalize = T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
 
     if is_training:
-        return Compose([
-            RandomResizedCrop(img_size),
-            RandomHorizontalFlip(),
-            ToTensor(),
+        return T.Compose([
+            T.RandomResizedCrop(img_size),
+            T.RandomHorizontalFlip(),
+            to_float,
             normalize,
         ])
     else:
@@ -156,14 +261,107 @@ def build_transforms(image_processor, is_training: bool):
             resize_size = int(img_size / 0.875)  # standard 87.5% center crop ratio
         else:
             resize_size = tuple(int(s / 0.875) for s in img_size)
-        return Compose([
-            Resize(resize_size),
-            CenterCrop(img_size),
-            ToTensor(),
+        return T.Compose([
+            T.Resize(resize_size),
+            T.CenterCrop(img_size),
+            to_float,
             normalize,
         ])
 
 
+DATALOADER_TARGET_BATCH_SECONDS = 0.1
+DATALOADER_MIN_BATCH_SECONDS = 0.01
+
+
+def dataloader_workers_passed() -> bool:
+    """Whether --dataloader_num_workers was given on the command line or in the JSON config, even as 0."""
+    if len(sys.argv) == 2 and sys.argv[1].endswith(".json"):
+        with open(sys.argv[1]) as f:
+            return "dataloader_num_workers" in json.load(f)
+    # HfArgumentParser accepts both --dataloader_num_workers and --dataloader-num-workers
+    return any(arg.split("=")[0].replace("-", "_") == "__dataloader_num_workers" for arg in sys.argv[1:])
+
+
+def configure_dataloader(training_args: TrainingArguments, dataset, collate_fn, num_samples: int = 16) -> None:
+    """
+    Size the dataloader to the host from the measured transform cost of a few training samples:
+    enough workers to produce a batch every DATALOADER_TARGET_BATCH_SECONDS, capped by the CPUs
+    available to this process. Leaves the settings alone when workers were set explicitly.
+    """
+    if dataloader_workers_passed() or dataset is None or len(dataset) == 0:
+        return
+    rng = np.random.default_rng(training_args.seed)
+    indices = rng.choice(len(dataset), size=min(num_samples, len(dataset)), replace=False)
+    sample_seconds = []
+    samples = []
+    for i in indices:
+        start = time.perf_counter()
+        samples.append(dataset[int(i)])
+        sample_seconds.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    collate_fn(samples)
+    per_sample = float(np.mean(sample_seconds)) + (time.perf_counter() - start) / len(samples)
+    batch_seconds = per_sample * training_args.per_device_train_batch_size
+
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    budget = max(0, cpus // int(os.environ.get("LOCAL_WORLD_SIZE", 1)) - 1)
+    needed = math.ceil(batch_seconds / DATALOADER_TARGET_BATCH_SECONDS)
+    workers = min(needed, budget) if batch_seconds >= DATALOADER_MIN_BATCH_SECONDS else 0
+
+    training_args.dataloader_num_workers = workers
+    if workers:
+        training_args.dataloader_persistent_workers = True
+        if training_args.dataloader_prefetch_factor is None:
+            # Deeper queue when some samples are much slower than the typical one
+            straggling = max(sample_seconds) > 4 * float(np.median(sample_seconds))
+            training_args.dataloader_prefetch_factor = 4 if straggling else 2
+    if not torch.cuda.is_available():
+        training_args.dataloader_pin_memory = False
+    logger.info(
+        f"Dataloader: {per_sample * 1000:.1f} ms/sample, {batch_seconds:.2f} s/batch → {workers} workers "
+        f"(of {budget} spare CPUs), prefetch_factor={training_args.dataloader_prefetch_factor}, "
+        f"persistent_workers={training_args.dataloader_persistent_workers}, "
+        f"pin_memory={training_args.dataloader_pin_memory}"
+    )
+    if needed > budget:
+        logger.warning(
+            f"Data loading needs ~{needed} workers to keep up but only {budget} CPUs are spare; "
+            "expect the accelerator to wait on augmentation"
+        )
+
+
+class DataLoaderStarvationCallback(TrainerCallback):
+    """Log per epoch the share of training step time spent waiting for the next batch."""
+
+    def on_epoch_begin(self, args, state, control, **kwargs):
+        self.waiting = self.computing = 0.0
+        self.mark = time.perf_counter()
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        now = time.perf_counter()
+        self.waiting += now - self.mark
+        self.mark = now
+
+    def on_step_end(self, args, state, control, **kwargs):
+        now = time.perf_counter()
+        self.computing += now - self.mark
+        self.mark = now
+
+    def _skip(self, args, state, control, **kwargs):
+        # Logging, checkpointing and evaluation run between steps but are not data loading
+        self.mark = time.perf_counter()
+
+    on_log = on_save = on_evaluate = _skip
+
+    def on_epoch_end(self, args, state, control, **kwargs):
+        total = self.waiting + self.computing
+        if not total:
+            return
+        starved = self.waiting / total
+        log = logger.warning if starved > 0.2 else logger.info
+        log(f"Epoch {state.epoch:.0f}: accelerator starved for data {starved:.0%} of step time")
+
+
 def main():
     parser = HfArgumentParser((ModelArguments, DataTrainingArguments, TrainingArguments))
     if len(sys.argv) == 2 and sys.argv[1].endswith(".json"):
@@ -300,28 +498,46 @@ def main():
     )
 
     # --- Build transforms ---
-    train_transforms = build_transforms(image_processor, is_training=True)
-    val_transforms = build_transforms(image_processor, is_training=False)
+    # Cached images come out as uint8 arrays; feed them to tensor transforms instead of copying into PIL
+    tensor_input = data_args.image_cache_dir is not None
+    train_transforms = build_transforms(image_processor, is_training=True, tensor_input=tensor_input)
+    val_transforms = build_transforms(image_processor, is_training=False, tensor_input=tensor_input)
 
     image_col = data_args.image_column_name
 
+    image_caches = {}
+    if data_args.image_cache_dir is not None:
+        # Keep the shortest side at the evaluation resize (input size / 0.875); only the random crops run per epoch
+        shortest_edge = math.ceil(max(np.atleast_1d(processor_image_size(image_processor))) / 0.875)
+        # The main process builds the shards first; the others then reuse them instead of rewriting the files
+        with training_args.main_process_first(desc="image shard cache"):
+            for split_name in list(dataset.keys()):
+                dataset[split_name], image_caches[split_name] = cache_images(
+                    dataset[split_name], data_args.image_cache_dir, image_col=image_col, shortest_edge=shortest_edge
+                )
+
+    def load_images(examples, split_name):
+        if split_name not in image_caches:
+            return [img.convert("RGB") for img in examples[image_col]]
+        return [torch.from_numpy(image_caches[split_name][i]).permute(2, 0, 1) for i in examples[SHARD_INDEX_COLUMN]]
+
     def preprocess_train(examples):
         return {
-            "pixel_values": [train_transforms(img.convert("RGB")) for img in examples[image_col]],
+            "pixel_values": [train_transforms(img) for img in load_images(examples, "train")],
             "labels": examples[label_col],
         }
 
-    def preprocess_val(examples):
+    def preprocess_val(examples, split_name):
         return {
-            "pixel_values": [val_transforms(img.convert("RGB")) for img in examples[image_col]],
+            "pixel_values": [val_transforms(img) for img in load_images(examples, split_name)],
             "labels": examples[label_col],
         }
 
     dataset["train"].set_transform(preprocess_train)
     if "validation" in dataset:
-        dataset["validation"].set_transform(preprocess_val)
+        dataset["validation"].set_transform(partial(preprocess_val, split_name="validation"))
     if "test" in dataset:
-        dataset["test"].set_transform(preprocess_val)
+        dataset["test"].set_transform(partial(preprocess_val, split_name="test"))
 
     # --- Metrics ---
     accuracy_metric = evaluate.load("accuracy")
@@ -338,14 +554,19 @@ def main():
         elif "test" in dataset:
             eval_dataset = dataset["test"]
 
+    data_collator = DefaultDataCollator()
+    if data_args.auto_dataloader and training_args.do_train:
+        configure_dataloader(training_args, dataset["train"], data_collator)
+
     trainer = Trainer(
         model=model,
         args=training_args,
         train_dataset=dataset["train"] if training_args.do_train else None,
         eval_dataset=eval_dataset,
         processing_class=image_processor,
-        data_collator=DefaultDataCollator(),
+        data_collator=data_collator,
         compute_metrics=compute_metrics,
+        callbacks=[DataLoaderStarvationCallback()],
     )
 
     # --- Train ---
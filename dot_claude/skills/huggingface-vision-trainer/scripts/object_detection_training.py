@@ -14,10 +14,14 @@
 
 """Finetuning any 🤗 Transformers model supported by AutoModelForObjectDetection for object detection leveraging the Trainer API."""
 
+import io
+import json
 import logging
 import math
 import os
+import struct
 import sys
+import time
 from collections.abc import Mapping
 from dataclasses import dataclass, field
 from functools import partial
@@ -25,8 +29,12 @@ from typing import Any
 
 import albumentations as A
 import numpy as np
+import PIL.Image
+import pyarrow as pa
+import pyarrow.compute as pc
 import torch
 from datasets import load_dataset
+from datasets.fingerprint import Hasher
 from torchmetrics.detection.mean_ap import MeanAveragePrecision
 
 import trackio
@@ -38,6 +46,7 @@ from transformers import (
     AutoModelForObjectDetection,
     HfArgumentParser,
     Trainer,
+    TrainerCallback,
     TrainingArguments,
 )
 from transformers.image_processing_utils import BatchFeature
@@ -96,120 +105,417 @@ def format_image_annotations_as_coco(
     }
 
 
-def detect_bbox_format_from_samples(dataset, image_col="image", objects_col="objects", num_samples=50):
+def bbox_format_votes(boxes: np.ndarray, image_sizes: np.ndarray, slack: float = 1.05) -> dict:
     """
-    Detect whether bboxes are xyxy (Pascal VOC) or xywh (COCO) by checking
-    bbox coordinates against image dimensions. The correct format interpretation
-    should keep bboxes within image bounds.
+    Vectorized bbox format evidence over (N, 4) boxes and the (N, 2) (width, height) of each box's image.
+
+    A box votes xywh when its 3rd/4th value is below its 1st/2nd (impossible for xyxy) or when only the
+    xyxy reading overshoots the image, and votes xyxy when only the xywh reading does. `not_cxcywh` counts
+    boxes whose center reading would put an edge below zero.
     """
-    exceeds_if_xywh = 0
-    exceeds_if_xyxy = 0
-    total = 0
+    a, b, c, d = boxes.T
+    img_w, img_h = image_sizes.T
+    not_xyxy = (c < a) | (d < b)
+    xywh_exceeds = (a + c > img_w * slack) | (b + d > img_h * slack)
+    xyxy_exceeds = (c > img_w * slack) | (d > img_h * slack)
+    return {
+        "boxes": len(boxes),
+        "normalized": bool(len(boxes)) and bool(((boxes >= 0) & (boxes <= 1)).all()),
+        "xyxy": int((~not_xyxy & xywh_exceeds & ~xyxy_exceeds).sum()),
+        "xywh": int((not_xyxy | (xyxy_exceeds & ~xywh_exceeds)).sum()),
+        "xywh_exceeds": int(xywh_exceeds.sum()),
+        "not_cxcywh": int(((a - c / 2 < -0.01 * img_w) | (b - d / 2 < -0.01 * img_h)).sum()),
+    }
+
+
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+HEADER_PROBE_BYTES = 64 * 1024
+EXIF_ORIENTATION_TAG = 0x0112
+# Orientations 5-8 rotate by 90/270 degrees, so the decoded image has width and height swapped
+EXIF_TRANSPOSED_ORIENTATIONS = frozenset({5, 6, 7, 8})
+
+
+def exif_orientation(tiff: bytes) -> int:
+    """Orientation tag from the IFD0 of raw EXIF (TIFF) bytes; 1 (upright) when absent or unreadable."""
+    if len(tiff) < 8 or tiff[:4] not in (b"II*\x00", b"MM\x00*"):
+        return 1
+    order = "<" if tiff[:2] == b"II" else ">"
+    ifd = struct.unpack(order + "I", tiff[4:8])[0]
+    if ifd + 2 > len(tiff):
+        return 1
+    for k in range(struct.unpack(order + "H", tiff[ifd : ifd + 2])[0]):
+        entry = tiff[ifd + 2 + 12 * k : ifd + 14 + 12 * k]
+        if len(entry) < 12:
+            break
+        if struct.unpack(order + "H", entry[:2])[0] == EXIF_ORIENTATION_TAG:
+            return struct.unpack(order + "H", entry[8:10])[0]
+    return 1
+
 
-    for example in dataset.select(range(min(num_samples, len(dataset)))):
-        img_w, img_h = example[image_col].size
-        for bbox in example[objects_col]["bbox"]:
-            if len(bbox) != 4:
+def probe_image_size(data: bytes) -> tuple[int, int] | None:
+    """
+    Displayed width/height parsed from PNG, JPEG or WebP header bytes, with the EXIF Orientation applied the
+    way `datasets` decoding does (`exif_transpose`). None for other formats, truncated headers, or EXIF the
+    header walk cannot reach (WebP keeps it after the image data).
+    """
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and data[12:16] == b"IHDR":
+        if len(data) < 24:
+            return None
+        width, height = struct.unpack(">II", data[16:24])
+        # eXIf, when present, precedes the image data
+        i = 8
+        while i + 8 <= len(data):
+            length, chunk = struct.unpack(">I", data[i : i + 4])[0], data[i + 4 : i + 8]
+            if chunk == b"IDAT":
+                return width, height
+            if chunk == b"eXIf":
+                if i + 8 + length > len(data):
+                    return None
+                if exif_orientation(data[i + 8 : i + 8 + length]) in EXIF_TRANSPOSED_ORIENTATIONS:
+                    return height, width
+                return width, height
+            i += 12 + length
+        return None
+    if data[:2] == b"\xff\xd8":
+        # Walk the marker segments until the start-of-frame, which holds the dimensions;
+        # an APP1 Exif segment before it may carry the orientation
+        orientation = 1
+        i = 2
+        while i + 9 <= len(data):
+            if data[i] != 0xFF:
+                return None
+            marker = data[i + 1]
+            if marker == 0xFF:
+                i += 1
                 continue
-            a, b, c, d = float(bbox[0]), float(bbox[1]), float(bbox[2]), float(bbox[3])
-            total += 1
-
-            # If 3rd < 1st or 4th < 2nd, can't be xyxy (x_max must exceed x_min)
-            if c < a or d < b:
-                return "xywh"
-
-            # xywh: right/bottom edge = origin + size; exceeding image → wrong format
-            if a + c > img_w * 1.05:
-                exceeds_if_xywh += 1
-            if b + d > img_h * 1.05:
-                exceeds_if_xywh += 1
-            # xyxy: right/bottom edge = coordinate itself
-            if c > img_w * 1.05:
-                exceeds_if_xyxy += 1
-            if d > img_h * 1.05:
-                exceeds_if_xyxy += 1
-
-    if total == 0:
-        return "xywh"
+            if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+                i += 2
+                continue
+            if marker in JPEG_SOF_MARKERS:
+                height, width = struct.unpack(">HH", data[i + 5 : i + 9])
+                return (height, width) if orientation in EXIF_TRANSPOSED_ORIENTATIONS else (width, height)
+            length = struct.unpack(">H", data[i + 2 : i + 4])[0]
+            if marker == 0xE1 and data[i + 4 : i + 10] == b"Exif\x00\x00":
+                orientation = exif_orientation(data[i + 10 : i + 2 + length])
+            i += 2 + length
+        return None
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP" and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b"VP8 " and data[23:26] == b"\x9d\x01\x2a":
+            width, height = struct.unpack("<HH", data[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L" and data[20] == 0x2F:
+            bits = int.from_bytes(data[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            if data[20] & 0x08:
+                return None
+            return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+    return None
+
+
+def encoded_image_sizes(images: pa.Array) -> np.ndarray:
+    """
+    (N, 2) float width/height of undecoded `Image` cells, as displayed after EXIF orientation; NaN for null
+    cells and for bytes PIL cannot identify, so sanitize drops those rows. Sizes are parsed from the header
+    bytes; formats the probe does not know fall back to PIL, which also stops at the header.
+    """
+    sizes = np.full((len(images), 2), np.nan)
+    for i, image in enumerate(images.to_pylist()):
+        if image is None or not (image.get("bytes") or image.get("path")):
+            continue
+        data = image.get("bytes")
+        if not data:
+            with open(image["path"], "rb") as f:
+                data = f.read(HEADER_PROBE_BYTES)
+        size = probe_image_size(data)
+        if size is None:
+            source = io.BytesIO(image["bytes"]) if image.get("bytes") else image["path"]
+            try:
+                with PIL.Image.open(source) as img:
+                    size = img.size
+                    # PIL's TIFF plugin already reports the oriented size
+                    if img.format != "TIFF" and img.getexif().get(EXIF_ORIENTATION_TAG) in EXIF_TRANSPOSED_ORIENTATIONS:
+                        size = size[::-1]
+            except Exception as e:  # PIL raises assorted errors on corrupt or truncated headers
+                logger.warning(f"Unreadable image header ({e!r}); its row will be dropped")
+                continue
+        sizes[i] = size
+    return sizes
 
-    fmt = "xyxy" if exceeds_if_xywh > exceeds_if_xyxy else "xywh"
-    logger.info(
-        f"Detected bbox format: {fmt} (checked {total} bboxes from {min(num_samples, len(dataset))} images)"
+
+def _image_size_batch(table: pa.Table, image_col: str) -> pa.Table:
+    sizes = encoded_image_sizes(table.column(image_col).combine_chunks())
+    # Null images get null sizes, which fail every bounds check so sanitize drops their rows
+    missing = np.isnan(sizes[:, 0])
+    sizes = np.nan_to_num(sizes).astype(np.int64)
+    return table.append_column("width", pa.array(sizes[:, 0], mask=missing)).append_column(
+        "height", pa.array(sizes[:, 1], mask=missing)
     )
-    return fmt
 
 
-def sanitize_dataset(dataset, bbox_format="xywh", image_col="image", objects_col="objects"):
+def _restore_format(dataset, original_format: dict, original_columns: list[str]):
+    # `format["columns"]` lists every column when none were selected; keep that as "all" so new columns show up
+    columns = original_format["columns"]
+    return dataset.with_format(
+        original_format["type"],
+        columns=None if columns == original_columns else columns,
+        output_all_columns=original_format["output_all_columns"],
+        **original_format["format_kwargs"],
+    )
+
+
+def add_image_sizes(dataset, image_col="image", num_proc=None, batch_size=1000):
     """
-    Validate bboxes, convert xyxy→xywh if needed, clip to image bounds, and remove
-    entries with non-finite values, non-positive dimensions, or degenerate area (<1 px).
-    Drops images with no remaining valid bboxes.
+    Add `width`/`height` columns read from the encoded image headers, without decoding any pixels.
+    The map result lands in the datasets cache, so later runs reuse it. No-op if both columns exist.
     """
-    convert_xyxy = bbox_format == "xyxy"
+    if "width" in dataset.column_names and "height" in dataset.column_names:
+        return dataset
+    original_format, original_columns = dataset.format, dataset.column_names
+    dataset = dataset.with_format("arrow").map(
+        partial(_image_size_batch, image_col=image_col),
+        batched=True,
+        batch_size=batch_size,
+        num_proc=num_proc,
+        desc="Reading image sizes",
+    )
+    return _restore_format(dataset, original_format, original_columns)
 
-    def _validate(example):
-        img_w, img_h = example[image_col].size
-        objects = example[objects_col]
-        bboxes = objects["bbox"]
-        n = len(bboxes)
 
-        valid_indices = []
-        converted_bboxes = []
+def sample_boxes(dataset, image_col="image", objects_col="objects", num_samples=1000):
+    """
+    Return all 4-value boxes of the first `num_samples` images as an (N, 4) array, with the (N, 2) image size
+    of each box. Boxes are read straight from the Arrow column; sizes come from `width`/`height` columns when
+    present, otherwise from the image headers.
+    """
+    subset = dataset.select(range(min(num_samples, len(dataset))))
+    table = subset.with_format("arrow")[:]
+    bbox = pc.struct_field(table.column(objects_col).combine_chunks(), "bbox")
+    per_image = pc.list_value_length(bbox).fill_null(0).to_numpy(zero_copy_only=False)
+    inner = pc.list_flatten(bbox)
+    lengths = pc.list_value_length(inner).fill_null(0).to_numpy(zero_copy_only=False)
+    values = pc.list_flatten(inner).to_numpy(zero_copy_only=False).astype(np.float64)
+    if (lengths == 4).all():
+        boxes = values.reshape(-1, 4)
+    else:
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        boxes = np.stack([values[starts[lengths == 4] + k] for k in range(4)], axis=1)
 
-        for i, bbox in enumerate(bboxes):
-            if len(bbox) != 4:
-                continue
-            vals = [float(v) for v in bbox]
-            if not all(math.isfinite(v) for v in vals):
-                continue
+    if "width" in subset.column_names and "height" in subset.column_names:
+        sizes = np.stack(
+            [table.column("width").to_numpy(zero_copy_only=False), table.column("height").to_numpy(zero_copy_only=False)],
+            axis=1,
+        )
+    else:
+        sizes = encoded_image_sizes(table.column(image_col).combine_chunks())
+    box_sizes = np.repeat(sizes.astype(np.float64), per_image, axis=0)[lengths == 4]
 
-            if convert_xyxy:
-                x_min, y_min, x_max, y_max = vals
-                w, h = x_max - x_min, y_max - y_min
-            else:
-                x_min, y_min, w, h = vals
+    finite = np.isfinite(boxes).all(axis=1)
+    return boxes[finite], box_sizes[finite], len(subset)
 
-            if w <= 0 or h <= 0:
-                continue
 
-            x_min, y_min = max(0.0, x_min), max(0.0, y_min)
-            if x_min >= img_w or y_min >= img_h:
-                continue
-            w = min(w, img_w - x_min)
-            h = min(h, img_h - y_min)
+def detect_bbox_format_from_samples(dataset, image_col="image", objects_col="objects", num_samples=1000):
+    """
+    Detect whether bboxes are xyxy (Pascal VOC) or xywh (COCO) by checking
+    bbox coordinates against image dimensions. The correct format interpretation
+    should keep bboxes within image bounds. All boxes of the sampled images vote at once.
+    """
+    boxes, box_sizes, num_images = sample_boxes(dataset, image_col, objects_col, num_samples)
+    if len(boxes) == 0:
+        return "xywh"
 
-            if w * h < 1.0:
-                continue
+    votes = bbox_format_votes(boxes, box_sizes)
+    fmt = "xyxy" if votes["xyxy"] > votes["xywh"] else "xywh"
+    decisive = votes["xyxy"] + votes["xywh"]
+    confidence = votes[fmt] / decisive if decisive else 0.0
+    logger.info(
+        f"Detected bbox format: {fmt} (confidence {confidence:.0%} from {decisive} deciding of {len(boxes)} bboxes "
+        f"in {num_images} images)"
+    )
+    if decisive and confidence < 0.9:
+        logger.warning(f"Bbox format is ambiguous ({votes}); verify it before training")
+    if votes["normalized"]:
+        logger.warning("Bboxes look normalized to [0, 1]; this script expects absolute pixel coordinates")
+    elif fmt == "xywh" and votes["xywh_exceeds"] and not votes["not_cxcywh"]:
+        logger.warning("Bboxes look like center format (cx, cy, w, h); convert them to xywh before training")
+    return fmt
 
-            valid_indices.append(i)
-            converted_bboxes.append([x_min, y_min, w, h])
 
-        # Rebuild objects dict, filtering all list-valued fields by valid_indices
-        new_objects = {}
-        for key, value in objects.items():
-            if key == "bbox":
-                new_objects["bbox"] = converted_bboxes
-            elif isinstance(value, list) and len(value) == n:
-                new_objects[key] = [value[j] for j in valid_indices]
-            else:
-                new_objects[key] = value
+BBOX_DROP_REASONS = ("malformed", "non_finite", "non_positive_size", "outside_image", "degenerate_area")
+# Per-row drop counts written by the sanitize map; they live in the cached table so reruns still report them
+DROP_COUNT_COLUMNS = {reason: f"_dropped_{reason}" for reason in BBOX_DROP_REASONS}
+DROPPED_IMAGE_COLUMN = "_dropped_image"
 
-        if "area" not in new_objects or len(new_objects.get("area", [])) != len(converted_bboxes):
-            new_objects["area"] = [b[2] * b[3] for b in converted_bboxes]
 
-        example[objects_col] = new_objects
-        return example
+def _rebuild_lists(counts: np.ndarray, values: pa.Array) -> pa.ListArray:
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int32)
+    return pa.ListArray.from_arrays(pa.array(offsets), values)
+
+
+def _sanitize_batch(
+    table: pa.Table, convert_xyxy: bool, image_col: str, objects_col: str, categories: pa.Array | None
+) -> pa.Table:
+    """
+    Vectorized sanitize of one Arrow batch: convert, clip and filter every box and remap category labels
+    to ids when `categories` is given. Rows are kept; per-row drop counts and an empty-image flag are
+    appended as columns for `sanitize_dataset` to sum and filter on.
+    """
+    objects = table.column(objects_col).combine_chunks()
+    bbox = pc.struct_field(objects, "bbox")
+    num_images = len(table)
+    per_image = pc.list_value_length(bbox).fill_null(0).to_numpy(zero_copy_only=False)
+    owner = pc.list_parent_indices(bbox).to_numpy()
+    inner = pc.list_flatten(bbox)
+    lengths = pc.list_value_length(inner).fill_null(0).to_numpy(zero_copy_only=False)
+    values = pc.list_flatten(inner).to_numpy(zero_copy_only=False).astype(np.float64)
+
+    # Gather well-formed boxes into an (M, 4) array; malformed rows stay NaN
+    well_formed = lengths == 4
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+    boxes = np.full((len(lengths), 4), np.nan)
+    boxes[well_formed] = values[starts[well_formed][:, None] + np.arange(4)]
+
+    if "width" in table.column_names and "height" in table.column_names:
+        sizes = np.stack(
+            [table.column("width").to_numpy(zero_copy_only=False), table.column("height").to_numpy(zero_copy_only=False)],
+            axis=1,
+        ).astype(np.float64)
+    else:
+        sizes = encoded_image_sizes(table.column(image_col).combine_chunks())
+    img_w, img_h = sizes[owner].T
+
+    with np.errstate(invalid="ignore"):
+        if convert_xyxy:
+            x_min, y_min, x_max, y_max = boxes.T
+            w, h = x_max - x_min, y_max - y_min
+        else:
+            x_min, y_min, w, h = boxes.T
+        finite = np.isfinite(boxes).all(axis=1)
+        positive = (w > 0) & (h > 0)
+        x_min, y_min = np.maximum(x_min, 0.0), np.maximum(y_min, 0.0)
+        inside = (x_min < img_w) & (y_min < img_h)
+        w, h = np.minimum(w, img_w - x_min), np.minimum(h, img_h - y_min)
+        large_enough = w * h >= 1.0
+
+    # Each dropped box is attributed to the first check it fails
+    drops = {"malformed": np.bincount(owner[~well_formed], minlength=num_images)}
+    keep = well_formed
+    for reason, passed in zip(BBOX_DROP_REASONS[1:], (finite, positive, inside, large_enough)):
+        drops[reason] = np.bincount(owner[keep & ~passed], minlength=num_images)
+        keep = keep & passed
+
+    kept_per_image = np.bincount(owner[keep], minlength=num_images)
+    kept_positions = pa.array(np.flatnonzero(keep))
+    converted = np.stack([x_min, y_min, w, h], axis=1)[keep]
+    new_bbox = _rebuild_lists(
+        kept_per_image,
+        _rebuild_lists(np.full(len(converted), 4), pa.array(converted.ravel())),
+    ).cast(bbox.type)
+
+    # Filter every per-box list field alongside the boxes
+    fields, arrays = [], []
+    filtered = set()
+    for struct_field in objects.type:
+        column = pc.struct_field(objects, struct_field.name)
+        if struct_field.name == "bbox":
+            column = new_bbox
+        elif pa.types.is_list(struct_field.type) and (pc.list_value_length(column).fill_null(0).to_numpy(zero_copy_only=False) == per_image).all():
+            column = _rebuild_lists(kept_per_image, pc.list_flatten(column).take(kept_positions)).cast(struct_field.type)
+            filtered.add(struct_field.name)
+        fields.append(struct_field)
+        arrays.append(column)
+    if "area" not in filtered:
+        area = _rebuild_lists(kept_per_image, pa.array(converted[:, 2] * converted[:, 3]))
+        if "area" in objects.type.names:
+            index = objects.type.get_field_index("area")
+            arrays[index] = area.cast(fields[index].type)
+        else:
+            fields.append(pa.field("area", area.type))
+            arrays.append(area)
+    if categories is not None and "category" in objects.type.names:
+        index = objects.type.get_field_index("category")
+        column = arrays[index]
+        if pa.types.is_list(column.type):
+            ids = pc.index_in(pc.list_flatten(column), value_set=categories).cast(pa.int64())
+            column = _rebuild_lists(pc.list_value_length(column).fill_null(0).to_numpy(zero_copy_only=False), ids)
+        else:
+            column = pc.index_in(column, value_set=categories).cast(pa.int64())
+        fields[index] = pa.field("category", column.type)
+        arrays[index] = column
+
+    new_objects = pa.StructArray.from_arrays(arrays, fields=fields)
+    table = table.set_column(table.column_names.index(objects_col), objects_col, new_objects)
+    for reason, column in DROP_COUNT_COLUMNS.items():
+        table = table.append_column(column, pa.array(drops[reason], pa.int32()))
+    return table.append_column(DROPPED_IMAGE_COLUMN, pa.array(kept_per_image == 0))
+
+
+def sanitize_dataset(
+    dataset,
+    bbox_format="xywh",
+    image_col="image",
+    objects_col="objects",
+    num_proc=None,
+    batch_size=1000,
+    categories=None,
+):
+    """
+    Validate bboxes, convert xyxy→xywh if needed, clip to image bounds, and remove
+    entries with non-finite values, non-positive dimensions, or degenerate area (<1 px).
+    Drops images with no remaining valid bboxes. If `categories` is given, category
+    labels are replaced by their index in it.
 
+    Runs as a single batched map over Arrow batches (no image decoding). The map emits
+    per-row drop counts, which are summed to log how many boxes were dropped for each
+    reason; empty images are then removed with an index selection, not a second pass.
+    """
     before = len(dataset)
-    dataset = dataset.map(_validate)
-    dataset = dataset.filter(lambda ex: len(ex[objects_col]["bbox"]) > 0)
+    original_format, original_columns = dataset.format, dataset.column_names
+    dataset = dataset.with_format("arrow").map(
+        partial(
+            _sanitize_batch,
+            convert_xyxy=bbox_format == "xyxy",
+            image_col=image_col,
+            objects_col=objects_col,
+            categories=None if categories is None else pa.array(categories),
+        ),
+        batched=True,
+        batch_size=batch_size,
+        num_proc=num_proc,
+        new_fingerprint=Hasher.hash(
+            [dataset._fingerprint, _sanitize_batch, bbox_format, image_col, objects_col, categories]
+        ),
+        desc="Sanitizing bboxes",
+    )
+    count_columns = [*DROP_COUNT_COLUMNS.values(), DROPPED_IMAGE_COLUMN]
+    counts = dataset.select_columns(count_columns).with_format("arrow")[:]
+    drops = {reason: pc.sum(counts.column(column)).as_py() or 0 for reason, column in DROP_COUNT_COLUMNS.items()}
+    kept_images = np.flatnonzero(~counts.column(DROPPED_IMAGE_COLUMN).to_numpy(zero_copy_only=False))
+    dataset = dataset.remove_columns(count_columns)
+    if len(kept_images) < len(dataset):
+        dataset = dataset.select(kept_images)
+    dataset = _restore_format(dataset, original_format, original_columns)
+
     after = len(dataset)
+    dropped_boxes = {reason: drops[reason] for reason in BBOX_DROP_REASONS if drops[reason]}
+    if dropped_boxes:
+        logger.warning(f"Dropped bboxes by reason: {dropped_boxes}")
     if before != after:
         logger.warning(f"Dropped {before - after}/{before} images with no valid bboxes after sanitization")
     logger.info(f"Bbox sanitization complete: {after} images with valid bboxes remain")
     return dataset
 
 
+def discover_categories(dataset, objects_col="objects") -> list:
+    """Unique `objects.category` values, read from that projected column alone so no image is touched."""
+    objects = dataset.select_columns([objects_col]).with_format("arrow")[:].column(objects_col).combine_chunks()
+    categories = pc.struct_field(objects, "category")
+    if pa.types.is_list(categories.type) or pa.types.is_large_list(categories.type):
+        categories = pc.list_flatten(categories)
+    return pc.unique(categories.drop_null()).to_pylist()
+
+
 def convert_bbox_yolo_to_pascal(boxes: torch.Tensor, image_size: tuple[int, int]) -> torch.Tensor:
     """
     Convert bounding boxes from YOLO format (x_center, y_center, width, height) in range [0, 1]
@@ -236,19 +542,115 @@ def convert_bbox_yolo_to_pascal(boxes: torch.Tensor, image_size: tuple[int, int]
     return boxes
 
 
+SHARD_INDEX_COLUMN = "shard_index"
+
+
+class ImageShardCache:
+    """
+    Decoded RGB images stored once as uint8 in a memory-mapped file, with their offsets and shapes
+    in a side index. Reads are zero-copy, copy-on-write views, so epochs skip the decode and resize.
+    `scales` holds each image's (x, y) resize factor for rescaling its annotations.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        index = np.load(os.path.join(path, "index.npz"))
+        self.offsets, self.shapes, self.scales = index["offsets"], index["shapes"], index["scales"]
+        self._pixels = None
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        if self._pixels is None:
+            self._pixels = np.memmap(os.path.join(self.path, "pixels.u8"), dtype=np.uint8, mode="c")
+        height, width = self.shapes[i]
+        return self._pixels[self.offsets[i] : self.offsets[i] + height * width * 3].reshape(height, width, 3)
+
+    def __getstate__(self):
+        # Dataloader workers map the file themselves
+        return {**self.__dict__, "_pixels": None}
+
+    @classmethod
+    def build(cls, dataset, path: str, image_col="image", max_size=None, shortest_edge=None, batch_size=256):
+        """
+        Decode every image of `dataset` once, downscale it so its longest side fits `max_size` (or its
+        shortest side fits `shortest_edge`), and write the pixels under `path`. Reuses a finished cache.
+        """
+        if not os.path.exists(os.path.join(path, "index.npz")):
+            os.makedirs(path, exist_ok=True)
+            offsets, shapes, scales = [], [], []
+            offset = 0
+            with open(os.path.join(path, "pixels.u8"), "wb") as f:
+                for batch in dataset.select_columns([image_col]).iter(batch_size=batch_size):
+                    for image in batch[image_col]:
+                        image = image.convert("RGB")
+                        width, height = image.size
+                        if max_size is not None:
+                            scale = min(1.0, max_size / max(width, height))
+                        else:
+                            scale = min(1.0, shortest_edge / min(width, height))
+                        if scale < 1.0:
+                            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+                            image = image.resize(size, PIL.Image.BILINEAR)
+                        pixels = np.asarray(image)
+                        f.write(pixels.tobytes())
+                        offsets.append(offset)
+                        shapes.append(pixels.shape[:2])
+                        scales.append((pixels.shape[1] / width, pixels.shape[0] / height))
+                        offset += pixels.nbytes
+            # Written last, so an interrupted build is redone instead of reused
+            with open(os.path.join(path, "index.tmp.npz"), "wb") as f:
+                np.savez(
+                    f,
+                    offsets=np.array(offsets, dtype=np.int64),
+                    shapes=np.array(shapes, dtype=np.int64).reshape(-1, 2),
+                    scales=np.array(scales, dtype=np.float64).reshape(-1, 2),
+                )
+            os.replace(os.path.join(path, "index.tmp.npz"), os.path.join(path, "index.npz"))
+            logger.info(f"Cached {len(offsets)} images ({offset / 2**30:.2f} GiB) in {path}")
+        return cls(path)
+
+
+def cache_images(dataset, cache_dir: str, image_col="image", max_size=None, shortest_edge=None):
+    """
+    Build (or reuse) the shard cache of a split and swap its image column for a `shard_index` column,
+    so transforms read pixels from the cache and datasets never decodes the images again.
+    """
+    budget = f"max{max_size}" if max_size is not None else f"short{shortest_edge}"
+    path = os.path.join(cache_dir, f"{dataset._fingerprint}-{budget}")
+    cache = ImageShardCache.build(dataset, path, image_col, max_size=max_size, shortest_edge=shortest_edge)
+    dataset = dataset.remove_columns([image_col]).add_column(SHARD_INDEX_COLUMN, np.arange(len(dataset)))
+    return dataset, cache
+
+
 def augment_and_transform_batch(
     examples: Mapping[str, Any],
     transform: A.Compose,
     image_processor: AutoImageProcessor,
     return_pixel_mask: bool = False,
+    image_cache: ImageShardCache | None = None,
 ) -> BatchFeature:
-    """Apply augmentations and format annotations in COCO format for object detection task"""
+    """
+    Apply augmentations and format annotations in COCO format for object detection task.
+    With `image_cache`, pixels come from the cache and bboxes are rescaled to the cached size.
+    """
 
     images = []
     annotations = []
-    image_ids = examples["image_id"] if "image_id" in examples else range(len(examples["image"]))
-    for image_id, image, objects in zip(image_ids, examples["image"], examples["objects"]):
-        image = np.array(image.convert("RGB"))
+    image_ids = examples["image_id"] if "image_id" in examples else range(len(examples["objects"]))
+    for k, (image_id, objects) in enumerate(zip(image_ids, examples["objects"])):
+        if image_cache is None:
+            image = np.array(examples["image"][k].convert("RGB"))
+        else:
+            index = examples[SHARD_INDEX_COLUMN][k]
+            image = image_cache[index]
+            scale_x, scale_y = image_cache.scales[index]
+            objects = {
+                **objects,
+                "bbox": [[b[0] * scale_x, b[1] * scale_y, b[2] * scale_x, b[3] * scale_y] for b in objects["bbox"]],
+                "area": [a * scale_x * scale_y for a in objects["area"]],
+            }
 
         # Filter invalid bboxes before augmentation (safety net after sanitize_dataset)
         bboxes = objects["bbox"]
@@ -293,81 +695,92 @@ def collate_fn(batch: list[BatchFeature]) -> Mapping[str, torch.Tensor | list[An
     return data
 
 
-@torch.no_grad()
-def compute_metrics(
-    evaluation_results: EvalPrediction,
-    image_processor: AutoImageProcessor,
-    threshold: float = 0.0,
-    id2label: Mapping[int, str] | None = None,
-) -> Mapping[str, float]:
+class StreamingDetectionMetrics:
     """
-    Compute mean average mAP, mAR and their variants for the object detection task.
+    Mean average precision, recall and their variants for the object detection task, accumulated per eval batch.
+
+    Used with ``batch_eval_metrics``: each batch's logits are post-processed into boxes and fed to
+    ``MeanAveragePrecision.update`` as soon as the batch is predicted, so only the kept detections are held
+    until the end of evaluation, never the raw logits of the whole eval set.
 
     Args:
-        evaluation_results (EvalPrediction): Predictions and targets from evaluation.
+        image_processor (AutoImageProcessor): Processor used to post-process model outputs into boxes.
         threshold (float, optional): Threshold to filter predicted boxes by confidence. Defaults to 0.0.
         id2label (Optional[dict], optional): Mapping from class id to class name. Defaults to None.
-
-    Returns:
-        Mapping[str, float]: Metrics in a form of dictionary {<metric_name>: <metric_value>}
     """
 
-    predictions, targets = evaluation_results.predictions, evaluation_results.label_ids
-
-    # For metric computation we need to provide:
-    #  - targets in a form of list of dictionaries with keys "boxes", "labels"
-    #  - predictions in a form of list of dictionaries with keys "boxes", "scores", "labels"
-
-    image_sizes = []
-    post_processed_targets = []
-    post_processed_predictions = []
-
-    # Collect targets in the required format for metric computation
-    for batch in targets:
-        # collect image sizes, we will need them for predictions post processing
-        batch_image_sizes = torch.tensor([x["orig_size"] for x in batch])
-        image_sizes.append(batch_image_sizes)
-        # collect targets in the required format for metric computation
-        # boxes were converted to YOLO format needed for model training
-        # here we will convert them to Pascal VOC format (x_min, y_min, x_max, y_max)
-        for image_target in batch:
-            boxes = torch.tensor(image_target["boxes"])
+    def __init__(
+        self,
+        image_processor: AutoImageProcessor,
+        threshold: float = 0.0,
+        id2label: Mapping[int, str] | None = None,
+    ):
+        self.image_processor = image_processor
+        self.threshold = threshold
+        self.id2label = id2label
+        self.metric = MeanAveragePrecision(box_format="xyxy", class_metrics=True)
+
+    @torch.no_grad()
+    def update(self, predictions, targets) -> None:
+        """Post-process one eval batch and add it to the running mAP state."""
+        # For metric computation we need to provide:
+        #  - targets in a form of list of dictionaries with keys "boxes", "labels"
+        #  - predictions in a form of list of dictionaries with keys "boxes", "scores", "labels"
+
+        # Boxes were converted to YOLO format needed for model training,
+        # here we convert them back to Pascal VOC format (x_min, y_min, x_max, y_max)
+        post_processed_targets = []
+        for image_target in targets:
+            boxes = torch.as_tensor(image_target["boxes"]).cpu()
             boxes = convert_bbox_yolo_to_pascal(boxes, image_target["orig_size"])
-            labels = torch.tensor(image_target["class_labels"])
+            labels = torch.as_tensor(image_target["class_labels"]).cpu()
             post_processed_targets.append({"boxes": boxes, "labels": labels})
 
-    # Collect predictions in the required format for metric computation,
-    # model produce boxes in YOLO format, then image_processor convert them to Pascal VOC format
-    for batch, target_sizes in zip(predictions, image_sizes):
-        batch_logits, batch_boxes = batch[1], batch[2]
-        output = ModelOutput(logits=torch.tensor(batch_logits), pred_boxes=torch.tensor(batch_boxes))
-        post_processed_output = image_processor.post_process_object_detection(
-            output, threshold=threshold, target_sizes=target_sizes
+        # Model produces boxes in YOLO format, image_processor converts them to Pascal VOC format.
+        # Post-processing stays on the eval device; only the kept detections move to the host.
+        batch_logits, batch_boxes = torch.as_tensor(predictions[1]), torch.as_tensor(predictions[2])
+        target_sizes = torch.stack([torch.as_tensor(x["orig_size"]) for x in targets]).to(batch_boxes.device)
+        output = ModelOutput(logits=batch_logits, pred_boxes=batch_boxes)
+        post_processed_predictions = self.image_processor.post_process_object_detection(
+            output, threshold=self.threshold, target_sizes=target_sizes
         )
-        post_processed_predictions.extend(post_processed_output)
-
-    # Compute metrics
-    metric = MeanAveragePrecision(box_format="xyxy", class_metrics=True)
-    metric.update(post_processed_predictions, post_processed_targets)
-    metrics = metric.compute()
-
-    # Replace list of per class metrics with separate metric for each class
-    classes = metrics.pop("classes")
-    map_per_class = metrics.pop("map_per_class")
-    mar_100_per_class = metrics.pop("mar_100_per_class")
-    # Single-class datasets return 0-d scalar tensors; make them iterable
-    if classes.dim() == 0:
-        classes = classes.unsqueeze(0)
-        map_per_class = map_per_class.unsqueeze(0)
-        mar_100_per_class = mar_100_per_class.unsqueeze(0)
-    for class_id, class_map, class_mar in zip(classes, map_per_class, mar_100_per_class):
-        class_name = id2label[class_id.item()] if id2label is not None else class_id.item()
-        metrics[f"map_{class_name}"] = class_map
-        metrics[f"mar_100_{class_name}"] = class_mar
-
-    metrics = {k: round(v.item(), 4) for k, v in metrics.items()}
-
-    return metrics
+        post_processed_predictions = [{k: v.cpu() for k, v in x.items()} for x in post_processed_predictions]
+
+        self.metric.update(post_processed_predictions, post_processed_targets)
+
+    def compute(self) -> Mapping[str, float]:
+        """Compute metrics over every batch seen since the last call and reset the state."""
+        metrics = self.metric.compute()
+        self.metric.reset()
+
+        # Replace list of per class metrics with separate metric for each class
+        classes = metrics.pop("classes")
+        map_per_class = metrics.pop("map_per_class")
+        mar_100_per_class = metrics.pop("mar_100_per_class")
+        # Single-class datasets return 0-d scalar tensors; make them iterable
+        if classes.dim() == 0:
+            classes = classes.unsqueeze(0)
+            map_per_class = map_per_class.unsqueeze(0)
+            mar_100_per_class = mar_100_per_class.unsqueeze(0)
+        for class_id, class_map, class_mar in zip(classes, map_per_class, mar_100_per_class):
+            class_name = self.id2label[class_id.item()] if self.id2label is not None else class_id.item()
+            metrics[f"map_{class_name}"] = class_map
+            metrics[f"mar_100_{class_name}"] = class_mar
+
+        return {k: round(v.item(), 4) for k, v in metrics.items()}
+
+    def __call__(self, evaluation_results: EvalPrediction, compute_result: bool = True) -> Mapping[str, float]:
+        """
+        Trainer entry point. With ``batch_eval_metrics`` each call holds one batch and ``compute_result`` marks
+        the last one; without it, the single call holds every batch (``eval_do_concat_batches=False``).
+        """
+        predictions, targets = evaluation_results.predictions, evaluation_results.label_ids
+        if isinstance(targets, (list, tuple)) and targets and isinstance(targets[0], Mapping):
+            self.update(predictions, targets)
+        else:
+            for batch_predictions, batch_targets in zip(predictions, targets):
+                self.update(batch_predictions, batch_targets)
+        return self.compute() if compute_result else {}
 
 
 @dataclass
@@ -416,6 +829,24 @@ class DataTrainingArguments:
         default=True,
         metadata={"help": "Use a fast torchvision-base image processor if it is supported for a given model."},
     )
+    preprocessing_num_workers: int | None = field(
+        default=None,
+        metadata={"help": "The number of processes to use for bbox sanitization."},
+    )
+    image_cache_dir: str | None = field(
+        default=None,
+        metadata={
+            "help": "Decode and downscale images once into memory-mapped shards under this directory, "
+            "reused across epochs and runs. Disabled by default."
+        },
+    )
+    auto_dataloader: bool = field(
+        default=True,
+        metadata={
+            "help": "Size dataloader workers, prefetch and pinning from the measured per-sample transform cost. "
+            "Skipped when --dataloader_num_workers is passed, including 0."
+        },
+    )
 
 
 @dataclass
@@ -466,6 +897,99 @@ class ModelArguments:
     )
 
 
+DATALOADER_TARGET_BATCH_SECONDS = 0.1
+DATALOADER_MIN_BATCH_SECONDS = 0.01
+
+
+def dataloader_workers_passed() -> bool:
+    """Whether --dataloader_num_workers was given on the command line or in the JSON config, even as 0."""
+    if len(sys.argv) == 2 and sys.argv[1].endswith(".json"):
+        with open(sys.argv[1]) as f:
+            return "dataloader_num_workers" in json.load(f)
+    # HfArgumentParser accepts both --dataloader_num_workers and --dataloader-num-workers
+    return any(arg.split("=")[0].replace("-", "_") == "__dataloader_num_workers" for arg in sys.argv[1:])
+
+
+def configure_dataloader(training_args: TrainingArguments, dataset, collate_fn, num_samples: int = 16) -> None:
+    """
+    Size the dataloader to the host from the measured transform cost of a few training samples:
+    enough workers to produce a batch every DATALOADER_TARGET_BATCH_SECONDS, capped by the CPUs
+    available to this process. Leaves the settings alone when workers were set explicitly.
+    """
+    if dataloader_workers_passed() or dataset is None or len(dataset) == 0:
+        return
+    rng = np.random.default_rng(training_args.seed)
+    indices = rng.choice(len(dataset), size=min(num_samples, len(dataset)), replace=False)
+    sample_seconds = []
+    samples = []
+    for i in indices:
+        start = time.perf_counter()
+        samples.append(dataset[int(i)])
+        sample_seconds.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    collate_fn(samples)
+    per_sample = float(np.mean(sample_seconds)) + (time.perf_counter() - start) / len(samples)
+    batch_seconds = per_sample * training_args.per_device_train_batch_size
+
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    budget = max(0, cpus // int(os.environ.get("LOCAL_WORLD_SIZE", 1)) - 1)
+    needed = math.ceil(batch_seconds / DATALOADER_TARGET_BATCH_SECONDS)
+    workers = min(needed, budget) if batch_seconds >= DATALOADER_MIN_BATCH_SECONDS else 0
+
+    training_args.dataloader_num_workers = workers
+    if workers:
+        training_args.dataloader_persistent_workers = True
+        if training_args.dataloader_prefetch_factor is None:
+            # Deeper queue when some samples are much slower than the typical one
+            straggling = max(sample_seconds) > 4 * float(np.median(sample_seconds))
+            training_args.dataloader_prefetch_factor = 4 if straggling else 2
+    if not torch.cuda.is_available():
+        training_args.dataloader_pin_memory = False
+    logger.info(
+        f"Dataloader: {per_sample * 1000:.1f} ms/sample, {batch_seconds:.2f} s/batch → {workers} workers "
+        f"(of {budget} spare CPUs), prefetch_factor={training_args.dataloader_prefetch_factor}, "
+        f"persistent_workers={training_args.dataloader_persistent_workers}, "
+        f"pin_memory={training_args.dataloader_pin_memory}"
+    )
+    if needed > budget:
+        logger.warning(
+            f"Data loading needs ~{needed} workers to keep up but only {budget} CPUs are spare; "
+            "expect the accelerator to wait on augmentation"
+        )
+
+
+class DataLoaderStarvationCallback(TrainerCallback):
+    """Log per epoch the share of training step time spent waiting for the next batch."""
+
+    def on_epoch_begin(self, args, state, control, **kwargs):
+        self.waiting = self.computing = 0.0
+        self.mark = time.perf_counter()
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        now = time.perf_counter()
+        self.waiting += now - self.mark
+        self.mark = now
+
+    def on_step_end(self, args, state, control, **kwargs):
+        now = time.perf_counter()
+        self.computing += now - self.mark
+        self.mark = now
+
+    def _skip(self, args, state, control, **kwargs):
+        # Logging, checkpointing and evaluation run between steps but are not data loading
+        self.mark = time.perf_counter()
+
+    on_log = on_save = on_evaluate = _skip
+
+    def on_epoch_end(self, args, state, control, **kwargs):
+        total = self.waiting + self.computing
+        if not total:
+            return
+        starved = self.waiting / total
+        log = logger.warning if starved > 0.2 else logger.info
+        log(f"Epoch {state.epoch:.0f}: accelerator starved for data {starved:.0%} of step time")
+
+
 def main():
     parser = HfArgumentParser((ModelArguments, DataTrainingArguments, TrainingArguments))
     if len(sys.argv) == 2 and sys.argv[1].endswith(".json"):
@@ -514,27 +1038,11 @@ def main():
         data_args.dataset_name, cache_dir=model_args.cache_dir, trust_remote_code=model_args.trust_remote_code
     )
 
-    bbox_format = detect_bbox_format_from_samples(dataset["train"])
-    if bbox_format == "xyxy":
-        logger.info("Converting bboxes from xyxy (Pascal VOC) → xywh (COCO) format across all splits")
     for split_name in list(dataset.keys()):
-        dataset[split_name] = sanitize_dataset(dataset[split_name], bbox_format=bbox_format)
-
-    for split_name in list(dataset.keys()):
-        if "image_id" not in dataset[split_name].column_names:
-            dataset[split_name] = dataset[split_name].add_column(
-                "image_id", list(range(len(dataset[split_name])))
-            )
-
-    dataset["train"] = dataset["train"].shuffle(seed=training_args.seed)
-
-    data_args.train_val_split = None if "validation" in dataset else data_args.train_val_split
-    if isinstance(data_args.train_val_split, float) and data_args.train_val_split > 0.0:
-        split = dataset["train"].train_test_split(data_args.train_val_split, seed=training_args.seed)
-        dataset["train"] = split["train"]
-        dataset["validation"] = split["test"]
+        dataset[split_name] = add_image_sizes(dataset[split_name], num_proc=data_args.preprocessing_num_workers)
 
     categories = None
+    remap_categories = None
     try:
         if isinstance(dataset["train"].features["objects"], dict):
             cat_feature = dataset["train"].features["objects"]["category"].feature
@@ -547,42 +1055,51 @@ def main():
         pass
 
     if categories is None:
-        # Category is a Value type (not ClassLabel) — scan dataset to discover labels
-        logger.info("Category feature is not ClassLabel — scanning dataset to discover category labels...")
+        # Category is a Value type (not ClassLabel) — scan the category column of every split to discover labels
+        logger.info("Category feature is not ClassLabel — scanning category columns to discover labels...")
         unique_cats = set()
-        for example in dataset["train"]:
-            cats = example["objects"]["category"]
-            if isinstance(cats, list):
-                unique_cats.update(cats)
-            else:
-                unique_cats.add(cats)
+        for split_name in list(dataset.keys()):
+            unique_cats.update(discover_categories(dataset[split_name]))
 
         if all(isinstance(c, int) for c in unique_cats):
             max_cat = max(unique_cats)
             categories = [f"class_{i}" for i in range(max_cat + 1)]
         elif all(isinstance(c, str) for c in unique_cats):
             categories = sorted(unique_cats)
+            remap_categories = categories
         else:
             categories = [str(c) for c in sorted(unique_cats, key=str)]
         logger.info(f"Discovered {len(categories)} categories: {categories}")
 
     id2label = dict(enumerate(categories))
     label2id = {v: k for k, v in id2label.items()}
+    if remap_categories is not None:
+        logger.info(f"Remapping string categories to integer IDs during sanitization: {label2id}")
 
-    # Remap string categories to integer IDs if needed
-    sample_cats = dataset["train"][0]["objects"]["category"]
-    if sample_cats and isinstance(sample_cats[0], str):
-        logger.info(f"Remapping string categories to integer IDs: {label2id}")
+    bbox_format = detect_bbox_format_from_samples(dataset["train"])
+    if bbox_format == "xyxy":
+        logger.info("Converting bboxes from xyxy (Pascal VOC) → xywh (COCO) format across all splits")
+    for split_name in list(dataset.keys()):
+        dataset[split_name] = sanitize_dataset(
+            dataset[split_name],
+            bbox_format=bbox_format,
+            num_proc=data_args.preprocessing_num_workers,
+            categories=remap_categories,
+        )
 
-        def _remap_categories(example):
-            objects = example["objects"]
-            objects["category"] = [label2id[c] for c in objects["category"]]
-            example["objects"] = objects
-            return example
+    for split_name in list(dataset.keys()):
+        if "image_id" not in dataset[split_name].column_names:
+            dataset[split_name] = dataset[split_name].add_column(
+                "image_id", list(range(len(dataset[split_name])))
+            )
 
-        for split_name in list(dataset.keys()):
-            dataset[split_name] = dataset[split_name].map(_remap_categories)
-        logger.info("Category remapping complete")
+    dataset["train"] = dataset["train"].shuffle(seed=training_args.seed)
+
+    data_args.train_val_split = None if "validation" in dataset else data_args.train_val_split
+    if isinstance(data_args.train_val_split, float) and data_args.train_val_split > 0.0:
+        split = dataset["train"].train_test_split(data_args.train_val_split, seed=training_args.seed)
+        dataset["train"] = split["train"]
+        dataset["validation"] = split["test"]
 
     if data_args.max_train_samples is not None:
         max_train = min(data_args.max_train_samples, len(dataset["train"]))
@@ -651,22 +1168,36 @@ def main():
         bbox_params=A.BboxParams(format="coco", label_fields=["category"], clip=True),
     )
 
-    train_transform_batch = partial(
-        augment_and_transform_batch, transform=train_augment_and_transform, image_processor=image_processor
-    )
-    validation_transform_batch = partial(
-        augment_and_transform_batch, transform=validation_transform, image_processor=image_processor
-    )
+    image_caches = {}
+    if data_args.image_cache_dir is not None:
+        # Train keeps its shortest side at image_square_size, so the SmallestMaxSize before the random crop
+        # is a no-op instead of upsampling a shrunk image; eval images are only ever fitted into the square.
+        # The main process builds the shards first; the others then reuse them instead of rewriting the files.
+        with training_args.main_process_first(desc="image shard cache"):
+            for split_name in list(dataset.keys()):
+                budget = "shortest_edge" if split_name == "train" else "max_size"
+                dataset[split_name], image_caches[split_name] = cache_images(
+                    dataset[split_name], data_args.image_cache_dir, **{budget: data_args.image_square_size}
+                )
 
-    dataset["train"] = dataset["train"].with_transform(train_transform_batch)
-    dataset["validation"] = dataset["validation"].with_transform(validation_transform_batch)
-    if "test" in dataset:
-        dataset["test"] = dataset["test"].with_transform(validation_transform_batch)
+    for split_name in list(dataset.keys()):
+        transform = train_augment_and_transform if split_name == "train" else validation_transform
+        dataset[split_name] = dataset[split_name].with_transform(
+            partial(
+                augment_and_transform_batch,
+                transform=transform,
+                image_processor=image_processor,
+                image_cache=image_caches.get(split_name),
+            )
+        )
 
 
-    eval_compute_metrics_fn = partial(
-        compute_metrics, image_processor=image_processor, id2label=id2label, threshold=0.0
-    )
+    # Update mAP batch by batch instead of holding every eval logit until the end of evaluation
+    training_args.batch_eval_metrics = True
+    eval_compute_metrics_fn = StreamingDetectionMetrics(image_processor, threshold=0.0, id2label=id2label)
+
+    if data_args.auto_dataloader and training_args.do_train:
+        configure_dataloader(training_args, dataset["train"], collate_fn)
 
     trainer = Trainer(
         model=model,
@@ -676,6 +1207,7 @@ def main():
         processing_class=image_processor,
         data_collator=collate_fn,
         compute_metrics=eval_compute_metrics_fn,
+        callbacks=[DataLoaderStarvationCallback()],
     )
 
     # Training
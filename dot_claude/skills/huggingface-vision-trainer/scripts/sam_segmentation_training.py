@@ -17,6 +17,8 @@ import logging
 import math
 import os
 import sys
+import time
+from collections.abc import Mapping
 from dataclasses import dataclass, field
 from typing import Any
 
@@ -24,6 +26,7 @@ import numpy as np
 import torch
 import torch.nn.functional as F
 from datasets import load_dataset
+from datasets.fingerprint import Hasher
 from torch.utils.data import Dataset
 
 import monai
@@ -33,8 +36,10 @@ import transformers
 from transformers import (
     HfArgumentParser,
     Trainer,
+    TrainerCallback,
     TrainingArguments,
 )
+from transformers.trainer import EvalPrediction
 from transformers.utils import check_min_version
 
 logger = logging.getLogger(__name__)
@@ -65,6 +70,13 @@ class SAMSegmentationDataset(Dataset):
         self.prompt_col = prompt_col
         self.bbox_col = bbox_col
         self.point_col = point_col
+        self.embedding_cache = None
+
+    def use_embedding_cache(self, cache: "EmbeddingCache"):
+        """Serve image embeddings and prompts from `cache`; only the label column is read per batch."""
+        self.embedding_cache = cache
+        label_col = PACKED_MASK_COLUMN if PACKED_MASK_COLUMN in self.dataset.column_names else self.mask_col
+        self.label_rows = self.dataset.select_columns([label_col])
 
     def __len__(self):
         return len(self.dataset)
@@ -83,62 +95,191 @@ class SAMSegmentationDataset(Dataset):
             return item[self.point_col]
         raise ValueError("Could not extract prompt from sample")
 
+    def _process(self, images, prompts):
+        """Run the processor once over a list of images and their prompts."""
+        if self.prompt_type == "bbox":
+            return self.processor(images, input_boxes=[[prompt] for prompt in prompts], return_tensors="pt")
+        prompts = [[prompt] if isinstance(prompt[0], (int, float)) else prompt for prompt in prompts]
+        return self.processor(images, input_points=[[prompt] for prompt in prompts], return_tensors="pt")
+
+    def _binary_mask(self, item):
+        if PACKED_MASK_COLUMN in item:
+            return unpack_mask(item[PACKED_MASK_COLUMN])
+        return binary_mask(item[self.mask_col])
+
     def __getitem__(self, idx):
+        if self.embedding_cache is not None:
+            inputs = self.embedding_cache.batch([idx])
+            inputs["labels"] = self._binary_mask(self.label_rows[idx])
+            inputs["original_image_size"] = inputs["original_image_size"][0]
+            return inputs
         item = self.dataset[idx]
         image = item[self.image_col]
-        prompt = self._extract_prompt(item)
-
-        if self.prompt_type == "bbox":
-            inputs = self.processor(image, input_boxes=[[prompt]], return_tensors="pt")
-        else:
-            if isinstance(prompt[0], (int, float)):
-                prompt = [prompt]
-            inputs = self.processor(image, input_points=[[prompt]], return_tensors="pt")
-
-        mask = np.array(item[self.mask_col])
-        if mask.ndim == 3:
-            mask = mask[:, :, 0]
-        inputs["labels"] = (mask > 0).astype(np.float32)
+        inputs = self._process([image], [self._extract_prompt(item)])
+        inputs["labels"] = self._binary_mask(item)
         inputs["original_image_size"] = torch.tensor(image.size[::-1])
         return inputs
 
+    def __getitems__(self, indices):
+        """Load a whole batch in one dataset read and one processor call; ``collate_fn`` passes it through."""
+        if self.embedding_cache is not None:
+            inputs = self.embedding_cache.batch(indices)
+            rows = self.label_rows[list(indices)]
+            items = [dict(zip(rows, values)) for values in zip(*rows.values())]
+            labels = resize_labels([self._binary_mask(item) for item in items])
+            return model_inputs(inputs, labels, inputs["original_image_size"])
+        rows = self.dataset[list(indices)]
+        items = [dict(zip(rows, values)) for values in zip(*rows.values())]
+        images = [item[self.image_col] for item in items]
+        inputs = self._process(images, [self._extract_prompt(item) for item in items])
+        labels = resize_labels([self._binary_mask(item) for item in items])
+        original_image_size = torch.tensor([image.size[::-1] for image in images])
+        return model_inputs(inputs, labels, original_image_size)
 
-def collate_fn(batch):
-    pixel_values = torch.cat([item["pixel_values"] for item in batch], dim=0)
-    original_sizes = torch.stack([item["original_sizes"] for item in batch])
-    original_image_size = torch.stack([item["original_image_size"] for item in batch])
 
-    has_boxes = "input_boxes" in batch[0]
-    has_points = "input_points" in batch[0]
+LABEL_SIZE = (256, 256)
+PACKED_MASK_COLUMN = "packed_mask"
+
 
-    labels = torch.cat(
-        [
-            F.interpolate(
-                torch.as_tensor(x["labels"]).unsqueeze(0).unsqueeze(0).float(),
-                size=(256, 256),
-                mode="nearest",
+def binary_mask(mask) -> np.ndarray:
+    mask = np.asarray(mask)
+    if mask.ndim == 3:
+        mask = mask[:, :, 0]
+    return (mask > 0).astype(np.uint8)
+
+
+def nearest_indices(in_size: int, out_size: int) -> np.ndarray:
+    """Source indices of `F.interpolate(mode="nearest")`, which computes them in float32."""
+    scale = np.float32(in_size) / np.float32(out_size)
+    return np.minimum(np.floor(np.arange(out_size, dtype=np.float32) * scale), in_size - 1).astype(np.intp)
+
+
+def resize_labels(masks) -> torch.Tensor:
+    """
+    Nearest-resize binary masks to (B, 1, *LABEL_SIZE). Nearest resizing is a gather, so each mask
+    only reads the LABEL_SIZE pixels it keeps; the index grids are built once per distinct input size.
+    """
+    labels = np.empty((len(masks), 1, *LABEL_SIZE), dtype=np.int64)
+    grids = {}
+    for i, mask in enumerate(masks):
+        if mask.shape == LABEL_SIZE:
+            labels[i, 0] = mask
+            continue
+        if mask.shape not in grids:
+            grids[mask.shape] = (
+                nearest_indices(mask.shape[0], LABEL_SIZE[0]),
+                nearest_indices(mask.shape[1], LABEL_SIZE[1]),
             )
-            for x in batch
-        ],
-        dim=0,
-    ).long()
+        rows, cols = grids[mask.shape]
+        labels[i, 0] = mask.take(rows, axis=0).take(cols, axis=1)
+    return torch.from_numpy(labels)
+
+
+def pack_masks(masks):
+    """Resize a batch of masks to LABEL_SIZE once and store them bit-packed (1/32 the size of float32)."""
+    labels = resize_labels([binary_mask(mask) for mask in masks]).numpy().astype(bool).reshape(len(masks), -1)
+    return {PACKED_MASK_COLUMN: [row.tobytes() for row in np.packbits(labels, axis=1)]}
+
+
+def unpack_mask(packed: bytes) -> np.ndarray:
+    return np.unpackbits(np.frombuffer(packed, dtype=np.uint8)).reshape(LABEL_SIZE)
 
+
+def model_inputs(inputs, labels, original_image_size):
+    """Keep the keys the model and loss need from batched processor outputs (or cached embeddings)."""
     result = {
-        "pixel_values": pixel_values,
-        "original_sizes": original_sizes,
+        "original_sizes": inputs["original_sizes"],
         "labels": labels,
         "original_image_size": original_image_size,
         "multimask_output": False,
     }
+    for key in ("pixel_values", "image_embeddings", "input_boxes", "input_points", "input_labels"):
+        if key in inputs:
+            result[key] = inputs[key]
+    return result
 
-    if has_boxes:
-        result["input_boxes"] = torch.cat([item["input_boxes"] for item in batch], dim=0)
-    if has_points:
-        result["input_points"] = torch.cat([item["input_points"] for item in batch], dim=0)
-        if "input_labels" in batch[0]:
-            result["input_labels"] = torch.cat([item["input_labels"] for item in batch], dim=0)
 
-    return result
+def collate_fn(batch):
+    if isinstance(batch, Mapping):
+        # Already batched by SAMSegmentationDataset.__getitems__
+        return batch
+    keys = [key for key in batch[0].keys() if key not in ("labels", "original_image_size")]
+    inputs = {key: torch.cat([item[key] for item in batch], dim=0) for key in keys}
+    labels = resize_labels([item["labels"] for item in batch])
+    original_image_size = torch.stack([item["original_image_size"] for item in batch])
+    return model_inputs(inputs, labels, original_image_size)
+
+
+# ---------------------------------------------------------------------------
+# Frozen vision-encoder embedding cache
+# ---------------------------------------------------------------------------
+
+class EmbeddingCache:
+    """Image embeddings of a frozen SAM vision encoder, computed once and memory-mapped as fp16.
+
+    The processed prompts and sizes of each sample are stored alongside, so
+    training reads neither images nor the processor and runs only the prompt
+    encoder and mask decoder.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.shape = tuple(json.load(f)["shape"])
+        self.prompts = torch.load(os.path.join(path, "prompts.pt"))
+        self._embeddings = None
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getstate__(self):
+        # Dataloader workers map the file themselves
+        return {**self.__dict__, "_embeddings": None}
+
+    @property
+    def embeddings(self) -> np.memmap:
+        if self._embeddings is None:
+            self._embeddings = np.memmap(
+                os.path.join(self.path, "embeddings.f16"), dtype=np.float16, mode="r", shape=self.shape
+            )
+        return self._embeddings
+
+    def batch(self, indices) -> dict[str, torch.Tensor]:
+        """Cached model inputs of ``indices``, without labels."""
+        indices = list(indices)
+        result = {"image_embeddings": torch.from_numpy(self.embeddings[indices].astype(np.float32))}
+        for key, values in self.prompts.items():
+            result[key] = torch.stack([values[i] for i in indices])
+        return result
+
+    @classmethod
+    @torch.no_grad()
+    def build(cls, model, dataset: SAMSegmentationDataset, path: str, batch_size: int):
+        """Embed every image of ``dataset`` with ``model``'s vision encoder; reuses a finished cache."""
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            os.makedirs(path, exist_ok=True)
+            device = next(model.parameters()).device
+            embeddings = None
+            prompts = {}
+            for start in range(0, len(dataset), batch_size):
+                inputs = dataset.__getitems__(range(start, min(start + batch_size, len(dataset))))
+                output = model.get_image_embeddings(inputs["pixel_values"].to(device))
+                if embeddings is None:
+                    shape = (len(dataset), *output.shape[1:])
+                    embeddings = np.memmap(
+                        os.path.join(path, "embeddings.f16"), dtype=np.float16, mode="w+", shape=shape
+                    )
+                embeddings[start : start + len(output)] = output.to(torch.float16).cpu().numpy()
+                for key, value in inputs.items():
+                    if isinstance(value, torch.Tensor) and key not in ("pixel_values", "labels"):
+                        prompts.setdefault(key, []).extend(value.unbind(0))
+            embeddings.flush()
+            torch.save(prompts, os.path.join(path, "prompts.pt"))
+            # Written last, so an interrupted build is redone instead of reused
+            with open(os.path.join(path, "meta.json"), "w") as f:
+                json.dump({"shape": list(shape)}, f)
+            logger.info(f"Cached {len(dataset)} image embeddings ({embeddings.nbytes / 2**30:.2f} GiB) in {path}")
+        return cls(path)
 
 
 # ---------------------------------------------------------------------------
@@ -153,6 +294,166 @@ def compute_loss(outputs, labels, num_items_in_batch=None):
     return seg_loss(predicted_masks, labels.float())
 
 
+# ---------------------------------------------------------------------------
+# Streaming evaluation metrics
+# ---------------------------------------------------------------------------
+
+class StreamingSegmentationMetrics:
+    """IoU, Dice and boundary F1 of thresholded ``pred_masks``, accumulated per eval batch.
+
+    Used with ``batch_eval_metrics``: each batch is reduced on its device to
+    per-metric sums, so eval memory does not grow with the eval set. Boundary
+    F1 matches mask boundaries within ``boundary_tolerance`` pixels.
+    """
+
+    def __init__(self, threshold: float = 0.0, boundary_tolerance: int = 2):
+        self.threshold = threshold
+        self.boundary_tolerance = boundary_tolerance
+        self.sums = None
+        self.count = 0
+
+    @staticmethod
+    def _boundary(mask: torch.Tensor) -> torch.Tensor:
+        eroded = -F.max_pool2d(-mask, kernel_size=3, stride=1, padding=1)
+        return mask - eroded
+
+    def _dilate(self, mask: torch.Tensor) -> torch.Tensor:
+        size = 2 * self.boundary_tolerance + 1
+        return F.max_pool2d(mask, kernel_size=size, stride=1, padding=self.boundary_tolerance)
+
+    @staticmethod
+    def _ratio(numerator: torch.Tensor, denominator: torch.Tensor) -> torch.Tensor:
+        # Empty prediction and empty target count as a perfect match
+        return torch.where(denominator > 0, numerator / denominator.clamp(min=1), torch.ones_like(numerator))
+
+    def __call__(self, eval_pred: EvalPrediction, compute_result: bool = False) -> dict[str, float]:
+        pred_masks = eval_pred.predictions[1] if isinstance(eval_pred.predictions, tuple) else eval_pred.predictions
+        labels = eval_pred.label_ids
+        pred = (pred_masks.squeeze(1) > self.threshold).float().flatten(0, 1).unsqueeze(1)
+        target = (labels > 0).float().flatten(0, 1).unsqueeze(1)
+
+        intersection = (pred * target).sum(dim=(1, 2, 3))
+        pred_area = pred.sum(dim=(1, 2, 3))
+        target_area = target.sum(dim=(1, 2, 3))
+        iou = self._ratio(intersection, pred_area + target_area - intersection)
+        dice = self._ratio(2 * intersection, pred_area + target_area)
+
+        pred_boundary, target_boundary = self._boundary(pred), self._boundary(target)
+        pred_boundary_area = pred_boundary.sum(dim=(1, 2, 3))
+        target_boundary_area = target_boundary.sum(dim=(1, 2, 3))
+        precision = self._ratio((pred_boundary * self._dilate(target_boundary)).sum(dim=(1, 2, 3)), pred_boundary_area)
+        recall = self._ratio((target_boundary * self._dilate(pred_boundary)).sum(dim=(1, 2, 3)), target_boundary_area)
+        # Disjoint boundaries (precision = recall = 0) score 0, not the empty-mask 1
+        boundary_f1 = 2 * precision * recall / (precision + recall).clamp(min=torch.finfo(precision.dtype).eps)
+
+        batch_sums = torch.stack([iou.sum(), dice.sum(), boundary_f1.sum()])
+        self.sums = batch_sums if self.sums is None else self.sums + batch_sums
+        self.count += len(iou)
+        if not compute_result:
+            return {}
+
+        means = (self.sums / max(self.count, 1)).tolist()
+        self.sums, self.count = None, 0
+        return {"iou": means[0], "dice": means[1], "boundary_f1": means[2]}
+
+
+# ---------------------------------------------------------------------------
+# Data loading
+# ---------------------------------------------------------------------------
+
+DATALOADER_TARGET_BATCH_SECONDS = 0.1
+DATALOADER_MIN_BATCH_SECONDS = 0.01
+
+
+def dataloader_workers_passed() -> bool:
+    """Whether --dataloader_num_workers was given on the command line or in the JSON config, even as 0."""
+    if len(sys.argv) == 2 and sys.argv[1].endswith(".json"):
+        with open(sys.argv[1]) as f:
+            return "dataloader_num_workers" in json.load(f)
+    # HfArgumentParser accepts both --dataloader_num_workers and --dataloader-num-workers
+    return any(arg.split("=")[0].replace("-", "_") == "__dataloader_num_workers" for arg in sys.argv[1:])
+
+
+def configure_dataloader(training_args: TrainingArguments, dataset, collate_fn, num_samples: int = 16) -> None:
+    """
+    Size the dataloader to the host from the measured transform cost of a few training samples:
+    enough workers to produce a batch every DATALOADER_TARGET_BATCH_SECONDS, capped by the CPUs
+    available to this process. Leaves the settings alone when workers were set explicitly.
+    """
+    if dataloader_workers_passed() or dataset is None or len(dataset) == 0:
+        return
+    rng = np.random.default_rng(training_args.seed)
+    indices = rng.choice(len(dataset), size=min(num_samples, len(dataset)), replace=False)
+    sample_seconds = []
+    samples = []
+    for i in indices:
+        start = time.perf_counter()
+        samples.append(dataset[int(i)])
+        sample_seconds.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    collate_fn(samples)
+    per_sample = float(np.mean(sample_seconds)) + (time.perf_counter() - start) / len(samples)
+    batch_seconds = per_sample * training_args.per_device_train_batch_size
+
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    budget = max(0, cpus // int(os.environ.get("LOCAL_WORLD_SIZE", 1)) - 1)
+    needed = math.ceil(batch_seconds / DATALOADER_TARGET_BATCH_SECONDS)
+    workers = min(needed, budget) if batch_seconds >= DATALOADER_MIN_BATCH_SECONDS else 0
+
+    training_args.dataloader_num_workers = workers
+    if workers:
+        training_args.dataloader_persistent_workers = True
+        if training_args.dataloader_prefetch_factor is None:
+            # Deeper queue when some samples are much slower than the typical one
+            straggling = max(sample_seconds) > 4 * float(np.median(sample_seconds))
+            training_args.dataloader_prefetch_factor = 4 if straggling else 2
+    if not torch.cuda.is_available():
+        training_args.dataloader_pin_memory = False
+    logger.info(
+        f"Dataloader: {per_sample * 1000:.1f} ms/sample, {batch_seconds:.2f} s/batch → {workers} workers "
+        f"(of {budget} spare CPUs), prefetch_factor={training_args.dataloader_prefetch_factor}, "
+        f"persistent_workers={training_args.dataloader_persistent_workers}, "
+        f"pin_memory={training_args.dataloader_pin_memory}"
+    )
+    if needed > budget:
+        logger.warning(
+            f"Data loading needs ~{needed} workers to keep up but only {budget} CPUs are spare; "
+            "expect the accelerator to wait on augmentation"
+        )
+
+
+class DataLoaderStarvationCallback(TrainerCallback):
+    """Log per epoch the share of training step time spent waiting for the next batch."""
+
+    def on_epoch_begin(self, args, state, control, **kwargs):
+        self.waiting = self.computing = 0.0
+        self.mark = time.perf_counter()
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        now = time.perf_counter()
+        self.waiting += now - self.mark
+        self.mark = now
+
+    def on_step_end(self, args, state, control, **kwargs):
+        now = time.perf_counter()
+        self.computing += now - self.mark
+        self.mark = now
+
+    def _skip(self, args, state, control, **kwargs):
+        # Logging, checkpointing and evaluation run between steps but are not data loading
+        self.mark = time.perf_counter()
+
+    on_log = on_save = on_evaluate = _skip
+
+    def on_epoch_end(self, args, state, control, **kwargs):
+        total = self.waiting + self.computing
+        if not total:
+            return
+        starved = self.waiting / total
+        log = logger.warning if starved > 0.2 else logger.info
+        log(f"Epoch {state.epoch:.0f}: accelerator starved for data {starved:.0%} of step time")
+
+
 # ---------------------------------------------------------------------------
 # CLI arguments
 # ---------------------------------------------------------------------------
@@ -203,6 +504,17 @@ class DataTrainingArguments:
         default="bbox",
         metadata={"help": "Prompt type: 'bbox' or 'point'."},
     )
+    pack_masks: bool = field(
+        default=True,
+        metadata={"help": "Resize masks to 256x256 once before training and store them bit-packed."},
+    )
+    auto_dataloader: bool = field(
+        default=True,
+        metadata={
+            "help": "Size dataloader workers, prefetch and pinning from the measured per-sample transform cost. "
+            "Skipped when --dataloader_num_workers is passed, including 0."
+        },
+    )
 
 
 @dataclass
@@ -223,6 +535,14 @@ class ModelArguments:
         default=True,
         metadata={"help": "Freeze prompt encoder weights."},
     )
+    embedding_cache_dir: str | None = field(
+        default=None,
+        metadata={
+            "help": "Compute the frozen vision encoder's image embeddings once and store them as fp16 under "
+            "this directory; training then runs only the prompt encoder and mask decoder. SAM only, "
+            "requires freeze_vision_encoder."
+        },
+    )
 
 
 # ---------------------------------------------------------------------------
@@ -326,6 +646,17 @@ def main():
     total = sum(p.numel() for p in model.parameters())
     logger.info(f"Trainable params: {trainable:,} / {total:,} ({100 * trainable / total:.1f}%)")
 
+    # ---- Resize label masks once ----
+    if data_args.pack_masks:
+        for split_name in list(dataset.keys()):
+            dataset[split_name] = dataset[split_name].map(
+                pack_masks,
+                batched=True,
+                input_columns=[data_args.mask_column_name],
+                remove_columns=[data_args.mask_column_name],
+                desc="Packing label masks",
+            )
+
     # ---- Build datasets ----
     prompt_col = data_args.prompt_column_name if data_args.prompt_column_name else None
     ds_kwargs = dict(
@@ -343,6 +674,42 @@ def main():
     if eval_key in dataset:
         eval_dataset = SAMSegmentationDataset(dataset=dataset[eval_key], **ds_kwargs)
 
+    if model_args.embedding_cache_dir is not None:
+        if is_sam2:
+            # SAM2 runs trainable mask-decoder convolutions on the encoder features before the decoder
+            logger.warning("embedding_cache_dir is not supported for SAM2 models; encoding images every step")
+        elif not model_args.freeze_vision_encoder:
+            logger.warning("embedding_cache_dir requires freeze_vision_encoder; encoding images every step")
+        else:
+            model.to(training_args.device).eval()
+            # The main process embeds first; the others reuse its files instead of truncating them with mode="w+"
+            with training_args.main_process_first(desc="embedding cache"):
+                for split_dataset in (train_dataset, eval_dataset):
+                    if split_dataset is None:
+                        continue
+                    key = Hasher.hash([
+                        split_dataset.dataset._fingerprint,
+                        model_args.model_name_or_path,
+                        model_args.model_revision,
+                        ds_kwargs,
+                    ])
+                    cache = EmbeddingCache.build(
+                        model,
+                        split_dataset,
+                        os.path.join(model_args.embedding_cache_dir, key),
+                        training_args.per_device_eval_batch_size,
+                    )
+                    split_dataset.use_embedding_cache(cache)
+
+    if data_args.auto_dataloader and training_args.do_train:
+        configure_dataloader(training_args, train_dataset, collate_fn)
+
+    # SamModel.forward takes `input_labels`, which Trainer would otherwise pick as the label key
+    if training_args.label_names is None:
+        training_args.label_names = ["labels"]
+    # Reduce each eval batch to metric sums instead of holding every predicted mask
+    training_args.batch_eval_metrics = True
+
     # ---- Train ----
     trainer = Trainer(
         model=model,
@@ -351,6 +718,8 @@ def main():
         eval_dataset=eval_dataset if training_args.do_eval else None,
         data_collator=collate_fn,
         compute_loss_func=compute_loss,
+        compute_metrics=StreamingSegmentationMetrics(),
+        callbacks=[DataLoaderStarvationCallback()],
     )
 
     if training_args.do_train: